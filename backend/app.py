@@ -5,21 +5,25 @@
 import os
 import multiprocessing  # Windows多进程兼容性必需
 
-if 'AI_INTRA_THREADS' not in os.environ:
-    os.environ['AI_INTRA_THREADS'] = '1'
-_ai_threads = os.environ.get('AI_INTRA_THREADS', '1')
-os.environ["OMP_NUM_THREADS"] = _ai_threads
-os.environ["MKL_NUM_THREADS"] = _ai_threads
-os.environ["OPENBLAS_NUM_THREADS"] = _ai_threads
-os.environ["VECLIB_MAXIMUM_THREADS"] = _ai_threads
-os.environ["NUMEXPR_NUM_THREADS"] = _ai_threads
+# 线程数统一来自 config (AI_INTRA_THREADS)，由推理调度器设置，与 feature_extractor 保持一致
+try:
+    from inference_scheduler import apply_thread_env
+except ImportError:
+    from .inference_scheduler import apply_thread_env
+apply_thread_env()
 os.environ.setdefault("NO_PROXY", "localhost,127.0.0.1")
 os.environ.setdefault("TORCH_CPP_LOG_LEVEL", "ERROR")
 os.environ.setdefault("TORCH_SHOW_CPP_STACKTRACES", "0")
 os.environ.setdefault("GLOG_minloglevel", "2")
 
-from flask import Flask, request, jsonify, Response, session
-import numpy as np
+try:
+    from boot_profile import boot_profile
+except ImportError:
+    from .boot_profile import boot_profile
+
+with boot_profile.phase('import_web'):
+    from flask import Flask, request, jsonify, Response, session
+    import numpy as np
 import logging
 import sys
 from datetime import datetime
@@ -39,16 +43,40 @@ try:
 except ImportError:
     print("ℹ️  python-dotenv未安装，使用系统环境变量")
 
+# 【启动优化】feature_extractor 会导入 torch/transformers/ultralytics，改为首次使用时再导入，
+# Web 进程只依赖轻量的 image_io，端口可以在几秒内打开，AI 在后台单独预热
 try:
-    from feature_extractor import get_feature_extractor, DINOv2FeatureExtractor
-except ImportError:
-    from .feature_extractor import get_feature_extractor, DINOv2FeatureExtractor
-try:
-    from database import db
-    from config import config
+    from image_io import load_image
+    from embedding_cache import get_embedding_cache
+    from color_index import get_color_index, compute_color_signature
+    from hybrid_rerank import get_hybrid_reranker
+    from phash_index import get_phash_index, compute_dhash
+    from inference_scheduler import get_inference_scheduler, inference_priority, BULK
+    from phrase_index import get_phrase_index
 except ImportError:
-    from .database import db
-    from .config import config
+    from .image_io import load_image
+    from .embedding_cache import get_embedding_cache
+    from .color_index import get_color_index, compute_color_signature
+    from .hybrid_rerank import get_hybrid_reranker
+    from .phash_index import get_phash_index, compute_dhash
+    from .inference_scheduler import get_inference_scheduler, inference_priority, BULK
+    from .phrase_index import get_phrase_index
+with boot_profile.phase('import_database'):
+    try:
+        from database import db
+        from config import config
+    except ImportError:
+        from .database import db
+        from .config import config
+
+
+def get_feature_extractor():
+    """延迟导入 feature_extractor 并返回其模块级单例"""
+    try:
+        from feature_extractor import get_feature_extractor as _get_feature_extractor
+    except ImportError:
+        from .feature_extractor import get_feature_extractor as _get_feature_extractor
+    return _get_feature_extractor()
 import requests
 import json
 from flask_cors import CORS
@@ -61,8 +89,6 @@ import uuid
 
 # === 全局状态变量 ===
 ai_model_ready = False  # AI模型是否已就绪
-# 全局 AI 并发控制（跨商品），避免 CPU 被同时推理任务打满
-GLOBAL_AI_SEMAPHORE = threading.Semaphore(4)
 
 # 在应用启动时从数据库加载系统配置
 def load_system_config():
@@ -145,6 +171,75 @@ def check_duplicate_image(new_features, existing_features_list, threshold=0.99):
 
     return False, 0.0
 
+def find_phash_match(loaded_image, product_id=None):
+    """用感知哈希查找已入库的近重复图片（在模型推理之前调用）
+
+    dHash 只看灰度结构，同款不同配色的图片哈希几乎相同，因此候选还必须与查询图的颜色签名一致
+    (相关系数 >= PHASH_MIN_COLOR_CORRELATION)，否则不复用向量、也不视为重复。
+
+    Returns:
+        (phash, match)。match 为 None 或
+        {'image_id', 'distance', 'same_product', 'features', 'color_signature', 'query_color_signature', 'crop'}，
+        同商品的匹配优先；phash 计算失败时返回 (None, None)
+    """
+    if not config.PHASH_ENABLED:
+        return None, None
+    try:
+        phash = compute_dhash(loaded_image.pil)
+    except Exception as e:
+        logger.debug(f"感知哈希计算失败: {e}")
+        return None, None
+
+    index = get_phash_index()
+    matches = index.query(phash, max_distance=config.PHASH_MAX_DISTANCE)[:8]
+    if not matches:
+        return phash, None
+
+    records = db.get_image_embedding_records([m['image_id'] for m in matches])
+    # 已删除的图片从索引中剔除，避免误判为重复
+    stale = [m['image_id'] for m in matches if m['image_id'] not in records]
+    if stale:
+        index.remove(stale)
+
+    valid = [m for m in matches if m['image_id'] in records]
+    if not valid:
+        return phash, None
+
+    # 颜色签名校验：排除灰度结构相同但配色不同的图片
+    try:
+        query_signature = compute_color_signature(loaded_image.bgr)
+    except Exception as e:
+        logger.debug(f"颜色签名计算失败，不复用近重复图片: {e}")
+        return phash, None
+    color_index = get_color_index()
+    signatures = []
+    for m in valid:
+        record = records[m['image_id']]
+        if record['color_signature'] is None:
+            record['color_signature'] = color_index.get(m['image_id'], record['image_path'])
+        signatures.append(record['color_signature'])
+    comparable = [(m, s) for m, s in zip(valid, signatures) if s is not None and s.shape == query_signature.shape]
+    if not comparable:
+        return phash, None
+    correlations = get_hybrid_reranker().color_correlations(query_signature, np.vstack([s for _, s in comparable]))
+    valid = [m for (m, _), corr in zip(comparable, correlations) if corr >= config.PHASH_MIN_COLOR_CORRELATION]
+    if not valid:
+        return phash, None
+    if product_id is not None:
+        valid.sort(key=lambda m: (records[m['image_id']]['product_id'] != product_id, m['distance']))
+
+    best = valid[0]
+    record = records[best['image_id']]
+    return phash, {
+        'image_id': best['image_id'],
+        'distance': best['distance'],
+        'same_product': product_id is not None and record['product_id'] == product_id,
+        'features': record['features'],
+        'color_signature': record['color_signature'],
+        'query_color_signature': query_signature,
+        'crop': record['crop']
+    }
+
 def process_and_save_image_core(product_id, image_url_or_file, index, existing_features=None, save_faiss_immediately=True):
     """
     核心图片处理单元：保存 -> 特征提取 -> 查重 -> 数据库 -> FAISS
@@ -192,10 +287,29 @@ def process_and_save_image_core(product_id, image_url_or_file, index, existing_f
             os.remove(save_path)
             return {'success': False, 'error': 'Feature extractor not initialized'}
 
-        features = extractor.extract_feature(save_path)
-        if features is None:
+        # 只读取/解码一次，特征和颜色签名共享
+        loaded_image = load_image(save_path)
+
+        # 先查感知哈希：近重复图片直接复用已有向量，不跑模型
+        phash, phash_match = find_phash_match(loaded_image, product_id)
+        if phash_match and phash_match['same_product'] and existing_features is not None:
             os.remove(save_path)
-            return {'success': False, 'error': 'Feature extraction failed'}
+            logger.info(f"🚫 图片与已入库图片近重复 (汉明距离: {phash_match['distance']})，已跳过: {filename}")
+            return {'success': True, 'skipped': True}
+
+        if phash_match:
+            features = phash_match['features']
+            crop = phash_match['crop']
+            color_signature = phash_match['query_color_signature']
+            logger.debug(f"♻️ 感知哈希命中图片 {phash_match['image_id']}，复用特征向量: {filename}")
+        else:
+            extracted = extractor.extract_feature_with_meta(loaded_image)
+            if extracted is None:
+                os.remove(save_path)
+                return {'success': False, 'error': 'Feature extraction failed'}
+            features = extracted['vector']
+            crop = extracted['crop']
+            color_signature = extractor.compute_color_signature(loaded_image)
 
         # 4. 查重逻辑 (99.5%相似度)
         if existing_features:
@@ -206,7 +320,9 @@ def process_and_save_image_core(product_id, image_url_or_file, index, existing_f
                 return {'success': True, 'skipped': True}  # 标记为成功但跳过，以免报错
 
         # 5. 入库 (SQLite)
-        img_db_id = db.insert_image_record(product_id, save_path, index, features)
+        img_db_id = db.insert_image_record(product_id, save_path, index, features, color_signature, crop, phash)
+        get_color_index().add(img_db_id, color_signature)
+        get_phash_index().add(img_db_id, phash, product_id)
 
         # 6. 入库 (FAISS)
         try:
@@ -262,8 +378,8 @@ def process_and_save_image_core(product_id, image_url_or_file, index, existing_f
 # load_system_config() 现在在 initialize_runtime() 中调用
 
 # === 重构：店铺抓取状态控制 ===
-# 移除全局状态变量，改为数据库持久化存储
-# scrape_status现在通过db.get_scrape_status()和db.update_scrape_status()管理
+# 抓取状态通过db.get_scrape_status()和db.update_scrape_status()管理（内存为准，定时合并落库）
+# 停止信号通过 scrape_stop_event 传递，抓取线程不再轮询数据库
 
 # 线程管理：跟踪当前运行的抓取线程
 current_scrape_thread = None
@@ -343,7 +459,9 @@ class QueueHandler(logging.Handler):
         whitelist_modules = [
             '__main__', 'app', 'database', 'bot',
             'weidian_scraper', 'feature_extractor',
-            'vector_engine', 'migrate_data'
+            'vector_engine', 'migrate_data', 'bot_state',
+            'boot_profile', 'embedding_cache', 'color_index', 'phash_index',
+            'inference_scheduler', 'phrase_index'
         ]
 
         if record.module in whitelist_modules:
@@ -361,8 +479,12 @@ class QueueHandler(logging.Handler):
 logger = logging.getLogger(__name__)
 
 # 机器人相关变量
-# [修改] 从 bot 模块导入列表，确保 app.py 和 bot.py 操作同一个列表对象
-from bot import bot_clients, bot_tasks, get_all_cooldowns
+# [修改] 从 bot_state 导入列表，确保 app.py 和 bot.py 操作同一个列表对象；
+# discord.py 只在真正启动机器人时才导入
+try:
+    from bot_state import bot_clients, bot_tasks, get_all_cooldowns
+except ImportError:
+    from .bot_state import bot_clients, bot_tasks, get_all_cooldowns
 bot_running = False  # 标记机器人是否正在运行
 
 # 全局特征提取器实例（在应用启动时创建）
@@ -383,8 +505,13 @@ def initialize_feature_extractor():
                         return None
                 print("🚀 初始化全局特征提取器实例...")
                 try:
-                    from feature_extractor import DINOv2FeatureExtractor
-                    feature_extractor_instance = DINOv2FeatureExtractor()
+                    with boot_profile.phase('import_ai_libs'):
+                        try:
+                            from feature_extractor import DINOv2FeatureExtractor
+                        except ImportError:
+                            from .feature_extractor import DINOv2FeatureExtractor
+                    with boot_profile.phase('load_ai_models'):
+                        feature_extractor_instance = DINOv2FeatureExtractor()
                     print("✅ 全局特征提取器实例初始化完成")
                 except Exception as e:
                     print(f"❌ 特征提取器初始化失败: {e}")
@@ -404,12 +531,6 @@ def get_global_feature_extractor():
 # 实际的初始化在 if __name__ == '__main__' 块中的预热阶段执行
 # initialize_feature_extractor()
 
-# 【新增】定义项目内的临时文件目录 (在 backend/data/tmp)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-TEMP_DIR = os.path.join(BASE_DIR, 'data', 'tmp')
-# 确保目录存在
-os.makedirs(TEMP_DIR, exist_ok=True)
-
 # Flask配置初始化（简化版 - 解决HTTP IP访问问题）
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
@@ -435,7 +556,8 @@ def initialize_runtime():
     print(f"🔧 [系统] 正在初始化运行时环境 (PID: {os.getpid()})...")
 
     # 1. 加载系统配置
-    load_system_config()
+    with boot_profile.phase('load_system_config'):
+        load_system_config()
 
     # 2. 配置日志系统
     root_logger = logging.getLogger()
@@ -465,19 +587,18 @@ def initialize_runtime():
 
     # 3. 重置数据库状态
     print("🧹 [系统] 正在重置抓取任务状态...")
-    try:
-        db.update_scrape_status(
-            is_scraping=False,
-            stop_signal=False,
-            message='系统重启，任务状态已重置'
-        )
-        # 重置所有Discord账号状态为离线
-        with db.get_connection() as conn:
-            conn.execute("UPDATE discord_accounts SET status = 'offline'")
-            conn.commit()
-        print("✅ [系统] 数据库状态已重置")
-    except Exception as e:
-        print(f"⚠️ [系统] 状态重置失败: {e}")
+    with boot_profile.phase('reset_db_state'):
+        try:
+            db.update_scrape_status(
+                is_scraping=False,
+                stop_signal=False,
+                message='系统重启，任务状态已重置'
+            )
+            # 重置所有Discord账号状态为离线
+            db.run_write(lambda cursor: cursor.execute("UPDATE discord_accounts SET status = 'offline'"))
+            print("✅ [系统] 数据库状态已重置")
+        except Exception as e:
+            print(f"⚠️ [系统] 状态重置失败: {e}")
 
     # 4. 【异步】预热AI模型（不阻塞Flask启动）
     import threading
@@ -485,9 +606,21 @@ def initialize_runtime():
         global ai_model_ready
         try:
             print("🤖 [后台] 正在预热AI模型...")
-            get_global_feature_extractor()
-            ai_model_ready = True
-            print("✅ [后台] AI模型预热完成，系统已就绪")
+            extractor = get_global_feature_extractor()
+            if extractor is not None:
+                # 真实跑一遍检测器和 DINOv2，首个请求不再承担惰性初始化开销
+                with boot_profile.phase('ai_warmup'):
+                    try:
+                        extractor.warmup()
+                    except Exception as warmup_error:
+                        print(f"⚠️ [后台] AI预热推理失败: {warmup_error}")
+            ai_model_ready = extractor is not None
+            if ai_model_ready:
+                boot_profile.mark('ai_ready')
+                print("✅ [后台] AI模型预热完成，系统已就绪")
+            else:
+                print("⚠️ [后台] AI模型初始化失败，将在首次请求时重试")
+            boot_profile.log_summary()
         except Exception as e:
             print(f"⚠️ [后台] AI预热失败: {e}")
             ai_model_ready = False
@@ -503,24 +636,90 @@ def initialize_runtime():
 
     print(f"✅ [系统] 运行时环境初始化完成")
 
-def extract_features(image_path):
-    """使用深度学习模型提取图像特征"""
+def _extract_with_embedding_cache(extractor, image_source, with_signature=False):
+    """先按内容哈希查持久化 embedding 缓存，未命中再跑 YOLO + DINOv2 并回写
+
+    Returns:
+        {'vector', 'crop', 'signature', 'cached'}，失败返回 None
+    """
+    loaded = load_image(image_source)
+    cache = get_embedding_cache()
+    model_key = extractor.model_version_key
+
+    if cache is not None:
+        entry = cache.get(loaded.content_hash, model_key)
+        if entry is not None and (entry['signature'] is not None or not with_signature):
+            entry['cached'] = True
+            return entry
+
+    # 内容哈希不同但感知上相同（重新压缩/缩放的转发图）时复用已入库图片的向量
+    _, phash_match = find_phash_match(loaded)
+    if phash_match:
+        result = {'vector': phash_match['features'], 'crop': phash_match['crop']}
+    else:
+        result = extractor.extract_feature_with_meta(loaded)
+    if result is None:
+        return None
+
+    signature = extractor.prepare_hybrid_query(loaded) if with_signature else None
+    if cache is not None:
+        cache.put(loaded.content_hash, model_key, result['vector'], result['crop'], signature)
+
+    return {'vector': result['vector'], 'crop': result['crop'], 'signature': signature, 'cached': phash_match is not None}
+
+
+def extract_features(image_source, with_signature=False):
+    """使用深度学习模型提取图像特征
+
+    image_source 可以是文件路径、图片字节或 load_image() 返回的已解码图片。
+    重复出现的图片（同一内容哈希）直接复用持久化缓存中的向量。
+    with_signature=True 时返回 (向量, 颜色签名)，供搜索重排序使用。
+    """
+    source_name = getattr(image_source, 'source_name', image_source if isinstance(image_source, str) else '<memory>')
     try:
         extractor = get_global_feature_extractor()
         if extractor is None:
             logger.error("特征提取器未初始化")
-            return None
-        features = extractor.extract_feature(image_path)
+            return (None, None) if with_signature else None
+
+        if isinstance(image_source, str) and not os.path.exists(image_source):
+            logger.error(f"文件不存在: {image_source}")
+            return (None, None) if with_signature else None
+
+        result = _extract_with_embedding_cache(extractor, image_source, with_signature)
         # 如果特征提取失败，返回 None（上层将处理并返回错误）
-        if features is None:
-            logger.warning(f"特征提取失败: {image_path}")
-            return None
+        if result is None:
+            logger.warning(f"特征提取失败: {source_name}")
+            return (None, None) if with_signature else None
+
+        if result['cached']:
+            logger.debug(f"命中 embedding 缓存: {source_name}")
 
-        return features
+        if with_signature:
+            return result['vector'], result['signature']
+        return result['vector']
 
     except Exception as e:
         logger.error(f"特征提取异常: {e}")
+        return (None, None) if with_signature else None
+
+def reembed_image_record(extractor, record):
+    """重新提取已入库图片的特征：优先复用入库时保存的裁剪框，不再运行 YOLO
+
+    旧数据没有裁剪信息时正常检测一次，并把结果写回数据库，下次重建即可复用。
+    重建属于批量任务，以批量优先级调度。
+    """
+    stored_crop = db.parse_image_crop(record)
+    if stored_crop is not None and stored_crop.get('policy') == 'center' and not extractor.adaptive_crop:
+        # 自适应裁剪已关闭：跳过 YOLO 的中心裁剪记录作废，重新检测并写回
+        stored_crop = None
+    with inference_priority(BULK):
+        result = extractor.extract_feature_with_meta(record['image_path'], crop=stored_crop)
+    if result is None:
         return None
+    if stored_crop is None and result.get('crop'):
+        db.update_image_crop(record['id'], result['crop'])
+    return result['vector']
 
 @app.route('/search_similar', methods=['POST'])
 def search_similar():
@@ -581,28 +780,25 @@ def search_similar():
                     if debug_enabled:
                         logger.debug(f"Warning - Content-Type '{content_type}' may not be an image")
 
-                temp_filename = f"{uuid.uuid4()}.jpg"
-                # 【修改】使用项目目录下的 TEMP_DIR
-                image_path = os.path.join(TEMP_DIR, temp_filename)
-
-                with open(image_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+                # 直接读入内存，不再落盘临时文件
+                max_bytes = 10 * 1024 * 1024  # 10MB limit
+                chunks = []
+                file_size = 0
+                for chunk in response.iter_content(chunk_size=8192):
+                    if chunk:
+                        chunks.append(chunk)
+                        file_size += len(chunk)
+                        if file_size > max_bytes:
+                            return jsonify({'error': 'Image file too large (max 10MB)'}), 400
+                image_bytes = b''.join(chunks)
+                history_path = image_url
 
-                # 检查文件大小
-                file_size = os.path.getsize(image_path)
                 if debug_enabled:
-                    logger.debug(f"Image downloaded to: {image_path}, size: {file_size} bytes")
+                    logger.debug(f"Image downloaded into memory, size: {file_size} bytes")
 
                 if file_size == 0:
-                    os.remove(image_path)
                     return jsonify({'error': 'Downloaded file is empty'}), 400
 
-                if file_size > 10 * 1024 * 1024:  # 10MB limit
-                    os.remove(image_path)
-                    return jsonify({'error': 'Image file too large (max 10MB)'}), 400
-
             except requests.exceptions.RequestException as e:
                 if debug_enabled:
                     logger.debug(f"Network error downloading image: {str(e)}")
@@ -618,45 +814,117 @@ def search_similar():
             if debug_enabled:
                 logger.debug(f"Found uploaded file: {image_file.filename if image_file else 'None'}")
 
-            temp_filename = f"{uuid.uuid4()}.jpg"
-            # 【修改】使用项目目录下的 TEMP_DIR
-            image_path = os.path.join(TEMP_DIR, temp_filename)
-            image_file.save(image_path)
+            image_bytes = image_file.read()
+            history_path = f"upload://{image_file.filename or uuid.uuid4()}"
+            if not image_bytes:
+                return jsonify({'error': 'Uploaded file is empty'}), 400
 
         else:
             if debug_enabled:
                 logger.debug("No image_url and no uploaded file")
             return jsonify({'error': 'No image provided (url or file)'}), 400
 
+        # 只解码一次：YOLO 裁剪、DINOv2 和颜色签名共享同一份内存图片
         try:
-            # 提取特征 (使用 DINOv2 + YOLOv8)
-            query_features = extract_features(image_path)
+            query_image = load_image(image_bytes)
+        except Exception as e:
+            return jsonify({'error': f'Invalid image data: {str(e)}'}), 400
 
-            if query_features is None:
-                return jsonify({'error': 'Feature extraction failed'}), 500
+        # 提取特征 (使用 DINOv2 + YOLOv8)，重复转发的图片直接命中 embedding 缓存
+        query_features, query_signature = extract_features(query_image, with_signature=True)
 
-            query_vec = np.array(query_features, dtype='float32')
-            q_norm = np.linalg.norm(query_vec)
-            if q_norm > 0:
-                query_vec = query_vec / q_norm
+        if query_features is None:
+            return jsonify({'error': 'Feature extraction failed'}), 500
 
-            # === 图片过滤规则匹配（基于上传图片） ===
-            blocked_filter_match = None
-            blocked_website_filter_matches = []
-            try:
-                image_filters = db.get_message_filters()
-                image_filters = [f for f in (image_filters or []) if f.get('filter_type') == 'image_filter']
-                if image_filters:
-                    best_match = None
-                    best_similarity = -1.0
-                    for filter_rule in image_filters:
+        query_vec = np.array(query_features, dtype='float32')
+        q_norm = np.linalg.norm(query_vec)
+        if q_norm > 0:
+            query_vec = query_vec / q_norm
+
+        # === 图片过滤规则匹配（基于上传图片） ===
+        blocked_filter_match = None
+        blocked_website_filter_matches = []
+        try:
+            image_filters = db.get_message_filters()
+            image_filters = [f for f in (image_filters or []) if f.get('filter_type') == 'image_filter']
+            if image_filters:
+                best_match = None
+                best_similarity = -1.0
+                for filter_rule in image_filters:
+                    try:
+                        threshold_val = float(filter_rule.get('filter_value') or 0.95)
+                    except (TypeError, ValueError):
+                        threshold_val = 0.95
+                    filter_images = db.get_message_filter_images(filter_rule.get('id'), include_features=True)
+                    if not filter_images:
+                        continue
+                    local_best = None
+                    local_best_sim = -1.0
+                    for item in filter_images:
+                        feats = item.get('features') or []
+                        if not feats:
+                            continue
+                        vec = np.array(feats, dtype='float32')
+                        v_norm = np.linalg.norm(vec)
+                        if v_norm > 0:
+                            vec = vec / v_norm
+                        sim = float(np.dot(query_vec, vec))
+                        if sim > local_best_sim:
+                            local_best_sim = sim
+                            local_best = item
+                    if local_best is not None and local_best_sim >= threshold_val:
+                        if local_best_sim > best_similarity:
+                            best_similarity = local_best_sim
+                            best_match = {
+                                'filter_id': filter_rule.get('id'),
+                                'image_id': local_best.get('id'),
+                                'similarity': local_best_sim,
+                                'threshold': threshold_val
+                            }
+                blocked_filter_match = best_match
+        except Exception as e:
+            logger.error(f"图片过滤匹配失败: {e}")
+
+        # === 网站级图片过滤规则匹配 ===
+        try:
+            user_id = request.form.get('user_id')
+            if user_id:
+                try:
+                    user_id = int(user_id)
+                except (TypeError, ValueError):
+                    user_id = None
+            if user_id:
+                website_settings = db.get_all_user_website_filters(user_id)
+                best_by_website = {}
+                for setting in website_settings or []:
+                    website_id = setting.get('website_id')
+                    try:
+                        filters = json.loads(setting.get('message_filters', '[]'))
+                    except Exception:
+                        filters = []
+
+                    for filter_rule in filters:
+                        if not isinstance(filter_rule, dict):
+                            continue
+                        if filter_rule.get('filter_type') != 'image_filter':
+                            continue
+                        filter_id = filter_rule.get('id')
+                        if not filter_id:
+                            continue
                         try:
                             threshold_val = float(filter_rule.get('filter_value') or 0.95)
                         except (TypeError, ValueError):
                             threshold_val = 0.95
-                        filter_images = db.get_message_filter_images(filter_rule.get('id'), include_features=True)
+
+                        filter_images = db.get_website_filter_images(
+                            user_id,
+                            website_id,
+                            str(filter_id),
+                            include_features=True
+                        )
                         if not filter_images:
                             continue
+
                         local_best = None
                         local_best_sim = -1.0
                         for item in filter_images:
@@ -671,296 +939,220 @@ def search_similar():
                             if sim > local_best_sim:
                                 local_best_sim = sim
                                 local_best = item
+
                         if local_best is not None and local_best_sim >= threshold_val:
-                            if local_best_sim > best_similarity:
-                                best_similarity = local_best_sim
-                                best_match = {
-                                    'filter_id': filter_rule.get('id'),
+                            prev = best_by_website.get(website_id)
+                            if not prev or local_best_sim > prev.get('similarity', -1):
+                                best_by_website[website_id] = {
+                                    'website_id': website_id,
+                                    'filter_id': filter_id,
                                     'image_id': local_best.get('id'),
                                     'similarity': local_best_sim,
                                     'threshold': threshold_val
                                 }
-                    blocked_filter_match = best_match
-            except Exception as e:
-                logger.error(f"图片过滤匹配失败: {e}")
-
-            # === 网站级图片过滤规则匹配 ===
-            try:
-                user_id = request.form.get('user_id')
-                if user_id:
-                    try:
-                        user_id = int(user_id)
-                    except (TypeError, ValueError):
-                        user_id = None
-                if user_id:
-                    website_settings = db.get_all_user_website_filters(user_id)
-                    best_by_website = {}
-                    for setting in website_settings or []:
-                        website_id = setting.get('website_id')
-                        try:
-                            filters = json.loads(setting.get('message_filters', '[]'))
-                        except Exception:
-                            filters = []
 
-                        for filter_rule in filters:
-                            if not isinstance(filter_rule, dict):
-                                continue
-                            if filter_rule.get('filter_type') != 'image_filter':
-                                continue
-                            filter_id = filter_rule.get('id')
-                            if not filter_id:
-                                continue
-                            try:
-                                threshold_val = float(filter_rule.get('filter_value') or 0.95)
-                            except (TypeError, ValueError):
-                                threshold_val = 0.95
-
-                            filter_images = db.get_website_filter_images(
-                                user_id,
-                                website_id,
-                                str(filter_id),
-                                include_features=True
-                            )
-                            if not filter_images:
-                                continue
+                blocked_website_filter_matches = list(best_by_website.values())
+        except Exception as e:
+            logger.error(f"网站图片过滤匹配失败: {e}")
 
-                            local_best = None
-                            local_best_sim = -1.0
-                            for item in filter_images:
-                                feats = item.get('features') or []
-                                if not feats:
-                                    continue
-                                vec = np.array(feats, dtype='float32')
-                                v_norm = np.linalg.norm(vec)
-                                if v_norm > 0:
-                                    vec = vec / v_norm
-                                sim = float(np.dot(query_vec, vec))
-                                if sim > local_best_sim:
-                                    local_best_sim = sim
-                                    local_best = item
-
-                            if local_best is not None and local_best_sim >= threshold_val:
-                                prev = best_by_website.get(website_id)
-                                if not prev or local_best_sim > prev.get('similarity', -1):
-                                    best_by_website[website_id] = {
-                                        'website_id': website_id,
-                                        'filter_id': filter_id,
-                                        'image_id': local_best.get('id'),
-                                        'similarity': local_best_sim,
-                                        'threshold': threshold_val
-                                    }
-
-                    blocked_website_filter_matches = list(best_by_website.values())
-            except Exception as e:
-                logger.error(f"网站图片过滤匹配失败: {e}")
+        # 记录用户搜索次数（未登录则跳过，不影响机器人调用）
+        try:
+            current_user = get_current_user()
+            if current_user:
+                db.increment_user_image_search_count(current_user['id'])
+        except Exception as e:
+            logger.error(f"记录用户搜索次数失败: {e}")
 
-            # 记录用户搜索次数（未登录则跳过，不影响机器人调用）
-            try:
-                current_user = get_current_user()
-                if current_user:
-                    db.increment_user_image_search_count(current_user['id'])
-            except Exception as e:
-                logger.error(f"记录用户搜索次数失败: {e}")
+        # 【优化】使用 FAISS HNSW 向量搜索 + 综合评分重排序
+        if debug_enabled:
+            logger.debug(f"Searching with threshold: {threshold}, vector length: {len(query_features)}")
 
-            # 【优化】使用 FAISS HNSW 向量搜索 + 综合评分重排序
-            if debug_enabled:
-                logger.debug(f"Searching with threshold: {threshold}, vector length: {len(query_features)}")
+        # 1. 扩大召回范围：FAISS 先找前 50 个候选 (Primary Search)
+        # 使用较低的阈值召回，防止漏掉可能的匹配
+        candidates_limit = 50
+        raw_results = db.search_similar_images(query_features, limit=candidates_limit, threshold=0.05)
+        if debug_enabled:
+            logger.debug(f"FAISS recalled {len(raw_results) if raw_results else 0} candidates")
 
-            # 1. 扩大召回范围：FAISS 先找前 50 个候选 (Primary Search)
-            # 使用较低的阈值召回，防止漏掉可能的匹配
-            candidates_limit = 50
-            raw_results = db.search_similar_images(query_features, limit=candidates_limit, threshold=0.05)
-            if debug_enabled:
-                logger.debug(f"FAISS recalled {len(raw_results) if raw_results else 0} candidates")
+        # 2. 重排序 (Re-ranking) - 综合评分
+        refined_results = []
 
-            # 2. 重排序 (Re-ranking) - 综合评分
-            refined_results = []
+        if raw_results:
+            # 获取全局特征提取器实例用来计算颜色/结构
+            extractor = get_global_feature_extractor()
+            if query_signature is None and extractor:
+                query_signature = extractor.prepare_hybrid_query(query_image)
 
-            if raw_results:
-                # 获取全局特征提取器实例用来计算颜色/结构
-                extractor = get_global_feature_extractor()
-                query_signature = extractor.prepare_hybrid_query(image_path) if extractor else None
-
-                for res in raw_results:
-                    # 获取候选图片的本地路径
-                    candidate_img_path = res.get('image_path')
-
-                    # 如果文件不存在，只能用原始 DINO 分数
-                    if not candidate_img_path or not os.path.exists(candidate_img_path):
-                        final_score = res['similarity']
-                        breakdown = {}
-                        if debug_enabled:
-                            logger.debug(f"Candidate image not found, using DINO score: {final_score:.3f}")
-                    else:
-                        # 计算综合评分
-                        hybrid_data = extractor.calculate_hybrid_similarity(
-                            image_path,  # 上传的查询图 (临时文件)
-                            candidate_img_path,  # 数据库里的图
-                            res['similarity'],  # 原始 DINO 分数
-                            query_signature
-                        )
-                        final_score = hybrid_data['score']
-                        breakdown = hybrid_data.get('details', {})
+            # 候选图的颜色签名在入库时已算好，直接从内存索引取，不再读取/解码候选图片
+            candidate_signatures, signature_mask = get_color_index().get_matrix(
+                [(res.get('image_db_id'), res.get('image_path')) for res in raw_results]
+            )
 
-                    # 更新分数
-                    res['original_similarity'] = res['similarity']  # 保留原分用于调试
-                    res['similarity'] = final_score  # 更新为综合分
-                    res['score_breakdown'] = breakdown
+            # 整个候选集一次性向量化计算颜色相关系数与综合分
+            # 没有签名（旧数据且图片文件已丢失）的候选保留原始 DINO 分数
+            rerank = get_hybrid_reranker().rerank(
+                query_signature['hist'] if query_signature is not None else None,
+                candidate_signatures,
+                [res['similarity'] for res in raw_results],
+                signature_mask
+            )
 
-                    refined_results.append(res)
+            # 3. 按新的综合分数重新排序
+            for i in rerank['order']:
+                res = raw_results[i]
+                dino_score = float(res['similarity'])
+                color_score = rerank['color'][i]
+                breakdown = {} if np.isnan(color_score) else {'dino': dino_score, 'color': float(color_score)}
 
-                # 3. 按新的综合分数重新排序
-                refined_results.sort(key=lambda x: x['similarity'], reverse=True)
-                if debug_enabled:
-                    logger.debug(f"Re-ranking completed, best score: {refined_results[0]['similarity']:.3f}")
+                # 更新分数
+                res['original_similarity'] = dino_score  # 保留原分用于调试
+                res['similarity'] = float(rerank['scores'][i])  # 更新为综合分
+                res['score_breakdown'] = breakdown
 
-            # 4. 应用用户阈值和店铺过滤
-            results = []
-            for result in refined_results:
-                similarity = result.get('similarity', 0)
-                # 应用用户相似度阈值
-                if similarity >= threshold:
-                    # 检查店铺权限
-                    if user_shops and result.get('shop_name') not in user_shops:
-                        if debug_enabled:
-                            logger.debug(f"Skipping result from shop {result.get('shop_name')} - not in user shops {user_shops}")
-                        continue
-                    results.append(result)
-                    if len(results) >= limit:
-                        break
+                refined_results.append(res)
 
             if debug_enabled:
-                logger.debug(f"Filtered results count (threshold {threshold}): {len(results)}")
-                if results:
-                    logger.debug(
-                        f"Best match similarity: {results[0]['similarity']:.3f} (original DINO: {results[0].get('original_similarity', 0):.3f})"
-                    )
-                logger.debug(f"Total indexed images: {db.get_total_indexed_images()}")
+                logger.debug(f"Re-ranking completed, best score: {refined_results[0]['similarity']:.3f}")
+
+        # 4. 应用用户阈值和店铺过滤
+        results = []
+        for result in refined_results:
+            similarity = result.get('similarity', 0)
+            # 应用用户相似度阈值
+            if similarity >= threshold:
+                # 检查店铺权限
+                if user_shops and result.get('shop_name') not in user_shops:
+                    if debug_enabled:
+                        logger.debug(f"Skipping result from shop {result.get('shop_name')} - not in user shops {user_shops}")
+                    continue
+                results.append(result)
+                if len(results) >= limit:
+                    break
+
+        if debug_enabled:
+            logger.debug(f"Filtered results count (threshold {threshold}): {len(results)}")
+            if results:
+                logger.debug(
+                    f"Best match similarity: {results[0]['similarity']:.3f} (original DINO: {results[0].get('original_similarity', 0):.3f})"
+                )
+            logger.debug(f"Total indexed images: {db.get_total_indexed_images()}")
+
+        # 严格执行阈值：如果没有满足阈值的结果，则返回空结果
+        # 不再使用任何硬编码阈值兜底（例如 >0.8）
 
-            # 严格执行阈值：如果没有满足阈值的结果，则返回空结果
-            # 不再使用任何硬编码阈值兜底（例如 >0.8）
+        response_data = {
+            'success': True,
+            'results': [],
+            'totalResults': 0,
+            'message': f'未找到相似度超过{threshold*100:.0f}%的商品',
+            'searchTime': datetime.now().isoformat(),
+            'blocked_filter_match': blocked_filter_match,
+            'blocked_website_filter_matches': blocked_website_filter_matches,
+            'debugInfo': {
+                'totalIndexedImages': db.get_total_indexed_images(),
+                'threshold': threshold,
+                'searchedVectors': len(results) if results else 0
+            }
+        }
+
+        if results:
+            # 处理多个搜索结果
+            processed_results = []
+
+            # 预先导入 json，防止循环中报错
+            import json
+
+            # 所有结果的商品信息和图片列表各用一次批量查询取回
+            result_product_ids = [result['id'] for result in results]
+            product_infos = db.get_products_by_ids(result_product_ids)
+            product_json_fields = db.get_product_json_fields(result_product_ids)
+            product_image_rows = db.get_product_image_rows(result_product_ids)
+
+            for i, result in enumerate(results):
+                # 获取完整产品信息
+                product_info = product_infos.get(result['id'])
+
+                # 获取实际的图片URL列表
+                actual_images = []
+                if product_info:
+                    actual_images = [
+                        f"/api/image/{result['id']}/{img['image_index']}"
+                        for img in product_image_rows.get(result['id'], [])
+                    ]
+
+                # 生成所有网站的链接
+                weidian_id = None
+                if product_info and product_info.get('product_url'):
+                    import re
+                    match = re.search(r'itemID=(\d+)', product_info['product_url'])
+                    if match:
+                        weidian_id = match.group(1)
+
+                website_urls = []
+                if weidian_id:
+                    website_urls = db.generate_website_urls(weidian_id)
+
+                # JSON 字段在商品缓存中已解析，不再每次命中都 json.loads
+                json_fields = product_json_fields.get(result['id'], {})
+                selected_indexes = json_fields.get('custom_reply_images', [])
+                custom_urls = json_fields.get('custom_image_urls', [])
+                uploaded_reply_images = json_fields.get('uploaded_reply_images', [])
+
+                result_data = {
+                    'rank': i + 1,
+                    'similarity': float(result['similarity']),
+                    'originalSimilarity': float(result.get('original_similarity', result['similarity'])),  # 原始DINO分数
+                    'scoreBreakdown': result.get('score_breakdown', {}),  # 评分详情
+                    'imageIndex': result['image_index'],
+                    'matchedImage': f"/api/image/{result['id']}/{result['image_index']}",
+                    'product': {
+                        'id': result['id'],
+                        'title': product_info['title'] if product_info else result.get('title', ''),
+                        'englishTitle': product_info.get('english_title', ''),
+                        'weidianUrl': product_info['product_url'] if product_info else result.get('product_url', ''),
+                        'cnfansUrl': product_info.get('cnfans_url', ''),
+                        'acbuyUrl': product_info.get('acbuy_url', ''),
+                        'ruleEnabled': product_info.get('ruleEnabled', True) if product_info else True,
+                        # 修复：机器人需要 imageSource 和 uploaded_reply_images 才能发送本地图片
+                        'imageSource': product_info.get('image_source', 'product') if product_info else 'product',
+                        'custom_reply_text': product_info.get('custom_reply_text', '') if product_info else '',
+                        'replyScope': product_info.get('reply_scope', 'all') if product_info else 'all',
+                        'uploaded_reply_images': uploaded_reply_images,
+                        'selectedImageIndexes': selected_indexes,
+                        'customImageUrls': custom_urls,
+                        'images': actual_images if actual_images else [f"/api/image/{result['id']}/{result['image_index']}"],  # 使用实际图片列表
+                        'websiteUrls': website_urls  # 添加所有网站的链接
+                    }
+                }
+                processed_results.append(result_data)
+
+            # 保存最佳匹配的搜索历史
+            if processed_results:
+                best_match = processed_results[0]
+                db.add_search_history(
+                    query_image_path=history_path,
+                    matched_product_id=best_match['product']['id'],
+                    matched_image_index=best_match['imageIndex'],
+                    similarity=best_match['similarity'],
+                    threshold=threshold
+                )
 
             response_data = {
                 'success': True,
-                'results': [],
-                'totalResults': 0,
-                'message': f'未找到相似度超过{threshold*100:.0f}%的商品',
+                'results': processed_results,
+                'totalResults': len(processed_results),
                 'searchTime': datetime.now().isoformat(),
                 'blocked_filter_match': blocked_filter_match,
                 'blocked_website_filter_matches': blocked_website_filter_matches,
                 'debugInfo': {
                     'totalIndexedImages': db.get_total_indexed_images(),
                     'threshold': threshold,
+                    'limit': limit,
                     'searchedVectors': len(results) if results else 0
                 }
             }
 
-            if results:
-                # 处理多个搜索结果
-                processed_results = []
-
-                # 预先导入 json，防止循环中报错
-                import json
-
-                for i, result in enumerate(results):
-                    # 获取完整产品信息
-                    product_info = db._get_product_info_by_id(result['id'])
-
-                    # 获取实际的图片URL列表
-                    actual_images = []
-                    if product_info:
-                        with db.get_connection() as conn:
-                            cursor = conn.cursor()
-                            cursor.execute("SELECT image_index FROM product_images WHERE product_id = ? ORDER BY image_index", (result['id'],))
-                            actual_images = [f"/api/image/{result['id']}/{row[0]}" for row in cursor.fetchall()]
-
-                    # 生成所有网站的链接
-                    weidian_id = None
-                    if product_info and product_info.get('product_url'):
-                        import re
-                        match = re.search(r'itemID=(\d+)', product_info['product_url'])
-                        if match:
-                            weidian_id = match.group(1)
-
-                    website_urls = []
-                    if weidian_id:
-                        website_urls = db.generate_website_urls(weidian_id)
-
-                    selected_indexes = []
-                    custom_urls = []
-                    uploaded_reply_images = []
-                    try:
-                        if product_info and product_info.get('custom_reply_images'):
-                            selected_indexes = json.loads(product_info.get('custom_reply_images') or '[]')
-                        if product_info and product_info.get('custom_image_urls'):
-                            custom_urls = json.loads(product_info.get('custom_image_urls') or '[]')
-                        if product_info and product_info.get('uploaded_reply_images'):
-                            uploaded_reply_images = json.loads(product_info.get('uploaded_reply_images') or '[]')
-                    except Exception:
-                        selected_indexes = []
-                        custom_urls = []
-                        uploaded_reply_images = []
-
-                    result_data = {
-                        'rank': i + 1,
-                        'similarity': float(result['similarity']),
-                        'originalSimilarity': float(result.get('original_similarity', result['similarity'])),  # 原始DINO分数
-                        'scoreBreakdown': result.get('score_breakdown', {}),  # 评分详情
-                        'imageIndex': result['image_index'],
-                        'matchedImage': f"/api/image/{result['id']}/{result['image_index']}",
-                        'product': {
-                            'id': result['id'],
-                            'title': product_info['title'] if product_info else result.get('title', ''),
-                            'englishTitle': product_info.get('english_title', ''),
-                            'weidianUrl': product_info['product_url'] if product_info else result.get('product_url', ''),
-                            'cnfansUrl': product_info.get('cnfans_url', ''),
-                            'acbuyUrl': product_info.get('acbuy_url', ''),
-                            'ruleEnabled': product_info.get('ruleEnabled', True) if product_info else True,
-                            # 修复：机器人需要 imageSource 和 uploaded_reply_images 才能发送本地图片
-                            'imageSource': product_info.get('image_source', 'product') if product_info else 'product',
-                            'custom_reply_text': product_info.get('custom_reply_text', '') if product_info else '',
-                            'replyScope': product_info.get('reply_scope', 'all') if product_info else 'all',
-                            'uploaded_reply_images': uploaded_reply_images,
-                            'selectedImageIndexes': selected_indexes,
-                            'customImageUrls': custom_urls,
-                            'images': actual_images if actual_images else [f"/api/image/{result['id']}/{result['image_index']}"],  # 使用实际图片列表
-                            'websiteUrls': website_urls  # 添加所有网站的链接
-                        }
-                    }
-                    processed_results.append(result_data)
-
-                # 保存最佳匹配的搜索历史
-                if processed_results:
-                    best_match = processed_results[0]
-                    db.add_search_history(
-                        query_image_path=image_path,
-                        matched_product_id=best_match['product']['id'],
-                        matched_image_index=best_match['imageIndex'],
-                        similarity=best_match['similarity'],
-                        threshold=threshold
-                    )
-
-                response_data = {
-                    'success': True,
-                    'results': processed_results,
-                    'totalResults': len(processed_results),
-                    'searchTime': datetime.now().isoformat(),
-                    'blocked_filter_match': blocked_filter_match,
-                    'blocked_website_filter_matches': blocked_website_filter_matches,
-                    'debugInfo': {
-                        'totalIndexedImages': db.get_total_indexed_images(),
-                        'threshold': threshold,
-                        'limit': limit,
-                        'searchedVectors': len(results) if results else 0
-                    }
-                }
-
-            return jsonify(response_data)
-
-        finally:
-            # 清理临时文件
-            if os.path.exists(image_path):
-                os.unlink(image_path)
+        return jsonify(response_data)
 
     except Exception as e:
         logger.error(f"搜索失败: {e}")
@@ -1086,10 +1278,28 @@ def scrape_product():
             engine = get_vector_engine()
 
             def extract_features_only(img_path):
-                """只提取特征，不插入数据库"""
+                """只提取特征（含 YOLO 裁剪框），不插入数据库"""
                 try:
-                    features = extractor.extract_feature(img_path)
-                    return features
+                    loaded_image = load_image(img_path)
+                    # 先查感知哈希：与已入库图片（同配色）近重复时直接复用其向量，不占用 AI 并发
+                    phash, phash_match = find_phash_match(loaded_image, product_id)
+                    if phash_match:
+                        return {
+                            'features': phash_match['features'],
+                            'crop': phash_match['crop'],
+                            'color_signature': phash_match['query_color_signature'],
+                            'phash': phash
+                        }
+                    with inference_priority(BULK):
+                        extracted = extractor.extract_feature_with_meta(loaded_image)
+                    if extracted is None:
+                        return None
+                    return {
+                        'features': extracted['vector'],
+                        'crop': extracted['crop'],
+                        'color_signature': extractor.compute_color_signature(loaded_image),
+                        'phash': phash
+                    }
                 except Exception as e:
                     logger.error(f"特征提取失败 {img_path}: {e}")
                     return None
@@ -1119,25 +1329,43 @@ def scrape_product():
             # 按索引排序结果
             features_list.sort(key=lambda x: x[0])
 
-            # 第二步：串行插入数据库和FAISS索引
-            logger.info("开始串行数据库插入和索引建立...")
+            # 第二步：一个事务批量写入图片记录，再串行写入FAISS索引
+            logger.info("开始批量数据库插入和索引建立...")
             indexed_images = []
+            rows_to_insert = []
 
-            for i, img_path, features in features_list:
+            for i, img_path, meta in features_list:
+                if meta is None:
+                    logger.error(f"跳过图片 {i}: 特征提取失败")
+                    continue
+                rows_to_insert.append({
+                    'image_path': img_path,
+                    'image_index': i,
+                    'features': meta['features'],
+                    'color_signature': meta['color_signature'],
+                    'crop': meta['crop'],
+                    'phash': meta['phash']
+                })
+
+            record_ids = []
+            if rows_to_insert:
                 try:
-                    if features is None:
-                        logger.error(f"跳过图片 {i}: 特征提取失败")
-                        continue
+                    record_ids = db.insert_image_records_bulk(product_id, rows_to_insert)
+                except Exception as e:
+                    logger.error(f"图片元数据批量插入失败: {e}")
 
-                    # 插入数据库记录
-                    image_db_id = db.insert_image_record(product_id, img_path, i)
+            for row, image_db_id in zip(rows_to_insert, record_ids):
+                i = row['image_index']
+                try:
                     if not image_db_id:
                         logger.error(f"图片 {i} 元数据插入失败")
                         continue
+                    get_color_index().add(image_db_id, row['color_signature'])
+                    get_phash_index().add(image_db_id, row['phash'], product_id)
 
                     # 插入FAISS向量索引
                     with faiss_lock:  # FAISS 线程安全锁
-                        success = engine.add_vector(image_db_id, features)
+                        success = engine.add_vector(image_db_id, row['features'])
                     if success:
                         indexed_images.append(f"{i}.jpg")
                         logger.info(f"图片 {i} 索引建立成功")
@@ -2077,6 +2305,14 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/system/boot-profile', methods=['GET'])
+def get_boot_profile():
+    """启动耗时报告：API 就绪与 AI 就绪分开统计"""
+    report = boot_profile.report()
+    report['api_ready'] = boot_profile.elapsed('api_ready') is not None
+    report['ai_ready'] = ai_model_ready
+    return jsonify(report)
+
 # === 新增：系统统计信息API ===
 @app.route('/api/system/stats', methods=['GET'])
 def get_system_stats():
@@ -2524,6 +2760,8 @@ def list_products():
         keyword = (request.args.get('keyword') or '').strip()
         search_type = request.args.get('search_type', 'all')
         shop_name = (request.args.get('shop_name') or '').strip() or None
+        # 游标分页：传入上一页返回的 nextCursor 时忽略 page
+        page_cursor = (request.args.get('cursor') or '').strip() or None
 
         # 根据用户权限获取商品（支持分页）
         if current_user['role'] == 'admin':
@@ -2535,7 +2773,8 @@ def list_products():
                 offset=offset,
                 keyword=keyword,
                 search_type=search_type,
-                shop_name=shop_name
+                shop_name=shop_name,
+                page_cursor=page_cursor
             )
         else:
             # 普通用户只能看到自己管理的店铺的商品
@@ -2547,11 +2786,12 @@ def list_products():
                 offset=offset,
                 keyword=keyword,
                 search_type=search_type,
-                shop_name=shop_name
+                shop_name=shop_name,
+                page_cursor=page_cursor
             )
 
-            # 调试：检查数据库中的商品和店铺匹配情况
-            if user_shops:
+            # 调试：查不到商品时检查数据库中的商品和店铺匹配情况
+            if user_shops and not result['products']:
                 with db.get_connection() as conn:
                     cursor = conn.cursor()
                     placeholders = ','.join('?' * len(user_shops))
@@ -2570,6 +2810,8 @@ def list_products():
         response_data = {
             'products': result['products'],
             'total': result['total'],
+            'totalApproximate': result.get('total_approximate', False),
+            'nextCursor': result.get('next_cursor'),
             'debug': {
                 'user_role': current_user['role'],
                 'user_shops': current_user.get('shops', []),
@@ -2850,29 +3092,30 @@ def backfill_products():
             cursor.execute("SELECT id, product_url, english_title, cnfans_url FROM products")
             rows = cursor.fetchall()
 
-            for row in rows:
-                pid = row['id']
-                url = row['product_url']
-                need_english = not row['english_title']
-                need_cnfans = not row['cnfans_url']
-                if not (need_english or need_cnfans):
-                    continue
+        # 抓取期间不占用连接，每个商品的更新交给单写线程提交
+        for row in rows:
+            pid = row['id']
+            url = row['product_url']
+            need_english = not row['english_title']
+            need_cnfans = not row['cnfans_url']
+            if not (need_english or need_cnfans):
+                continue
 
-                product_info = scraper.scrape_product_info(url)
-                if not product_info:
-                    logger.warning(f"回填失败，无法抓取: {url}")
-                    continue
+            product_info = scraper.scrape_product_info(url)
+            if not product_info:
+                logger.warning(f"回填失败，无法抓取: {url}")
+                continue
 
-                english = product_info.get('english_title') or ''
-                cnfans = product_info.get('cnfans_url') or ''
+            english = product_info.get('english_title') or ''
+            cnfans = product_info.get('cnfans_url') or ''
 
-                cursor.execute("""
-                    UPDATE products
-                    SET english_title = ?, cnfans_url = ?
-                    WHERE id = ?
-                """, (english, cnfans, pid))
-                conn.commit()
-                updated.append(pid)
+            db.run_write(lambda cursor, params=(english, cnfans, pid): cursor.execute("""
+                UPDATE products
+                SET english_title = ?, cnfans_url = ?
+                WHERE id = ?
+            """, params))
+            db.invalidate_product_cache([pid])
+            updated.append(pid)
 
         return jsonify({'updated': updated, 'count': len(updated)})
     except Exception as e:
@@ -2896,7 +3139,8 @@ def rebuild_index():
         with db.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                SELECT pi.id, pi.product_id, pi.image_path, pi.image_index
+                SELECT pi.id, pi.product_id, pi.image_path, pi.image_index,
+                       pi.crop_box, pi.crop_class, pi.crop_confidence
                 FROM product_images pi
                 JOIN products p ON pi.product_id = p.id
                 ORDER BY pi.id
@@ -2929,8 +3173,8 @@ def rebuild_index():
                     logger.warning(f"图片文件不存在: {image_path}")
                     continue
 
-                # 提取特征
-                features = extractor.extract_feature(image_path)
+                # 提取特征（复用已保存的裁剪框）
+                features = reembed_image_record(extractor, record)
                 if features is not None:
                     vectors_data.append((record['id'], features))
                     logger.info(f"重新提取特征: {record['id']}")
@@ -2968,7 +3212,10 @@ def rebuild_vectors():
         with db.get_connection() as conn:
             cursor = conn.cursor()
             # 查找所有 product_images 中 milvus_id 为空或 NULL 的记录
-            cursor.execute("SELECT id, product_id, image_path, image_index FROM product_images WHERE milvus_id IS NULL OR milvus_id = ''")
+            cursor.execute("""
+                SELECT id, product_id, image_path, image_index, crop_box, crop_class, crop_confidence
+                FROM product_images WHERE milvus_id IS NULL OR milvus_id = ''
+            """)
             rows = cursor.fetchall()
 
         for row in rows:
@@ -2976,7 +3223,7 @@ def rebuild_vectors():
             img_path = row['image_path']
             idx = row['image_index']
             try:
-                features = extractor.extract_feature(img_path)
+                features = reembed_image_record(extractor, row)
                 if features is None:
                     logger.error(f"重建特征失败: {img_path}")
                     failed.append({'product_id': pid, 'image_index': idx})
@@ -3811,9 +4058,20 @@ def get_ai_status():
         faiss_status = faiss_engine.get_stats()
 
         # 综合状态
+        embedding_cache = get_embedding_cache()
         overall_status = {
             'ai_model_status': ai_status,
             'vector_engine_status': faiss_status,
+            'embedding_cache_status': embedding_cache.get_stats() if embedding_cache else {'enabled': False},
+            'color_index_status': get_color_index().get_stats(),
+            'phash_index_status': get_phash_index().get_stats(),
+            'phrase_index_status': get_phrase_index().get_stats(),
+            'inference_scheduler_status': get_inference_scheduler().get_stats(),
+            'database_pool_status': db.get_pool_stats(),
+            'product_cache_status': db.get_product_cache_stats(),
+            'website_snapshot_status': db.get_website_snapshot_stats(),
+            'database_writer_status': db.get_writer_stats(),
+            'scrape_status_store': db.get_scrape_status_stats(),
             'system_health': '良好' if ai_status['yolo_available'] and faiss_status['total_vectors'] >= 0 else '需要优化',
             'recommendations': []
         }
@@ -3858,7 +4116,10 @@ def rebuild_faiss_index():
         # 获取所有有效的图片数据
         with db.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id, image_path FROM product_images WHERE id IS NOT NULL")
+            cursor.execute("""
+                SELECT id, image_path, crop_box, crop_class, crop_confidence
+                FROM product_images WHERE id IS NOT NULL
+            """)
             all_images = cursor.fetchall()
 
         # 重新提取所有特征
@@ -3869,7 +4130,7 @@ def rebuild_faiss_index():
                 if extractor is None:
                     logger.error("特征提取器未初始化")
                     continue
-                features = extractor.extract_feature(row['image_path'])
+                features = reembed_image_record(extractor, row)
                 if features is not None:
                     valid_vectors.append((row['id'], features))
             except Exception as e:
@@ -4181,39 +4442,34 @@ def search_similar_text():
             query_lower = query.lower()
             query_normalized = re.sub(r'\s+', ' ', query_lower).strip()
 
+            result_fields = (
+                'id', 'product_url', 'title', 'english_title', 'description',
+                'ruleEnabled', 'min_delay', 'max_delay', 'created_at',
+                'cnfans_url', 'shop_name', 'custom_reply_text',
+                'custom_reply_images', 'custom_image_urls', 'image_source',
+                'reply_scope',
+                'uploaded_reply_images'
+            )
+            select_columns = ', '.join(f'p.{field}' for field in result_fields)
+
             def fetch_by_terms(terms, remaining_limit, exclude_ids=None):
-                if not terms or remaining_limit <= 0:
-                    return []
-                conditions = []
-                params = []
-                for term in terms:
-                    like = f"%{term}%"
-                    conditions.append("(LOWER(english_title) LIKE ? OR LOWER(title) LIKE ?)")
-                    params.extend([like, like])
-                where_clause = " OR ".join(conditions)
-                exclude_clause = ""
-                exclude_params = []
-                if exclude_ids:
-                    placeholders = ",".join("?" for _ in exclude_ids)
-                    exclude_clause = f" AND id NOT IN ({placeholders})"
-                    exclude_params = list(exclude_ids)
-                cursor.execute(f"""
-                    SELECT id, product_url, title, english_title, description,
-                           ruleEnabled, min_delay, max_delay, created_at,
-                           cnfans_url, shop_name, custom_reply_text,
-                           custom_reply_images, custom_image_urls, image_source,
-                           reply_scope,
-                           uploaded_reply_images
-                    FROM products
-                    WHERE ({where_clause}){exclude_clause}
-                    ORDER BY created_at DESC
-                    LIMIT ?
-                """, (*params, *exclude_params, remaining_limit))
-                return cursor.fetchall()
-
-            rows = fetch_by_terms([query_normalized], limit)
+                # 标题全文索引 (FTS5 trigram + BM25)，不再对商品表做 LIKE 全表扫描
+                return db.search_products_by_text(terms, remaining_limit, exclude_ids, select_columns)
+
+            # 短语出现在消息中的商品（机器人的采纳规则）排在最前：Aho-Corasick 一次扫描找出全部命中
+            phrase_hits = get_phrase_index().match(query_normalized, limit)
+            phrase_products = db.get_products_by_ids([hit['product_id'] for hit in phrase_hits])
+            rows = [
+                {field: phrase_products[hit['product_id']].get(field) for field in result_fields}
+                for hit in phrase_hits if hit['product_id'] in phrase_products
+            ]
             found_ids = {row['id'] for row in rows}
 
+            if len(rows) < limit:
+                title_rows = fetch_by_terms([query_normalized], limit - len(rows), found_ids)
+                rows.extend(title_rows)
+                found_ids.update({row['id'] for row in title_rows})
+
             tokens = [kw for kw in re.findall(r'\w+', query_normalized) if len(kw) >= 2]
             extra_terms = []
             if len(tokens) >= 2:
@@ -4236,39 +4492,23 @@ def search_similar_text():
                 if tokens:
                     rows = fetch_by_terms(tokens, limit)
 
-            if not rows:
-                cursor.execute("""
-                    SELECT id, product_url, title, english_title, description,
-                           ruleEnabled, min_delay, max_delay, created_at,
-                           cnfans_url, shop_name, custom_reply_text,
-                           custom_reply_images, custom_image_urls, image_source,
-                           reply_scope,
-                           uploaded_reply_images
-                    FROM products
-                    WHERE (
-                        english_title IS NOT NULL
-                        AND LENGTH(TRIM(english_title)) >= 2
-                        AND INSTR(?, LOWER(english_title)) > 0
-                    )
-                    OR (
-                        title IS NOT NULL
-                        AND LENGTH(TRIM(title)) >= 2
-                        AND INSTR(?, LOWER(title)) > 0
-                    )
-                    ORDER BY created_at DESC
-                    LIMIT ?
-                """, (query_normalized, query_normalized, limit))
-                rows = cursor.fetchall()
+            # 预览图：所有商品的第一张图一次查询取回
+            first_image_index = {}
+            if rows:
+                placeholders = ','.join('?' * len(rows))
+                cursor.execute(f"""
+                    SELECT product_id, MIN(image_index) AS image_index FROM product_images
+                    WHERE product_id IN ({placeholders})
+                    GROUP BY product_id
+                """, [row['id'] for row in rows])
+                first_image_index = {r['product_id']: r['image_index'] for r in cursor.fetchall()}
 
             products = []
             for row in rows:
                 prod = dict(row)
-                # 简单获取第一张图作为预览
-                cursor.execute("SELECT image_index FROM product_images WHERE product_id = ? ORDER BY image_index LIMIT 1", (prod['id'],))
-                img_row = cursor.fetchone()
                 # 构造符合 Bot 逻辑的 image 路径
-                if img_row:
-                    prod['images'] = [f"/api/image/{prod['id']}/{img_row[0]}"]
+                if prod['id'] in first_image_index:
+                    prod['images'] = [f"/api/image/{prod['id']}/{first_image_index[prod['id']]}"]
                 else:
                     prod['images'] = []
 
@@ -4867,6 +5107,7 @@ def scrape_shop():
             return jsonify({'error': '已有抓取任务在运行中，请等待完成后再试'}), 409
 
         logger.info(f'开始抓取店铺: {shop_id}')
+        scrape_stop_event.clear()
 
         # 在后台线程中运行抓取任务，避免阻塞其他操作
         import threading
@@ -5033,8 +5274,7 @@ def batch_scrape_products():
         def process_single_product_batch(product_id):
             """处理单个商品（用于线程池）"""
             try:
-                current_status = db.get_scrape_status()
-                if current_status.get('stop_signal', False):
+                if scrape_stop_event.is_set():
                     logger.info(f"🔴 处理商品前检测到停止信号，取消处理商品 {product_id}")
                     return {'status': 'cancelled', 'product_id': product_id, 'message': '任务已取消'}
 
@@ -5073,8 +5313,7 @@ def batch_scrape_products():
             try:
                 while pending_futures:
                     # 检查是否有停止信号或关闭事件
-                    current_status = db.get_scrape_status()
-                    should_stop = (current_status.get('stop_signal', False) or
+                    should_stop = (scrape_stop_event.is_set() or
                                  (shutdown_event and shutdown_event.is_set()))
 
                     if should_stop and not stop_detected:
@@ -5449,7 +5688,7 @@ def scrape_shop_products(shop_id):
 
     db.update_scrape_status(message='正在获取店铺分类树...')
 
-    if not (scrape_stop_event.is_set() or db.get_scrape_status().get('stop_signal', False)):
+    if not (scrape_stop_event.is_set()):
         try:
             # 1. 获取所有分类 ID
             categories = get_all_category_ids(shop_id, scraper.session)
@@ -5462,7 +5701,7 @@ def scrape_shop_products(shop_id):
 
                 # 定义单个分类的处理函数
                 def process_category(cate):
-                    if scrape_stop_event.is_set() or db.get_scrape_status().get('stop_signal', False):
+                    if scrape_stop_event.is_set():
                         return 0
 
                     cate_id = cate['id']
@@ -5507,7 +5746,7 @@ def scrape_shop_products(shop_id):
 
                     completed_cates = 0
                     while pending_futures:
-                        if scrape_stop_event.is_set() or db.get_scrape_status().get('stop_signal', False):
+                        if scrape_stop_event.is_set():
                             cate_stop_requested = True
                             for future in pending_futures:
                                 future.cancel()
@@ -5582,7 +5821,7 @@ def scrape_shop_products(shop_id):
             # 轮询等待，确保可中断
             while pending_futures:
                 # 检查停止事件或停止信号
-                if scrape_stop_event.is_set() or db.get_scrape_status().get('stop_signal', False):
+                if scrape_stop_event.is_set():
                     logger.info("🔴 检测到停止事件/信号，正在取消剩余任务...")
                     stop_requested = True
                     for future in pending_futures:
@@ -5650,7 +5889,7 @@ def scrape_shop_products(shop_id):
                 executor.shutdown(wait=True)
 
     # 结束
-    if stop_requested or scrape_stop_event.is_set() or db.get_scrape_status().get('stop_signal', False):
+    if stop_requested or scrape_stop_event.is_set():
         final_message = f'抓取已停止，已处理 {processed_count} 个商品'
     else:
         if failed_count > 0 or image_failed_count > 0 or index_failed_count > 0:
@@ -5708,18 +5947,6 @@ def process_and_save_single_product_sync(product_info):
                 'message': '任务已取消'
             }
 
-        current_status = db.get_scrape_status()
-        if current_status.get('stop_signal', False):
-            logger.debug(f"🔴 处理商品前检测到停止信号，取消处理商品 {item_id}")
-            return {
-                'status': 'cancelled',
-                'item_id': item_id,
-                'failed': False,
-                'image_failed': False,
-                'index_failed': False,
-                'message': '任务已取消'
-            }
-
         # === 0. 基于item_id的强力去重 ===
         if db.get_product_by_item_id(item_id):
             logger.debug(f"⏭️ 商品 {item_id} 已存在，跳过重复处理")
@@ -5749,8 +5976,7 @@ def process_and_save_single_product_sync(product_info):
 
         product_title = product_data.get('title', '')
         # === 再次检查停止状态 ===
-        current_status = db.get_scrape_status()
-        if current_status.get('stop_signal', False):
+        if scrape_stop_event.is_set():
             logger.debug(f"🔴 抓取详情后检测到停止信号，取消处理商品 {item_id}")
             return {
                 'status': 'cancelled',
@@ -5780,8 +6006,7 @@ def process_and_save_single_product_sync(product_info):
         logger.debug(f"商品 {item_id} 入库完成，数据库ID: {product_id}")
 
         # === 再次检查停止状态 ===
-        current_status = db.get_scrape_status()
-        if current_status.get('stop_signal', False):
+        if scrape_stop_event.is_set():
             logger.debug(f"🔴 入库后检测到停止信号，商品 {item_id} 已入库但跳过图片处理")
             return {
                 'status': 'partial',
@@ -6111,6 +6336,7 @@ def save_product_images_unified(product_id, image_urls, max_workers=None, shutdo
         'processed': 0,
         'stored': 0,
         'duplicates': 0,
+        'phash_hits': 0,
         'existing': 0,
         'fatal': 0,
         'retry_failed': 0,
@@ -6238,6 +6464,7 @@ def save_product_images_unified(product_id, image_urls, max_workers=None, shutdo
 
         processed_indices = []
         vectors_to_add = []
+        rows_to_insert = []
 
         for index, save_path in current_downloaded:
             if shutdown_event and shutdown_event.is_set():
@@ -6246,9 +6473,35 @@ def save_product_images_unified(product_id, image_urls, max_workers=None, shutdo
 
             try:
                 features = None
-                with GLOBAL_AI_SEMAPHORE:
+                color_signature = None
+                crop = None
+                phash = None
+                loaded_image = load_image(save_path)
+
+                # 先查感知哈希：重新抓取的店铺大多是已入库图片，命中时不占用 AI 并发
+                phash, phash_match = find_phash_match(loaded_image, product_id)
+                if phash_match and phash_match['same_product']:
+                    try:
+                        os.remove(save_path)
+                    except Exception:
+                        pass
+                    stats['duplicates'] += 1
+                    stats['phash_hits'] += 1
+                    processed_indices.append(index)
+                    continue
+
+                if phash_match:
+                    features, crop = phash_match['features'], phash_match['crop']
+                    color_signature = phash_match['query_color_signature']
+                    stats['phash_hits'] += 1
+                else:
+                    # 抓取入库为批量优先级，模型调用让位于机器人/网页搜索
                     try:
-                        features = extractor.extract_feature(save_path)
+                        with inference_priority(BULK):
+                            extracted = extractor.extract_feature_with_meta(loaded_image)
+                        if extracted is not None:
+                            features, crop = extracted['vector'], extracted['crop']
+                            color_signature = extractor.compute_color_signature(loaded_image)
                     except Exception as e:
                         logger.error(f"特征提取底层错误: {e}")
                         features = None
@@ -6272,19 +6525,47 @@ def save_product_images_unified(product_id, image_urls, max_workers=None, shutdo
                     continue
 
                 existing_feats.append(features)
-                img_db_id = db.insert_image_record(product_id, save_path, index, features)
+                rows_to_insert.append({
+                    'image_path': save_path,
+                    'image_index': index,
+                    'features': features,
+                    'color_signature': color_signature,
+                    'crop': crop,
+                    'phash': phash
+                })
+
+            except Exception as e:
+                logger.error(f"处理图片 {index} 异常: {e}")
+                retry_list.append((index, image_urls[index]))
+
+        # 本批图片一个事务写入，避免每张图一次提交争抢 WAL 写锁
+        if rows_to_insert:
+            try:
+                record_ids = db.insert_image_records_bulk(product_id, rows_to_insert)
+            except Exception as e:
+                # 整批失败（如个别序号已被写入）时逐条插入，只让失败的图片重试
+                logger.warning(f"[商品 {product_id}] 批量写入图片记录失败，改为逐条写入: {e}")
+                record_ids = []
+                for row in rows_to_insert:
+                    try:
+                        record_ids.append(db.insert_image_record(
+                            product_id, row['image_path'], row['image_index'], row['features'],
+                            row['color_signature'], row['crop'], row['phash']
+                        ))
+                    except Exception:
+                        record_ids.append(None)
 
+            for row, img_db_id in zip(rows_to_insert, record_ids):
+                index = row['image_index']
                 if img_db_id:
-                    vectors_to_add.append((img_db_id, features))
+                    get_color_index().add(img_db_id, row['color_signature'])
+                    get_phash_index().add(img_db_id, row['phash'], product_id)
+                    vectors_to_add.append((img_db_id, row['features']))
                     processed_indices.append(index)
                     stats['stored'] += 1
                 else:
                     retry_list.append((index, image_urls[index]))
 
-            except Exception as e:
-                logger.error(f"处理图片 {index} 异常: {e}")
-                retry_list.append((index, image_urls[index]))
-
         if vectors_to_add:
             try:
                 from vector_engine import get_vector_engine
@@ -6356,7 +6637,7 @@ def save_product_images_unified(product_id, image_urls, max_workers=None, shutdo
     logger.info(
         f"🧾 [商品 {product_id}] 图片统计: total={stats['total_urls']}, stored={stats['stored']}, "
         f"existing={stats['existing']}, duplicate={stats['duplicates']}, fatal={stats['fatal']}, "
-        f"retry_failed={stats['retry_failed']}"
+        f"retry_failed={stats['retry_failed']}, phash_hits={stats['phash_hits']}"
     )
 
     return stats['processed'], stats
@@ -6375,7 +6656,7 @@ def run_cleanup_task():
 
             # 2. 清理内存中的冷却记录
             try:
-                from bot import cleanup_expired_cooldowns
+                from bot_state import cleanup_expired_cooldowns
                 cleanup_expired_cooldowns()
                 logger.info("✅ 已清理内存中过期的冷却状态")
             except ImportError:
@@ -6407,6 +6688,7 @@ if __name__ == '__main__':
         # 设置抓取状态为停止
         current_status = db.get_scrape_status()
         if current_status.get('is_scraping', False):
+            scrape_stop_event.set()
             db.update_scrape_status(
                 stop_signal=True,
                 message='系统正在关闭，已停止抓取任务'
@@ -6439,9 +6721,13 @@ if __name__ == '__main__':
 
     # 注册退出时停止机器人的函数
     atexit.register(stop_discord_bot)
+    # 退出前保存尚未落库的抓取状态
+    atexit.register(db.flush_scrape_status)
 
     # 启动 Flask 服务
     print("🚀 服务启动中...")
+    boot_profile.mark('api_ready')
+    print(f"⏱️ [系统] API 启动耗时 {boot_profile.elapsed('api_ready'):.2f}s (AI 模型后台加载中)")
     try:
         # 关闭 debug 模式，避免 Flask 重载器导致双重初始化
         # 【关键修改】添加 use_reloader=False 禁用Flask重载器，避免双重进程
@@ -0,0 +1,69 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 进程启动时间（本模块应尽早导入）
+PROCESS_START = time.time()
+
+
+class BootProfiler:
+    """
+    启动耗时分析
+    记录各启动阶段（导入、配置、数据库、端口监听、AI 预热等）的起止时间，
+    通过 /api/system/boot-profile 查看，定位 pm2 重启慢的原因。
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self.start = start or PROCESS_START
+        self._phases: List[Dict] = []
+        self._marks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录一个阶段的耗时（支持在后台线程中使用）"""
+        began = time.time()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            ended = time.time()
+            with self._lock:
+                self._phases.append({
+                    'phase': name,
+                    'thread': threading.current_thread().name,
+                    'start_s': round(began - self.start, 3),
+                    'duration_s': round(ended - began, 3),
+                    'error': error
+                })
+
+    def mark(self, name: str):
+        """记录一个时间点（如 'api_ready'、'ai_ready'）"""
+        with self._lock:
+            self._marks[name] = round(time.time() - self.start, 3)
+
+    def elapsed(self, name: str) -> Optional[float]:
+        return self._marks.get(name)
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                'uptime_s': round(time.time() - self.start, 3),
+                'marks': dict(self._marks),
+                'phases': list(self._phases)
+            }
+
+    def log_summary(self, title: str = '启动耗时'):
+        report = self.report()
+        lines = [f"{p['phase']}={p['duration_s']:.2f}s" for p in report['phases']]
+        logger.info(f"⏱️ {title}: {', '.join(lines)} | 标记: {report['marks']}")
+
+
+boot_profile = BootProfiler()
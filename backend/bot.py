@@ -15,84 +15,29 @@ try:
 except ImportError:
     from .config import config
 
-# 全局变量用于多账号机器人管理
-bot_clients = []
-bot_tasks = []
-
-# 全局冷却管理器：(account_id, channel_id) -> timestamp (上次发送时间)
-account_last_sent = {}
-
-# 【新增】AI并发限制：最多同时2个AI推理任务，防止CPU饱和导致Flask阻塞
-ai_concurrency_limit = asyncio.Semaphore(2)
-
-
-def get_all_cooldowns():
-    """获取所有活跃的冷却状态（供 API 查询）"""
-    current_time = time.time()
-    cooldowns = []
-
-    snapshot = account_last_sent.copy()
-
-    for key, last_sent in snapshot.items():
-        try:
-            acc_id, ch_id = key
-            time_passed = current_time - last_sent
-
-            if time_passed < 86400:
-                cooldowns.append({
-                    'account_id': int(acc_id),
-                    'channel_id': str(ch_id),
-                    'last_sent': last_sent,
-                    'time_passed': time_passed
-                })
-        except Exception:
-            continue
-
-    return cooldowns
-
-def is_account_on_cooldown(account_id, channel_id, interval):
-    """检查账号在指定频道是否在冷却中"""
-    key = (int(account_id), str(channel_id))
-
-    last = account_last_sent.get(key, 0)
-    time_passed = time.time() - last
-    is_cooldown = time_passed < interval
-
-    if is_cooldown:
-        logger.info(f"❄️ [冷却中] 账号ID:{account_id} 频道:{channel_id} | 剩余: {interval - time_passed:.1f}秒")
-
-    return is_cooldown
-
-def set_account_cooldown(account_id, channel_id):
-    """设置账号在指定频道的冷却时间"""
-    key = (int(account_id), str(channel_id))
-    account_last_sent[key] = time.time()
-    logger.info(f"🔥 [设置冷却] 账号ID:{account_id} 频道:{channel_id} | Key: {key}")
-
-def cleanup_expired_cooldowns():
-    """清理过期的冷却状态"""
-    current_time = time.time()
-    expired_keys = []
-    for key, last_sent in account_last_sent.items():
-        # 如果冷却时间超过24小时，清理掉（防止内存泄漏）
-        if current_time - last_sent > 86400:  # 24小时
-            expired_keys.append(key)
+# 多账号机器人列表与冷却状态放在 bot_state，Web 进程无需导入 discord.py 即可访问
+try:
+    from bot_state import (
+        bot_clients, bot_tasks, account_last_sent, get_all_cooldowns,
+        is_account_on_cooldown, set_account_cooldown, cleanup_expired_cooldowns
+    )
+except ImportError:
+    from .bot_state import (
+        bot_clients, bot_tasks, account_last_sent, get_all_cooldowns,
+        is_account_on_cooldown, set_account_cooldown, cleanup_expired_cooldowns
+    )
 
-    for key in expired_keys:
-        del account_last_sent[key]
-        logger.debug(f"清理过期冷却: {key}")
 
-    if expired_keys:
-        logger.info(f"清理了 {len(expired_keys)} 个过期的冷却状态")
+async def mark_message_as_processed(message_id):
+    """检查消息是否已处理（原子操作）
 
-def mark_message_as_processed(message_id):
-    """检查消息是否已处理（原子操作）"""
+    写入排在数据库单写线程的队列中（抓取入库时可能要等一批写操作提交），放到线程池执行，不阻塞事件循环
+    """
     try:
         from database import db
-        with db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO processed_messages (message_id) VALUES (?)", (str(message_id),))
-            conn.commit()
+        await asyncio.get_event_loop().run_in_executor(None, db.run_write, lambda cursor: cursor.execute(
+            "INSERT INTO processed_messages (message_id) VALUES (?)", (str(message_id),)
+        ))
         return True  # 抢锁成功
     except sqlite3.IntegrityError:
         return False  # 已经被其他Bot抢锁
@@ -689,7 +634,8 @@ class DiscordBotClient(discord.Client):
                                     if pid and indexes:
                                         image_path_map = {}
                                         try:
-                                            product_images = db.get_product_images(pid)
+                                            # 只取路径，不反序列化特征向量
+                                            product_images = db.get_product_image_rows([pid]).get(pid, [])
                                             image_path_map = {
                                                 img.get('image_index'): img.get('image_path')
                                                 for img in product_images
@@ -1248,7 +1194,7 @@ class DiscordBotClient(discord.Client):
         # 【核心修复】确认我有资格处理后，再抢全局锁
         # =================================================================
         try:
-            if not mark_message_as_processed(message.id):
+            if not await mark_message_as_processed(message.id):
                 logger.info(f"消息 {message.id} 已被其他(合法的)Bot处理，跳过")
                 return
         except Exception as e:
@@ -1327,15 +1273,9 @@ class DiscordBotClient(discord.Client):
                 logger.error("图片下载失败，已达到最大重试次数")
                 return  # 静默失败，不发送错误消息
 
-            # 【新增】AI并发限制：最多同时2个AI推理任务
-            # 使用Semaphore控制并发，防止CPU饱和导致Flask主线程阻塞
-            async with ai_concurrency_limit:
-                logger.debug(f"🔒 获取AI并发锁，当前等待队列: {ai_concurrency_limit._value}")
-
-                # 调用 DINOv2 服务识别图片，不使用店铺过滤（所有用户都能识别所有商品）
-                result = await self.recognize_image(image_data, user_shops=None)
-
-                logger.debug(f"🔓 释放AI并发锁")
+            # AI 并发由后端推理调度器统一控制（搜索请求为交互优先级，优先于抓取入库）
+            # 调用 DINOv2 服务识别图片，不使用店铺过滤（所有用户都能识别所有商品）
+            result = await self.recognize_image(image_data, user_shops=None)
 
             logger.debug(
                 f'图片识别结果: success={result.get("success") if result else False}, '
@@ -0,0 +1,75 @@
+import time
+import logging
+
+# 机器人运行时共享状态
+# 单独成模块，Web 进程可以直接引用而不必在启动时导入 discord.py；
+# bot.py 与 app.py 操作的是同一批列表/字典对象
+
+logger = logging.getLogger(__name__)
+
+# 全局变量用于多账号机器人管理
+bot_clients = []
+bot_tasks = []
+
+# 全局冷却管理器：(account_id, channel_id) -> timestamp (上次发送时间)
+account_last_sent = {}
+
+
+def get_all_cooldowns():
+    """获取所有活跃的冷却状态（供 API 查询）"""
+    current_time = time.time()
+    cooldowns = []
+
+    snapshot = account_last_sent.copy()
+
+    for key, last_sent in snapshot.items():
+        try:
+            acc_id, ch_id = key
+            time_passed = current_time - last_sent
+
+            if time_passed < 86400:
+                cooldowns.append({
+                    'account_id': int(acc_id),
+                    'channel_id': str(ch_id),
+                    'last_sent': last_sent,
+                    'time_passed': time_passed
+                })
+        except Exception:
+            continue
+
+    return cooldowns
+
+def is_account_on_cooldown(account_id, channel_id, interval):
+    """检查账号在指定频道是否在冷却中"""
+    key = (int(account_id), str(channel_id))
+
+    last = account_last_sent.get(key, 0)
+    time_passed = time.time() - last
+    is_cooldown = time_passed < interval
+
+    if is_cooldown:
+        logger.info(f"❄️ [冷却中] 账号ID:{account_id} 频道:{channel_id} | 剩余: {interval - time_passed:.1f}秒")
+
+    return is_cooldown
+
+def set_account_cooldown(account_id, channel_id):
+    """设置账号在指定频道的冷却时间"""
+    key = (int(account_id), str(channel_id))
+    account_last_sent[key] = time.time()
+    logger.info(f"🔥 [设置冷却] 账号ID:{account_id} 频道:{channel_id} | Key: {key}")
+
+def cleanup_expired_cooldowns():
+    """清理过期的冷却状态"""
+    current_time = time.time()
+    expired_keys = []
+    for key, last_sent in account_last_sent.items():
+        # 如果冷却时间超过24小时，清理掉（防止内存泄漏）
+        if current_time - last_sent > 86400:  # 24小时
+            expired_keys.append(key)
+
+    for key in expired_keys:
+        del account_last_sent[key]
+        logger.debug(f"清理过期冷却: {key}")
+
+    if expired_keys:
+        logger.info(f"清理了 {len(expired_keys)} 个过期的冷却状态")
@@ -0,0 +1,103 @@
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def estimate_size(obj: Any) -> int:
+    """粗略估算对象占用的内存字节数（用于缓存预算，不追求精确）"""
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes + 96
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(item) for item in obj)
+    return sys.getsizeof(obj)
+
+
+class BoundedLRUCache:
+    """
+    线程安全的 LRU 缓存
+    同时按估算字节数 (max_bytes) 和条目数 (max_entries) 限制容量，超出时淘汰最久未使用的条目，
+    并记录命中/未命中/淘汰次数供状态接口展示
+    """
+
+    def __init__(self, max_bytes: int = 0, max_entries: int = 0,
+                 size_of: Optional[Callable[[Any], int]] = None, name: str = 'cache'):
+        self.name = name
+        self.max_bytes = max(0, int(max_bytes or 0))
+        self.max_entries = max(0, int(max_entries or 0))
+        self._size_of = size_of or estimate_size
+        self._data: 'OrderedDict[Hashable, Any]' = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self._size_of(value)
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizes.pop(key, 0)
+                del self._data[key]
+            # 单个条目超过总预算时不缓存
+            if self.max_bytes and size > self.max_bytes:
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            self._evict_locked()
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._bytes -= self._sizes.pop(key, 0)
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def _evict_locked(self) -> None:
+        while self._data and (
+            (self.max_bytes and self._bytes > self.max_bytes)
+            or (self.max_entries and len(self._data) > self.max_entries)
+        ):
+            key, _ = self._data.popitem(last=False)
+            self._bytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,197 @@
+import os
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# HSV 直方图: H 18 档 x S 4 档 = 72 维
+SIGNATURE_BINS = (18, 4)
+SIGNATURE_DIM = SIGNATURE_BINS[0] * SIGNATURE_BINS[1]
+
+
+def compute_color_signature(bgr: np.ndarray) -> np.ndarray:
+    """计算颜色签名 (H+S 直方图，min-max 归一化到 0~1)，返回 72 维 float32 向量"""
+    import cv2
+    hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, list(SIGNATURE_BINS), [0, 180, 0, 256])
+    cv2.normalize(hist, hist, 0, 1, cv2.NORM_MINMAX)
+    return hist.reshape(-1).astype(np.float32)
+
+
+def signature_to_blob(signature: Optional[np.ndarray]) -> Optional[bytes]:
+    if signature is None:
+        return None
+    return np.asarray(signature, dtype=np.float32).reshape(-1).tobytes()
+
+
+def blob_to_signature(blob: Optional[bytes]) -> Optional[np.ndarray]:
+    if not blob or len(blob) != SIGNATURE_DIM * 4:
+        return None
+    return np.frombuffer(blob, dtype=np.float32).copy()
+
+
+class ColorSignatureIndex:
+    """
+    颜色签名内存索引
+    入库时计算好的 72 维颜色签名常驻在一个 (n, 72) 矩阵中，重排序时按图片ID取行，
+    不再对每个候选做磁盘读取和 JPEG 解码；图片文件丢失时依然可用。
+    老数据没有签名时，首次命中再从图片文件补算并写回数据库。
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((initial_capacity, SIGNATURE_DIM), dtype=np.float32)
+        self._row_of: Dict[int, int] = {}
+        self._free_rows: List[int] = []
+        self._size = 0
+        self._loaded = False
+        self.backfilled = 0
+        self.missing = 0
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                try:
+                    from database import db
+                except ImportError:
+                    from .database import db
+                count = 0
+                for image_id, signature in db.iter_image_color_signatures():
+                    self._set_locked(image_id, signature)
+                    count += 1
+                logger.info(f"🎨 颜色签名索引已加载: {count} 条")
+            except Exception as e:
+                logger.error(f"加载颜色签名失败: {e}")
+            self._loaded = True
+
+    def _set_locked(self, image_id: int, signature: np.ndarray):
+        row = self._row_of.get(image_id)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+            else:
+                if self._size >= self._matrix.shape[0]:
+                    grown = np.zeros((self._matrix.shape[0] * 2, SIGNATURE_DIM), dtype=np.float32)
+                    grown[:self._size] = self._matrix[:self._size]
+                    self._matrix = grown
+                row = self._size
+                self._size += 1
+            self._row_of[image_id] = row
+        self._matrix[row] = signature
+
+    def add(self, image_id: int, signature: Optional[np.ndarray]):
+        """入库后登记签名（索引尚未加载时只需等待首次加载从数据库读取）"""
+        if signature is None or not self._loaded:
+            return
+        with self._lock:
+            self._set_locked(int(image_id), np.asarray(signature, dtype=np.float32).reshape(-1))
+
+    def remove(self, image_ids: Iterable[int]):
+        with self._lock:
+            for image_id in image_ids:
+                row = self._row_of.pop(int(image_id), None)
+                if row is not None:
+                    self._free_rows.append(row)
+
+    def clear(self):
+        """重建索引后调用，下次使用时重新从数据库加载"""
+        with self._lock:
+            self._row_of.clear()
+            self._free_rows.clear()
+            self._size = 0
+            self._loaded = False
+
+    def _backfill(self, image_id: int, image_path: Optional[str]) -> Optional[np.ndarray]:
+        """旧数据没有签名时从图片文件补算一次并写回数据库"""
+        if not image_path or not os.path.exists(image_path):
+            return None
+        try:
+            import cv2
+            bgr = cv2.imread(image_path)
+            if bgr is None:
+                return None
+            signature = compute_color_signature(bgr)
+            try:
+                from database import db
+            except ImportError:
+                from .database import db
+            db.update_image_color_signature(image_id, signature)
+            with self._lock:
+                self._set_locked(image_id, signature)
+            self.backfilled += 1
+            return signature
+        except Exception as e:
+            logger.warning(f"补算颜色签名失败 {image_path}: {e}")
+            return None
+
+    def get_matrix(self, candidates: List[Tuple[int, Optional[str]]]) -> Tuple[np.ndarray, np.ndarray]:
+        """按候选顺序取签名
+
+        Args:
+            candidates: [(图片ID, 图片路径)]，路径只在需要补算时使用
+
+        Returns:
+            (签名矩阵 (n, 72), 可用掩码 (n,))，没有签名的行为 0 且掩码为 False
+        """
+        self._ensure_loaded()
+        n = len(candidates)
+        matrix = np.zeros((n, SIGNATURE_DIM), dtype=np.float32)
+        mask = np.zeros(n, dtype=bool)
+        pending = []
+
+        with self._lock:
+            for i, (image_id, image_path) in enumerate(candidates):
+                row = self._row_of.get(image_id) if image_id is not None else None
+                if row is not None:
+                    matrix[i] = self._matrix[row]
+                    mask[i] = True
+                else:
+                    pending.append((i, image_id, image_path))
+
+        for i, image_id, image_path in pending:
+            signature = self._backfill(image_id, image_path) if image_id is not None else None
+            if signature is not None:
+                matrix[i] = signature
+                mask[i] = True
+            else:
+                self.missing += 1
+
+        return matrix, mask
+
+    def get(self, image_id: int, image_path: Optional[str] = None) -> Optional[np.ndarray]:
+        matrix, mask = self.get_matrix([(image_id, image_path)])
+        return matrix[0] if mask[0] else None
+
+    def get_stats(self) -> Dict:
+        return {
+            'loaded': self._loaded,
+            'signatures': len(self._row_of),
+            'memory_mb': round(self._matrix.nbytes / (1024 * 1024), 2),
+            'backfilled': self.backfilled,
+            'missing': self.missing
+        }
+
+
+# 全局单例
+_color_index = None
+_color_index_lock = threading.Lock()
+
+
+def get_color_index() -> ColorSignatureIndex:
+    global _color_index
+    if _color_index is None:
+        with _color_index_lock:
+            if _color_index is None:
+                _color_index = ColorSignatureIndex()
+                try:
+                    from database import db
+                except ImportError:
+                    from .database import db
+                db.add_image_delete_listener(_color_index.remove)
+    return _color_index
@@ -53,6 +53,47 @@ class Config:
     YOLO_MODEL_PATH = 'yolov8s-world.pt'
     USE_YOLO_CROP = True
 
+    # 只从本地 Hugging Face 缓存加载模型，启动时不访问 Hub（本地没有缓存时自动回退为联网下载）
+    AI_LOCAL_FILES_ONLY = os.getenv('AI_LOCAL_FILES_ONLY', 'true').lower() == 'true'
+
+    # DINOv2 量化模式：'none'(float32) | 'int8_dynamic'(Linear 层 INT8 动态量化，仅 CPU)
+    # 开启前先运行 scripts/evaluate_inference_mode.py 确认 top-1 一致率和分数漂移达标
+    AI_QUANTIZATION = os.getenv('AI_QUANTIZATION', 'none').strip().lower()
+
+    # JPEG 解码时利用 DCT 缩放 (draft) 直接解码到接近该尺寸 (最长边像素)，0 表示完整解码
+    # 开启后缩放到推理尺寸时也使用 reducing_gap 快速缩小；两者都会改变输入像素，
+    # 现有索引由完整解码 + LANCZOS 生成，开启前先运行 evaluate_inference_mode.py --decode-max-size 896
+    AI_DECODE_MAX_SIZE = int(os.getenv('AI_DECODE_MAX_SIZE', '0'))
+    # DINOv2 预处理走张量快速路径 (一次 resize + 一次仿射归一化)，跳过通用的 AutoImageProcessor
+    # 与现有索引使用的 AutoImageProcessor 并非逐像素一致，开启前先运行 evaluate_inference_mode.py --fast-preprocess
+    AI_FAST_PREPROCESS = os.getenv('AI_FAST_PREPROCESS', 'false').lower() == 'true'
+
+    # DINOv2 编译模式：'none'(eager) | 'trace'(TorchScript) | 'compile'(torch.compile)，输入尺寸固定为 224
+    # 可用 scripts/benchmark_inference.py 对比各模式的首请求与稳态延迟
+    AI_COMPILE_MODE = os.getenv('AI_COMPILE_MODE', 'none').strip().lower()
+    # 推理精度：'fp32' | 'bf16' | 'fp16'，需要 CPU 支持 AVX512-BF16/AMX 等指令集，不支持时自动回退 fp32
+    # 启动时与 fp32 对照，余弦漂移超过 AI_PRECISION_MAX_DRIFT 也会回退；上线前用 evaluate_inference_mode.py --precision 评估
+    AI_PRECISION = os.getenv('AI_PRECISION', 'fp32').strip().lower()
+    AI_PRECISION_MAX_DRIFT = float(os.getenv('AI_PRECISION_MAX_DRIFT', '0.005'))
+    # 启动预热时用假数据跑检测器 + DINOv2 的次数
+    AI_WARMUP_RUNS = int(os.getenv('AI_WARMUP_RUNS', '2'))
+
+    # 自适应裁剪 (级联推理)：纯色背景、主体居中的商品图跳过 YOLO 直接中心裁剪
+    # 现有索引均由 YOLO 裁剪图生成，开启前先运行 scripts/evaluate_inference_mode.py --adaptive-crop 确认一致率达标
+    ADAPTIVE_CROP = os.getenv('ADAPTIVE_CROP', 'false').lower() == 'true'
+    ADAPTIVE_CROP_BORDER_STD = float(os.getenv('ADAPTIVE_CROP_BORDER_STD', '10'))  # 边框灰度标准差上限
+    ADAPTIVE_CROP_MIN_FILL = float(os.getenv('ADAPTIVE_CROP_MIN_FILL', '0.3'))  # 前景框至少占画面比例
+    ADAPTIVE_CROP_MIN_ASPECT = float(os.getenv('ADAPTIVE_CROP_MIN_ASPECT', '0.6'))  # 长宽比下限 (上限取倒数)
+
+    # YOLO 检测结果缓存的内存预算 (MB)，只缓存归一化裁剪框，超出按 LRU 淘汰
+    DETECTION_CACHE_MAX_MB = float(os.getenv('DETECTION_CACHE_MAX_MB', '8'))
+
+    # 混合重排序权重：综合分 = DINO * HYBRID_DINO_WEIGHT + 颜色 * HYBRID_COLOR_WEIGHT
+    # DINO 分高于 HYBRID_BYPASS_THRESHOLD 时直接采用 DINO 分
+    HYBRID_DINO_WEIGHT = float(os.getenv('HYBRID_DINO_WEIGHT', '0.70'))
+    HYBRID_COLOR_WEIGHT = float(os.getenv('HYBRID_COLOR_WEIGHT', '0.30'))
+    HYBRID_BYPASS_THRESHOLD = float(os.getenv('HYBRID_BYPASS_THRESHOLD', '0.85'))
+
     # === 多线程配置 (针对 10核 CPU 优化) ===
     # 商品信息抓取是IO密集型，可以开大
     SCRAPE_THREADS = int(os.getenv('SCRAPE_THREADS', '5'))
@@ -62,12 +103,14 @@ class Config:
 
     # AI 推理的并发控制 (CPU密集型)：
     # - AI_INTRA_THREADS：单个推理任务内部使用的 CPU 核心数
-    # - AI_MAX_WORKERS：同时跑多少个"图片特征提取任务"
+    # - AI_MAX_WORKERS：推理调度器的槽位数，同时跑多少个模型调用（机器人、网页、抓取共用）
+    # - AI_INTERACTIVE_RESERVED_SLOTS：预留给交互请求（搜索）的槽位数，批量抓取不能占用
     # 【优化建议】如果是 10核 CPU，单次搜索设为 4-6 可以显著加快单张图的搜索速度
     # 【修复】从6改为4，为Flask Web服务留出CPU核心，避免Bot和Web服务争抢资源导致UI卡死
     # 优化后策略：单张图搜索使用4核，批量抓取时2个Worker * 4核 = 8核，留2核给Flask
     AI_INTRA_THREADS = int(os.getenv('AI_INTRA_THREADS', '4'))
     AI_MAX_WORKERS = int(os.getenv('AI_MAX_WORKERS', '2'))
+    AI_INTERACTIVE_RESERVED_SLOTS = int(os.getenv('AI_INTERACTIVE_RESERVED_SLOTS', '0'))
 
     # 新的 save_product_images_unified 已不依赖该参数做图片特征线程池，保留字段主要用于兼容旧逻辑。
     FEATURE_EXTRACT_THREADS = int(os.getenv('FEATURE_EXTRACT_THREADS', '4'))
@@ -86,9 +129,35 @@ class Config:
     WEBSITE_FILTER_IMAGE_DIR = os.path.join(DATA_DIR, 'website_filter_images')
     LOG_DIR = os.path.join(DATA_DIR, 'logs')
     DATABASE_PATH = os.path.join(DATA_DIR, 'metadata.db')
+    # SQLite 连接池大小（连接复用，保留页缓存；池满时临时新建溢出连接）
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+    # SQLite 单写线程：写操作排队由一个线程合并提交，避免多线程争抢写锁 (database is locked)
+    DB_WRITER_ENABLED = os.getenv('DB_WRITER_ENABLED', 'true').lower() == 'true'
+    # 单写线程每个事务最多合并的写操作数
+    DB_WRITER_MAX_BATCH = int(os.getenv('DB_WRITER_MAX_BATCH', '64'))
+    # 抓取状态保存在内存中，修改后最多间隔该秒数合并写入数据库（开始/停止/完成立即写入）
+    SCRAPE_STATUS_FLUSH_INTERVAL = float(os.getenv('SCRAPE_STATUS_FLUSH_INTERVAL', '1.0'))
+    # 商品行内存缓存条目数（机器人命中的热门商品直接读内存，写入商品表时自动失效）
+    PRODUCT_CACHE_MAX_ENTRIES = int(os.getenv('PRODUCT_CACHE_MAX_ENTRIES', '5000'))
 
     FAISS_INDEX_FILE = os.path.join(DATA_DIR, 'faiss_index.bin')
     FAISS_ID_MAP_FILE = os.path.join(DATA_DIR, 'faiss_id_map.pkl')
+    # 可选的 PCA 降维投影 (如 384 -> 128)：先运行 scripts/train_projection.py 训练并查看召回率报告，
+    # 再设置 FAISS_PROJECTION_DIM；0 表示不降维。投影变化后索引会自动从数据库特征重建
+    FAISS_PROJECTION_FILE = os.path.join(DATA_DIR, 'faiss_projection.npz')
+    FAISS_PROJECTION_DIM = int(os.getenv('FAISS_PROJECTION_DIM', '0'))
+
+    # === Embedding 持久化缓存 (按图片内容哈希复用向量，重复转发的图片跳过推理) ===
+    EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() == 'true'
+    EMBEDDING_CACHE_FILE = os.path.join(DATA_DIR, 'embedding_cache.db')
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '50000'))
+
+    # === 感知哈希近重复索引 (入库/搜索前先查，近重复图片复用已有向量，只有新图片才跑模型) ===
+    PHASH_ENABLED = os.getenv('PHASH_ENABLED', 'true').lower() == 'true'
+    # 64 位 dHash 的最大汉明距离，越大越宽松 (建议 0~6)
+    PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', '4'))
+    # 哈希命中后还要求颜色签名相关系数不低于该值，避免把同款不同配色的图片当作重复
+    PHASH_MIN_COLOR_CORRELATION = float(os.getenv('PHASH_MIN_COLOR_CORRELATION', '0.95'))
 
     # === 网络 ===
     REQUEST_TIMEOUT = 30
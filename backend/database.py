@@ -1,17 +1,293 @@
 import sqlite3
 import numpy as np
 import os
+import re
+import base64
 import logging
 import json
+import threading
+import time
+import queue
+from collections import deque, namedtuple
+from concurrent.futures import Future
 from typing import List, Dict, Any, Optional, Tuple
 from contextlib import contextmanager
 try:
     from config import config
+    from cache_utils import BoundedLRUCache
 except ImportError:
     from .config import config
+    from .cache_utils import BoundedLRUCache
 
 logger = logging.getLogger(__name__)
 
+# 商品表中以 JSON 字符串保存的列，进入商品缓存时预先解析
+PRODUCT_JSON_FIELDS = ('custom_reply_images', 'custom_image_urls', 'uploaded_reply_images')
+
+_ITEM_ID_RE = re.compile(r'itemID=(\d+)')
+
+# 生成商品网站链接所需的配置（只读快照中的一项）
+WebsiteUrlTemplate = namedtuple('WebsiteUrlTemplate', 'id name display_name url_template badge_color channels')
+# 跨进程（独立运行的脚本等）修改网站配置后，最多延迟这么多秒检测到版本变化
+WEBSITE_SNAPSHOT_CHECK_INTERVAL = 2.0
+
+# 由 product_images 触发器维护的统计列
+PRODUCT_AGGREGATE_COLUMNS = ('image_count', 'image_indices')
+
+# 自适应裁剪跳过 YOLO 的中心裁剪记录在 crop_class 中，关闭自适应裁剪后重建时重新检测
+ADAPTIVE_CROP_CLASS = 'adaptive_center'
+
+# products_fts 全文索引的列；item_id 为空时从 product_url 的 itemID= 参数截取
+FTS_COLUMNS = ('title', 'english_title', 'item_id')
+# trigram 分词至少需要 3 个字符，更短的词（如两个字的中文词）退回 LIKE
+FTS_MIN_TERM_LENGTH = 3
+# 各列退回 LIKE 时的条件，item_id 沿用原来按 URL 参数匹配的写法
+_LIKE_CONDITIONS = {
+    'title': ("LOWER(p.title) LIKE ?", "%{}%"),
+    'english_title': ("LOWER(p.english_title) LIKE ?", "%{}%"),
+    'item_id': ("LOWER(p.product_url) LIKE ?", "%itemid={}%"),
+}
+_FTS_ITEM_ID_SQL = (
+    "COALESCE(NULLIF({row}.item_id, ''), CASE WHEN INSTR({row}.product_url, 'itemID=') > 0 "
+    "THEN SUBSTR({row}.product_url, INSTR({row}.product_url, 'itemID=') + 7) ELSE '' END)"
+)
+
+
+class SQLiteConnectionPool:
+    """
+    SQLite 连接池
+    每个连接只在创建时设置一次 PRAGMA，归还后保留页缓存和语句缓存，热点路径
+    （搜索结果补全、用户设置、抓取状态轮询）不再每次都新建连接。
+    连接归还时回滚未提交的事务，语义与原来"用完即关闭"一致；池满时短暂等待，
+    仍拿不到则临时新建一个溢出连接（用完关闭），嵌套获取连接不会死锁。
+    """
+
+    def __init__(self, db_path: str, max_size: int = 8, wait_timeout: float = 2.0):
+        self.db_path = db_path
+        self.max_size = max(1, int(max_size))
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._idle: List[sqlite3.Connection] = []
+        self._pooled = 0  # 池内连接总数（空闲 + 借出）
+        self._pid = os.getpid()
+        self._stats = {'created': 0, 'reused': 0, 'overflow': 0, 'discarded': 0, 'waits': 0, 'wait_ms_total': 0.0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=60.0, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+
+        # 关键优化：开启 WAL 模式
+        conn.execute('PRAGMA journal_mode=WAL;')
+        conn.execute('PRAGMA synchronous=NORMAL;') # 稍微降低安全性以换取性能
+        conn.execute('PRAGMA cache_size=-64000;') # 64MB cache
+        return conn
+
+    def _reset_after_fork(self):
+        """子进程不能复用父进程的连接，直接丢弃（不关闭，避免影响父进程）"""
+        if self._pid != os.getpid():
+            self._idle = []
+            self._pooled = 0
+            self._pid = os.getpid()
+
+    def acquire(self) -> Tuple[sqlite3.Connection, bool]:
+        """借出连接，返回 (连接, 是否为池内连接)"""
+        with self._cond:
+            self._reset_after_fork()
+            if self._idle:
+                self._stats['reused'] += 1
+                return self._idle.pop(), True
+            if self._pooled < self.max_size:
+                self._pooled += 1
+                self._stats['created'] += 1
+                create_pooled = True
+            else:
+                create_pooled = False
+                self._stats['waits'] += 1
+                began = time.perf_counter()
+                self._cond.wait_for(lambda: self._idle, timeout=self.wait_timeout)
+                self._stats['wait_ms_total'] += (time.perf_counter() - began) * 1000
+                if self._idle:
+                    self._stats['reused'] += 1
+                    return self._idle.pop(), True
+                self._stats['overflow'] += 1
+
+        try:
+            return self._connect(), create_pooled
+        except Exception:
+            if create_pooled:
+                with self._cond:
+                    self._pooled -= 1
+                    self._stats['created'] -= 1
+                    self._cond.notify()
+            raise
+
+    def release(self, conn: sqlite3.Connection, pooled: bool, broken: bool = False):
+        """归还连接：回滚未提交事务；溢出连接或已损坏的连接直接关闭"""
+        if not broken:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.row_factory = sqlite3.Row
+            except sqlite3.Error:
+                broken = True
+
+        if not pooled or broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            if pooled:
+                with self._cond:
+                    self._pooled -= 1
+                    self._stats['discarded'] += 1
+                    self._cond.notify()
+            return
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            for conn in self._idle:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._pooled -= len(self._idle)
+            self._idle = []
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats['max_size'] = self.max_size
+            stats['pooled'] = self._pooled
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._pooled - len(self._idle)
+        acquisitions = stats['created'] + stats['reused'] + stats['overflow']
+        stats['reuse_rate'] = round(stats['reused'] / acquisitions, 4) if acquisitions else 0.0
+        stats['wait_ms_total'] = round(stats['wait_ms_total'], 1)
+        return stats
+
+
+class SQLiteWriter:
+    """
+    SQLite 单写线程
+    写操作以 job(cursor) 的形式排队，由独占一个连接的后台线程执行：队列中积压的写操作合并为一个事务，
+    每个操作用 SAVEPOINT 隔离（单个失败只回滚自己），提交后通过 Future 返回结果或异常。
+    请求线程、抓取线程池、机器人不再各自争抢 SQLite 写锁；读操作继续使用连接池。
+    """
+
+    def __init__(self, connect, max_batch: int = 64):
+        self._connect = connect
+        self.max_batch = max(1, int(max_batch))
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats = {'jobs': 0, 'failed': 0, 'transactions': 0, 'max_batch_seen': 0}
+        self._latencies = deque(maxlen=500)  # 入队到提交完成的耗时 (ms)
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # 子进程中父进程的写线程不存在，队列也不能沿用
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+            self._thread.start()
+
+    def in_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, job) -> Future:
+        """提交写操作 job(cursor)，不要在 job 内 commit"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((job, future, time.perf_counter()))
+        return future
+
+    def run_nested(self, job):
+        """写线程内嵌套的写操作：直接并入当前事务"""
+        return job(self._conn.cursor())
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    conn.isolation_level = None  # 事务由写线程显式控制
+                    self._conn = conn
+                self._execute_batch(conn, batch)
+            except Exception as e:
+                logger.error(f"SQLite 写线程执行失败: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+                    self._conn = None
+
+    def _execute_batch(self, conn: sqlite3.Connection, batch):
+        outcomes = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for job, future, queued_at in batch:
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    result = job(conn.cursor())
+                    conn.execute('RELEASE write_job')
+                    outcomes.append((future, queued_at, result, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    conn.execute('RELEASE write_job')
+                    outcomes.append((future, queued_at, None, e))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+        now = time.perf_counter()
+        self._stats['transactions'] += 1
+        self._stats['max_batch_seen'] = max(self._stats['max_batch_seen'], len(batch))
+        for future, queued_at, result, error in outcomes:
+            self._stats['jobs'] += 1
+            self._latencies.append((now - queued_at) * 1000)
+            if error is None:
+                future.set_result(result)
+            else:
+                self._stats['failed'] += 1
+                future.set_exception(error)
+
+    def get_stats(self) -> Dict:
+        latencies = sorted(self._latencies)
+        stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_batch'] = round(stats['jobs'] / stats['transactions'], 2) if stats['transactions'] else 0.0
+        stats['latency_ms_avg'] = round(sum(latencies) / len(latencies), 2) if latencies else 0.0
+        stats['latency_ms_p95'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2) if latencies else 0.0
+        return stats
+
+
 class Database:
     def __init__(self):
         # SQLite 数据库路径 (用于存储商品元数据和Discord账号信息)
@@ -20,6 +296,43 @@ class Database:
         # 确保数据目录存在
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
+        self._pool = SQLiteConnectionPool(self.db_path, max_size=getattr(config, 'DB_POOL_SIZE', 8))
+        # 单写线程（可通过 DB_WRITER_ENABLED=false 关闭，写操作退回连接池直接执行）
+        self._writer = None
+        if getattr(config, 'DB_WRITER_ENABLED', True):
+            self._writer = SQLiteWriter(self._pool._connect, max_batch=getattr(config, 'DB_WRITER_MAX_BATCH', 64))
+
+        # 商品行缓存：机器人命中的商品集中在少数热门商品上，行数据和解析好的 JSON 字段常驻内存，
+        # 所有写商品表的路径都会使对应条目失效
+        self._product_cache = BoundedLRUCache(
+            max_entries=getattr(config, 'PRODUCT_CACHE_MAX_ENTRIES', 5000), name='product_cache'
+        )
+        self._product_cache_generation = 0
+        self._product_cache_lock = threading.Lock()
+        # 商品变更监听者（如商品短语索引），在缓存失效时一并通知
+        self._product_change_listeners = []
+        # 图片删除监听者（颜色签名索引、感知哈希索引等内存索引），删除图片记录后通知
+        self._image_delete_listeners = []
+        # 商品列表总数缓存：(过滤条件, 参数) -> (时间, 总数)
+        self._product_count_cache = BoundedLRUCache(max_entries=256, name='product_count_cache')
+
+        # 网站链接配置快照：(版本号, WebsiteUrlTemplate 元组)，网站配置/频道绑定表变化时重建
+        self._website_snapshot = None
+        self._website_snapshot_checked = 0.0
+        self._website_snapshot_lock = threading.Lock()
+        self.website_snapshot_rebuilds = 0
+
+        # 抓取状态内存副本（首次访问时从数据库加载），修改后由定时器合并落库
+        self._scrape_status = None
+        self._scrape_status_dirty = False
+        self._scrape_status_timer = None
+        self._scrape_status_lock = threading.RLock()
+        self._scrape_status_flush_lock = threading.Lock()
+        self._scrape_status_flushes = 0
+
+        # SQLite 不支持 FTS5 trigram (低于 3.34) 时为 False，文字搜索退回 LIKE
+        self.fts_enabled = False
+
         # 初始化 SQLite 数据库
         self.init_sqlite_database()
 
@@ -169,6 +482,25 @@ class Database:
                 )
             ''')
 
+            try:
+                cursor.execute('ALTER TABLE product_images ADD COLUMN color_signature BLOB')  # 72维 float32 颜色签名 (HSV 直方图)，重排序用
+            except sqlite3.OperationalError:
+                pass  # 字段已存在
+
+            # 入库时选定的裁剪框 (归一化坐标 JSON，NULL 框表示中心裁剪)、检测类别和置信度；重新提取特征时直接复用
+            for column_def in ('crop_box TEXT', 'crop_class TEXT', 'crop_confidence REAL'):
+                try:
+                    cursor.execute(f'ALTER TABLE product_images ADD COLUMN {column_def}')
+                except sqlite3.OperationalError:
+                    pass  # 字段已存在
+
+            try:
+                cursor.execute('ALTER TABLE product_images ADD COLUMN phash INTEGER')  # 64位感知哈希 (有符号存储)，入库前查近重复
+            except sqlite3.OperationalError:
+                pass  # 字段已存在
+
+            self._init_product_image_aggregates(cursor)
+
             # 创建用户表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -485,6 +817,8 @@ class Database:
                 )
             ''')
 
+            self._init_website_url_versioning(cursor)
+
             # 创建系统公告表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS system_announcements (
@@ -671,41 +1005,176 @@ class Database:
                 VALUES (1, 3.0, 8.0)
             ''')
 
+            self.fts_enabled = self._init_products_fts(cursor)
+
             conn.commit()
 
+    def _init_website_url_versioning(self, cursor):
+        """网站配置与频道绑定的版本号，由触发器在表变化时递增，供链接配置快照判断是否需要重建"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS data_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('website_urls', 0)")
+        bump_sql = "UPDATE data_versions SET version = version + 1 WHERE name = 'website_urls';"
+        triggers = {
+            'website_configs_version_ai': 'AFTER INSERT ON website_configs',
+            'website_configs_version_ad': 'AFTER DELETE ON website_configs',
+            'website_configs_version_au': 'AFTER UPDATE OF name, display_name, url_template, badge_color ON website_configs',
+            'website_channel_bindings_version_ai': 'AFTER INSERT ON website_channel_bindings',
+            'website_channel_bindings_version_ad': 'AFTER DELETE ON website_channel_bindings',
+            'website_channel_bindings_version_au': 'AFTER UPDATE ON website_channel_bindings',
+        }
+        for name, event in triggers.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {bump_sql} END')
+
+    def _init_product_image_aggregates(self, cursor):
+        """products.image_count / image_indices 由 product_images 触发器维护，商品列表不再 JOIN + GROUP BY"""
+        added = False
+        for column_def in ('image_count INTEGER DEFAULT 0', 'image_indices TEXT'):
+            try:
+                cursor.execute(f'ALTER TABLE products ADD COLUMN {column_def}')
+                added = True
+            except sqlite3.OperationalError:
+                pass  # 字段已存在
+
+        refresh_sql = '''
+            UPDATE products SET
+                image_count = (SELECT COUNT(*) FROM product_images WHERE product_id = {pid}),
+                image_indices = (
+                    SELECT GROUP_CONCAT(image_index) FROM (
+                        SELECT image_index FROM product_images WHERE product_id = {pid} ORDER BY image_index
+                    )
+                )
+            WHERE id = {pid};
+        '''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS product_images_agg_ai AFTER INSERT ON product_images BEGIN
+                {refresh_sql.format(pid='new.product_id')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS product_images_agg_ad AFTER DELETE ON product_images BEGIN
+                {refresh_sql.format(pid='old.product_id')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS product_images_agg_au
+            AFTER UPDATE OF product_id, image_index ON product_images BEGIN
+                {refresh_sql.format(pid='old.product_id')}
+                {refresh_sql.format(pid='new.product_id')}
+            END
+        ''')
+
+        if added:
+            cursor.execute(refresh_sql.format(pid='products.id'))
+            logger.info("🧮 已回填商品图片数量统计列")
+
+        # 商品列表按 (created_at, id) 做游标分页
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_created_id ON products(created_at, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_shop_created_id ON products(shop_name, created_at, id)')
+
+    def _init_products_fts(self, cursor) -> bool:
+        """创建商品标题全文索引 (FTS5 trigram，支持中文子串)，由触发器与 products 表保持同步"""
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts
+                USING fts5(title, english_title, item_id, tokenize='trigram')
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite 不支持 FTS5 trigram ({sqlite3.sqlite_version})，文字搜索使用 LIKE: {e}")
+            return False
+
+        new_item_id = _FTS_ITEM_ID_SQL.format(row='new')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, title, english_title, item_id)
+                VALUES (new.id, COALESCE(new.title, ''), COALESCE(new.english_title, ''), {new_item_id});
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+                DELETE FROM products_fts WHERE rowid = old.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS products_fts_au
+            AFTER UPDATE OF title, english_title, item_id, product_url ON products BEGIN
+                DELETE FROM products_fts WHERE rowid = old.id;
+                INSERT INTO products_fts (rowid, title, english_title, item_id)
+                VALUES (new.id, COALESCE(new.title, ''), COALESCE(new.english_title, ''), {new_item_id});
+            END
+        ''')
+
+        # 首次创建（或索引与商品表不一致）时从现有商品回填
+        cursor.execute("SELECT COUNT(*) FROM products")
+        product_count = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM products_fts")
+        if cursor.fetchone()[0] != product_count:
+            cursor.execute("DELETE FROM products_fts")
+            cursor.execute(f'''
+                INSERT INTO products_fts (rowid, title, english_title, item_id)
+                SELECT id, COALESCE(title, ''), COALESCE(english_title, ''), {_FTS_ITEM_ID_SQL.format(row='products')}
+                FROM products
+            ''')
+            logger.info(f"🔎 商品全文索引已重建: {product_count} 条")
+        return True
+
     def cleanup_processed_messages(self):
         """清理旧的消息处理记录，只保留最近1小时的记录"""
         try:
-            with self.get_connection() as conn:
-                conn.execute("DELETE FROM processed_messages WHERE processed_at < datetime('now', '-1 hour')")
-                conn.commit()
+            self.run_write(lambda cursor: cursor.execute(
+                "DELETE FROM processed_messages WHERE processed_at < datetime('now', '-1 hour')"
+            ))
         except Exception as e:
             logger.error(f"清理消息记录失败: {e}")
 
 
     @contextmanager
     def get_connection(self):
-        """获取 SQLite 数据库连接的上下文管理器"""
+        """从连接池借出 SQLite 连接的上下文管理器（PRAGMA 只在建连时设置一次）"""
         conn = None
+        pooled = False
+        broken = False
         try:
-            conn = sqlite3.connect(self.db_path, timeout=60.0)
-            conn.row_factory = sqlite3.Row
-
-            # 关键优化：开启 WAL 模式
-            conn.execute('PRAGMA journal_mode=WAL;')
-            conn.execute('PRAGMA synchronous=NORMAL;') # 稍微降低安全性以换取性能
-            conn.execute('PRAGMA cache_size=-64000;') # 64MB cache
-
+            conn, pooled = self._pool.acquire()
             yield conn
         except sqlite3.IntegrityError:
             # 这是一个逻辑控制信号（如唯一性约束），直接抛出给上层处理，不记录为连接错误
             raise
         except Exception as e:
+            # 连接级错误（文件损坏、连接被关闭等）的连接不再放回池中
+            broken = isinstance(e, (sqlite3.DatabaseError, sqlite3.ProgrammingError)) and \
+                not isinstance(e, sqlite3.OperationalError)
             logger.error("数据库连接失败: %s", str(e))
             raise
         finally:
             if conn:
-                conn.close()
+                self._pool.release(conn, pooled, broken)
+
+    def get_pool_stats(self) -> Dict:
+        """连接池复用统计"""
+        return self._pool.get_stats()
+
+    def run_write(self, job):
+        """执行写操作 job(cursor) 并返回其结果：交给单写线程与其他写操作合并提交，异常原样抛出
+
+        job 内不要 commit；在写线程内嵌套调用时并入当前事务，写线程未启用时用连接池连接执行并提交。
+        """
+        writer = self._writer
+        if writer is not None and writer.in_writer_thread():
+            return writer.run_nested(job)
+        if writer is None:
+            with self.get_connection() as conn:
+                result = job(conn.cursor())
+                conn.commit()
+                return result
+        return writer.submit(job).result()
+
+    def get_writer_stats(self) -> Dict:
+        return self._writer.get_stats() if self._writer else {'enabled': False}
 
     def execute_query(self, query: str, params: tuple = None, fetch: bool = True) -> List[Dict]:
         """执行查询并返回结果"""
@@ -721,8 +1190,10 @@ class Database:
 
     def insert_product(self, product_data: Dict) -> int:
         """插入商品信息"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        def job(cursor):
+            # INSERT OR REPLACE 会删除同 URL 的旧行，旧 ID 的缓存也要失效
+            cursor.execute("SELECT id FROM products WHERE product_url = ?", (product_data['product_url'],))
+            replaced = [row['id'] for row in cursor.fetchall()]
             cursor.execute('''
                 INSERT OR REPLACE INTO products
                 (product_url, title, description, english_title, cnfans_url, acbuy_url, shop_name, ruleEnabled)
@@ -738,35 +1209,261 @@ class Database:
                 product_data.get('ruleEnabled', True)
             ))
             product_id = cursor.lastrowid
-            conn.commit()
-            return product_id
+            if replaced and self.fts_enabled:
+                # REPLACE 删除旧行时不会触发 DELETE 触发器 (recursive_triggers 关闭)，手动清理
+                self._fetch_in(cursor, "DELETE FROM products_fts WHERE rowid IN ({placeholders})",
+                               [pid for pid in replaced if pid != product_id])
+            return product_id, replaced
+
+        product_id, replaced = self.run_write(job)
+        self.invalidate_product_cache(replaced + [product_id])
+        return product_id
+
+    @staticmethod
+    def _crop_to_columns(crop: Optional[Dict]) -> Tuple[Optional[str], Optional[str], Optional[float]]:
+        """裁剪信息 -> (crop_box, crop_class, crop_confidence) 列值；中心裁剪记为 'center'"""
+        if not crop:
+            return None, None, None
+        box = crop.get('box')
+        box_json = json.dumps([round(float(v), 6) for v in box]) if box else 'center'
+        if crop.get('policy') == 'center':
+            return box_json, ADAPTIVE_CROP_CLASS, None
+        confidence = crop.get('confidence')
+        return box_json, crop.get('label'), float(confidence) if confidence is not None else None
+
+    @staticmethod
+    def parse_image_crop(row) -> Optional[Dict]:
+        """从 product_images 行解析已保存的裁剪信息，未保存时返回 None"""
+        try:
+            box_json = row['crop_box']
+        except (KeyError, IndexError):
+            return None
+        if not box_json:
+            return None
+        if row['crop_class'] == ADAPTIVE_CROP_CLASS:
+            return {'box': None, 'label': None, 'confidence': None, 'policy': 'center'}
+        box = None
+        if box_json != 'center':
+            try:
+                box = tuple(float(v) for v in json.loads(box_json))
+            except (ValueError, TypeError):
+                return None
+        return {'box': box, 'label': row['crop_class'], 'confidence': row['crop_confidence']}
 
-    def insert_image_record(self, product_id: int, image_path: str, image_index: int, features: np.ndarray = None) -> int:
-        """插入图像记录到数据库，返回记录ID供FAISS使用"""
+    def update_image_crop(self, image_id: int, crop: Dict) -> bool:
+        """保存图片的裁剪信息（旧数据首次重新提取特征时补写）"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+            box_json, label, confidence = self._crop_to_columns(crop)
+            if box_json is None:
+                return False
 
-                # 将特征向量序列化为字符串存储
-                features_str = None
-                if features is not None:
-                    import json
-                    features_str = json.dumps(features.tolist())
+            def job(cursor):
+                cursor.execute(
+                    "UPDATE product_images SET crop_box = ?, crop_class = ?, crop_confidence = ? WHERE id = ?",
+                    (box_json, label, confidence, image_id)
+                )
+                return cursor.rowcount > 0
 
-                cursor.execute('''
-                    INSERT INTO product_images
-                    (product_id, image_path, image_index, features)
-                    VALUES (?, ?, ?, ?)
-                ''', (product_id, image_path, image_index, features_str))
-                conn.commit()
-                record_id = cursor.lastrowid
-                logger.debug(f"图像记录插入成功: product_id={product_id}, image_index={image_index}, record_id={record_id}")
-                return record_id
+            return self.run_write(job)
+        except Exception as e:
+            logger.error(f"更新裁剪信息失败: {e}")
+            return False
+
+    def _image_record_params(self, product_id: int, image_path: str, image_index: int, features: np.ndarray = None,
+                             color_signature: np.ndarray = None, crop: Optional[Dict] = None,
+                             phash: Optional[int] = None) -> tuple:
+        """product_images 插入语句的参数"""
+        # 将特征向量序列化为字符串存储
+        features_str = None
+        if features is not None:
+            features_str = json.dumps(features.tolist())
+
+        signature_blob = None
+        if color_signature is not None:
+            signature_blob = np.asarray(color_signature, dtype=np.float32).reshape(-1).tobytes()
 
+        crop_box, crop_class, crop_confidence = self._crop_to_columns(crop)
+
+        # SQLite INTEGER 为有符号 64 位
+        if phash is not None and phash >= (1 << 63):
+            phash -= (1 << 64)
+
+        return (product_id, image_path, image_index, features_str, signature_blob, crop_box, crop_class, crop_confidence, phash)
+
+    _INSERT_IMAGE_SQL = '''
+        INSERT INTO product_images
+        (product_id, image_path, image_index, features, color_signature, crop_box, crop_class, crop_confidence, phash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def insert_image_record(self, product_id: int, image_path: str, image_index: int, features: np.ndarray = None,
+                            color_signature: np.ndarray = None, crop: Optional[Dict] = None,
+                            phash: Optional[int] = None) -> int:
+        """插入图像记录到数据库，返回记录ID供FAISS使用"""
+        params = self._image_record_params(
+            product_id, image_path, image_index, features, color_signature, crop, phash
+        )
+
+        def job(cursor):
+            cursor.execute(self._INSERT_IMAGE_SQL, params)
+            return cursor.lastrowid
+
+        try:
+            record_id = self.run_write(job)
+            logger.debug(f"图像记录插入成功: product_id={product_id}, image_index={image_index}, record_id={record_id}")
+            return record_id
         except Exception as e:
             logger.error(f"插入图像记录失败: {e}")
             raise e
 
+    def insert_image_records_bulk(self, product_id: int, rows: List[Dict]) -> List[int]:
+        """在一个事务内批量插入同一商品的图像记录，按 rows 顺序返回记录ID
+
+        Args:
+            rows: [{'image_path', 'image_index', 'features', 'color_signature', 'crop', 'phash'}, ...]，
+                  后四项可省略。任一行失败（如图片序号已存在）时整批回滚并抛出异常
+        """
+        if not rows:
+            return []
+        params = [
+            self._image_record_params(
+                product_id, row['image_path'], row['image_index'], row.get('features'),
+                row.get('color_signature'), row.get('crop'), row.get('phash')
+            )
+            for row in rows
+        ]
+
+        def job(cursor):
+            cursor.executemany(self._INSERT_IMAGE_SQL, params)
+            # (product_id, image_index) 唯一，提交前按序号取回新记录的ID
+            return {
+                r['image_index']: r['id']
+                for r in self._fetch_in(
+                    cursor,
+                    "SELECT id, image_index FROM product_images WHERE image_index IN ({placeholders}) AND product_id = ?",
+                    [row['image_index'] for row in rows],
+                    (product_id,)
+                )
+            }
+
+        try:
+            id_by_index = self.run_write(job)
+            logger.debug(f"批量插入图像记录: product_id={product_id}, 共 {len(rows)} 条")
+            return [id_by_index[row['image_index']] for row in rows]
+        except Exception as e:
+            logger.error(f"批量插入图像记录失败: {e}")
+            raise
+
+    def update_image_color_signature(self, image_id: int, color_signature: np.ndarray) -> bool:
+        """写入/更新图片的颜色签名"""
+        blob = np.asarray(color_signature, dtype=np.float32).reshape(-1).tobytes()
+
+        def job(cursor):
+            cursor.execute("UPDATE product_images SET color_signature = ? WHERE id = ?", (blob, image_id))
+            return cursor.rowcount > 0
+
+        try:
+            return self.run_write(job)
+        except Exception as e:
+            logger.error(f"更新颜色签名失败: {e}")
+            return False
+
+    def iter_image_color_signatures(self, batch_size: int = 5000):
+        """分批读取所有已存储的颜色签名，返回 (image_id, np.ndarray) 迭代器"""
+        last_id = 0
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, color_signature FROM product_images
+                    WHERE id > ? AND color_signature IS NOT NULL
+                    ORDER BY id LIMIT ?
+                ''', (last_id, batch_size))
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            for row in rows:
+                last_id = row['id']
+                blob = row['color_signature']
+                if blob and len(blob) % 4 == 0:
+                    yield row['id'], np.frombuffer(blob, dtype=np.float32)
+
+    def iter_image_phashes(self, batch_size: int = 5000):
+        """分批读取所有已存储的感知哈希，返回 (image_id, product_id, phash) 迭代器"""
+        last_id = 0
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, product_id, phash FROM product_images
+                    WHERE id > ? AND phash IS NOT NULL
+                    ORDER BY id LIMIT ?
+                ''', (last_id, batch_size))
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            for row in rows:
+                last_id = row['id']
+                yield row['id'], row['product_id'], row['phash']
+
+    def iter_product_titles(self, batch_size: int = 5000):
+        """分批读取所有商品标题，返回 (product_id, title, english_title) 迭代器"""
+        last_id = 0
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, title, english_title FROM products
+                    WHERE id > ?
+                    ORDER BY id LIMIT ?
+                ''', (last_id, batch_size))
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            for row in rows:
+                last_id = row['id']
+                yield row['id'], row['title'], row['english_title']
+
+    def get_image_embedding_records(self, image_ids: List[int]) -> Dict[int, Dict]:
+        """按图片ID取已保存的特征向量、颜色签名和裁剪信息（近重复图片复用，免去模型推理）
+
+        Returns:
+            {image_id: {'product_id', 'image_path', 'features', 'color_signature', 'crop'}}，
+            记录不存在或没有特征向量的ID不在结果中
+        """
+        if not image_ids:
+            return {}
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                placeholders = ','.join('?' * len(image_ids))
+                cursor.execute(f'''
+                    SELECT id, product_id, image_path, features, color_signature, crop_box, crop_class, crop_confidence
+                    FROM product_images
+                    WHERE id IN ({placeholders}) AND features IS NOT NULL
+                ''', list(image_ids))
+                records = {}
+                for row in cursor.fetchall():
+                    try:
+                        features = np.asarray(json.loads(row['features']), dtype=np.float32)
+                    except (ValueError, TypeError):
+                        continue
+                    signature = None
+                    blob = row['color_signature']
+                    if blob and len(blob) % 4 == 0:
+                        signature = np.frombuffer(blob, dtype=np.float32).copy()
+                    records[row['id']] = {
+                        'product_id': row['product_id'],
+                        'image_path': row['image_path'],
+                        'features': features,
+                        'color_signature': signature,
+                        'crop': self.parse_image_crop(row)
+                    }
+                return records
+        except Exception as e:
+            logger.error(f"读取图片特征记录失败: {e}")
+            return {}
+
     def search_similar_images(self, query_vector: np.ndarray, limit: int = 1,
                              threshold: float = 0.6, user_shops: Optional[List[str]] = None) -> List[Dict]:
         """使用FAISS搜索相似图像"""
@@ -803,6 +1500,9 @@ class Database:
 
             matched_results = []
 
+            # 所有候选的图片行和商品行一次性批量取回（2 次查询），不再逐条查询
+            hydrated = self.hydrate_image_hits([result['db_id'] for result in faiss_results])
+
             for result in faiss_results:
                 score = result['score']
                 db_id = result['db_id']
@@ -811,11 +1511,11 @@ class Database:
                     logger.debug(f"Processing result - db_id: {db_id}, score: {score}, threshold: {threshold}")
 
                 # 通过image_db_id获取产品信息
-                image_info = self.get_image_info_by_id(db_id)
+                image_info = hydrated['images'].get(db_id)
                 if image_info:
                     if debug_enabled:
                         logger.debug(f"Found image info for db_id {db_id}: product_id={image_info['product_id']}")
-                    product_info = self._get_product_info_by_id(image_info['product_id'])
+                    product_info = hydrated['products'].get(image_info['product_id'])
 
                     if product_info:
                         # 如果指定了用户店铺权限，进行过滤
@@ -834,7 +1534,8 @@ class Database:
                             **product_info,
                             'similarity': score,
                             'image_index': image_info['image_index'],
-                            'image_path': image_info['image_path']
+                            'image_path': image_info['image_path'],
+                            'image_db_id': db_id
                         }
                         matched_results.append(result_dict)
                         if debug_enabled:
@@ -856,15 +1557,16 @@ class Database:
                     logger.debug(f"No results above threshold {threshold}, returning best match")
                 best_result = faiss_results[0]
                 db_id = best_result['db_id']
-                image_info = self.get_image_info_by_id(db_id)
+                image_info = hydrated['images'].get(db_id)
                 if image_info:
-                    product_info = self._get_product_info_by_id(image_info['product_id'])
+                    product_info = hydrated['products'].get(image_info['product_id'])
                     if product_info:
                         result_dict = {
                             **product_info,
                             'similarity': best_result['score'],
                             'image_index': image_info['image_index'],
-                            'image_path': image_info['image_path']
+                            'image_path': image_info['image_path'],
+                            'image_db_id': db_id
                         }
                         matched_results.append(result_dict)
                         if debug_enabled:
@@ -896,11 +1598,272 @@ class Database:
 
     def _get_product_info_by_id(self, product_id: int) -> Optional[Dict]:
         """根据产品ID获取完整的产品信息"""
+        entry = self._get_product_entries([product_id]).get(product_id)
+        return dict(entry['row']) if entry else None
+
+    # === 商品缓存 ===
+
+    @staticmethod
+    def _parse_product_json(row: Dict) -> Dict[str, list]:
+        parsed = {}
+        for field in PRODUCT_JSON_FIELDS:
+            value = row.get(field)
+            try:
+                value = json.loads(value) if value else []
+            except (ValueError, TypeError):
+                value = []
+            parsed[field] = value if isinstance(value, list) else []
+        return parsed
+
+    def _get_product_entries(self, product_ids) -> Dict[int, Dict]:
+        """按ID取缓存条目 {'row': 商品行, 'json': 解析好的 JSON 字段}，未命中的一次批量查询补齐"""
+        entries = {}
+        missing = []
+        for pid in dict.fromkeys(product_ids):
+            if pid is None:
+                continue
+            entry = self._product_cache.get(pid)
+            if entry is None:
+                missing.append(pid)
+            else:
+                entries[pid] = entry
+        if not missing:
+            return entries
+
+        with self._product_cache_lock:
+            generation = self._product_cache_generation
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
+            rows = self._fetch_products_by_ids(conn.cursor(), missing)
+
+        fetched = {}
+        for pid, row in rows.items():
+            # 图片统计列随图片增删由触发器更新，不进入商品缓存
+            for column in PRODUCT_AGGREGATE_COLUMNS:
+                row.pop(column, None)
+            fetched[pid] = {'row': row, 'json': self._parse_product_json(row)}
+        with self._product_cache_lock:
+            # 查询期间有写入时不回填，避免把旧数据放回缓存
+            if generation == self._product_cache_generation:
+                for pid, entry in fetched.items():
+                    self._product_cache.put(pid, entry)
+        entries.update(fetched)
+        return entries
+
+    def invalidate_product_cache(self, product_ids=None):
+        """商品表写入后调用：使缓存失效并通知变更监听者；product_ids 为空时清空整个缓存"""
+        if product_ids is not None:
+            product_ids = list(product_ids)
+        with self._product_cache_lock:
+            self._product_cache_generation += 1
+            if product_ids is None:
+                self._product_cache.clear()
+            else:
+                for pid in product_ids:
+                    try:
+                        self._product_cache.invalidate(int(pid))
+                    except (TypeError, ValueError):
+                        continue
+        for listener in list(self._product_change_listeners):
+            try:
+                listener(product_ids)
+            except Exception as e:
+                logger.warning(f"商品变更通知失败: {e}")
+
+    def add_product_change_listener(self, listener):
+        """注册商品变更回调 listener(product_ids)，product_ids 为 None 表示全部变更"""
+        if listener not in self._product_change_listeners:
+            self._product_change_listeners.append(listener)
+
+    def add_image_delete_listener(self, listener):
+        """注册图片删除回调 listener(image_ids)"""
+        if listener not in self._image_delete_listeners:
+            self._image_delete_listeners.append(listener)
+
+    def _notify_images_deleted(self, image_ids):
+        image_ids = [image_id for image_id in image_ids if image_id is not None]
+        if not image_ids:
+            return
+        for listener in list(self._image_delete_listeners):
+            try:
+                listener(image_ids)
+            except Exception as e:
+                logger.warning(f"图片删除通知失败: {e}")
+
+    def get_product_cache_stats(self) -> Dict:
+        return self._product_cache.stats()
+
+    # === 批量补全 (hydration)：把一组图片/商品ID一次性转换成数据行 ===
+
+    _IN_CHUNK_SIZE = 900  # SQLite 单条语句参数个数上限为 999
+
+    @classmethod
+    def _fetch_in(cls, cursor, sql: str, ids, extra_params: tuple = ()) -> List[sqlite3.Row]:
+        """执行带 IN ({placeholders}) 的查询，ID 过多时分块"""
+        unique_ids = list(dict.fromkeys(i for i in ids if i is not None))
+        rows = []
+        for start in range(0, len(unique_ids), cls._IN_CHUNK_SIZE):
+            chunk = unique_ids[start:start + cls._IN_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(sql.format(placeholders=placeholders), (*chunk, *extra_params))
+            rows.extend(cursor.fetchall())
+        return rows
+
+    def _fetch_products_by_ids(self, cursor, product_ids) -> Dict[int, Dict]:
+        rows = self._fetch_in(cursor, "SELECT * FROM products WHERE id IN ({placeholders})", product_ids)
+        return {row['id']: dict(row) for row in rows}
+
+    def get_products_by_ids(self, product_ids: List[int]) -> Dict[int, Dict]:
+        """批量获取商品行：{product_id: 商品信息}"""
+        if not product_ids:
+            return {}
+        try:
+            return {pid: dict(entry['row']) for pid, entry in self._get_product_entries(product_ids).items()}
+        except Exception as e:
+            logger.error(f"批量获取商品信息失败: {e}")
+            return {}
+
+    def get_product_json_fields(self, product_ids: List[int]) -> Dict[int, Dict[str, list]]:
+        """批量获取商品已解析的 JSON 字段 (custom_reply_images / custom_image_urls / uploaded_reply_images)"""
+        if not product_ids:
+            return {}
+        try:
+            return {
+                pid: {field: list(values) for field, values in entry['json'].items()}
+                for pid, entry in self._get_product_entries(product_ids).items()
+            }
+        except Exception as e:
+            logger.error(f"获取商品回复配置失败: {e}")
+            return {}
+
+    def get_product_image_rows(self, product_ids: List[int]) -> Dict[int, List[Dict]]:
+        """批量获取商品的图片行（不含特征向量），按 image_index 排序
+
+        Returns:
+            {product_id: [{'id', 'image_index', 'image_path'}, ...]}，没有图片的商品为空列表
+        """
+        result = {pid: [] for pid in product_ids if pid is not None}
+        if not result:
+            return {}
+        try:
+            with self.get_connection() as conn:
+                rows = self._fetch_in(conn.cursor(), '''
+                    SELECT id, product_id, image_index, image_path FROM product_images
+                    WHERE product_id IN ({placeholders})
+                    ORDER BY product_id, image_index
+                ''', list(result))
+            for row in rows:
+                result[row['product_id']].append({
+                    'id': row['id'],
+                    'image_index': row['image_index'],
+                    'image_path': row['image_path']
+                })
+            return result
+        except Exception as e:
+            logger.error(f"批量获取商品图片失败: {e}")
+            return {}
+
+    def hydrate_image_hits(self, image_ids: List[int]) -> Dict[str, Dict]:
+        """把向量检索命中的图片ID批量补全为图片行和商品行（图片行一次查询，商品行走商品缓存）
+
+        Returns:
+            {'images': {image_id: {'id', 'product_id', 'image_index', 'image_path'}},
+             'products': {product_id: 商品信息}}
+        """
+        hydrated = {'images': {}, 'products': {}}
+        if not image_ids:
+            return hydrated
+        try:
+            with self.get_connection() as conn:
+                rows = self._fetch_in(conn.cursor(), '''
+                    SELECT id, product_id, image_index, image_path FROM product_images
+                    WHERE id IN ({placeholders})
+                ''', image_ids)
+            hydrated['images'] = {row['id']: dict(row) for row in rows}
+            hydrated['products'] = self.get_products_by_ids([row['product_id'] for row in rows])
+        except Exception as e:
+            logger.error(f"批量补全检索结果失败: {e}")
+        return hydrated
+
+    # === 文字搜索 (FTS5) ===
+
+    @staticmethod
+    def _fts_query(terms, columns=FTS_COLUMNS) -> str:
+        """拼出 MATCH 表达式：每个词作为短语（trigram 下即子串匹配），多个词之间 OR"""
+        phrases = ' OR '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        return f"{{{' '.join(columns)}}} : ({phrases})"
+
+    def _use_fts(self, term: str) -> bool:
+        return self.fts_enabled and len(term) >= FTS_MIN_TERM_LENGTH
+
+    def _text_match_clause(self, terms, columns=FTS_COLUMNS) -> Tuple[str, List]:
+        """商品文字过滤条件 (别名 p)：长词走全文索引，短词退回 LIKE，多个词之间 OR"""
+        terms = [term.lower() for term in terms if term]
+        clauses, params = [], []
+        fts_terms = [term for term in terms if self._use_fts(term)]
+        if fts_terms:
+            clauses.append("p.id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)")
+            params.append(self._fts_query(fts_terms, columns))
+        for term in terms:
+            if term in fts_terms:
+                continue
+            for column in columns:
+                condition, pattern = _LIKE_CONDITIONS[column]
+                clauses.append(condition)
+                params.append(pattern.format(term))
+        if not clauses:
+            return "0", []
+        return f"({' OR '.join(clauses)})", params
+
+    def search_products_by_text(self, terms: List[str], limit: int, exclude_ids=None,
+                                select_columns: str = "p.*") -> List[sqlite3.Row]:
+        """按标题/英文标题查找包含任一词的商品
+
+        全文索引命中的结果按 BM25 相关度排序；不满 3 个字符的词走 LIKE，结果排在后面并按创建时间倒序。
+        """
+        terms = list(dict.fromkeys(term.lower() for term in terms if term))
+        if not terms or limit <= 0:
+            return []
+        columns = ('title', 'english_title')
+        exclude_ids = set(exclude_ids or [])
+        rows = []
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                fts_terms = [term for term in terms if self._use_fts(term)]
+                if fts_terms:
+                    exclude_sql = ""
+                    if exclude_ids:
+                        exclude_sql = f" AND p.id NOT IN ({','.join('?' * len(exclude_ids))})"
+                    cursor.execute(f'''
+                        SELECT {select_columns}
+                        FROM products_fts
+                        JOIN products p ON p.id = products_fts.rowid
+                        WHERE products_fts MATCH ?{exclude_sql}
+                        ORDER BY bm25(products_fts), p.created_at DESC
+                        LIMIT ?
+                    ''', (self._fts_query(fts_terms, columns), *exclude_ids, limit))
+                    rows = cursor.fetchall()
+
+                like_terms = [term for term in terms if term not in fts_terms]
+                remaining = limit - len(rows)
+                if like_terms and remaining > 0:
+                    skip_ids = exclude_ids | {row['id'] for row in rows}
+                    where_sql, params = self._text_match_clause(like_terms, columns)
+                    if skip_ids:
+                        where_sql += f" AND p.id NOT IN ({','.join('?' * len(skip_ids))})"
+                        params.extend(skip_ids)
+                    cursor.execute(f'''
+                        SELECT {select_columns}
+                        FROM products p
+                        WHERE {where_sql}
+                        ORDER BY p.created_at DESC
+                        LIMIT ?
+                    ''', (*params, remaining))
+                    rows.extend(cursor.fetchall())
+            return rows
+        except Exception as e:
+            logger.error(f"文字搜索商品失败: {e}")
+            return rows
 
     def get_indexed_product_ids(self) -> List[str]:
         """获取已建立索引的商品URL列表"""
@@ -993,11 +1956,13 @@ class Database:
                         logger.warning(f"删除商品图片文件失败: {e}")
 
             # 从 SQLite 删除
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+            def job(cursor):
                 cursor.execute("DELETE FROM product_images WHERE product_id = ?", (product_id,))
                 cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-                conn.commit()
+
+            self.run_write(job)
+            self.invalidate_product_cache([product_id])
+            self._notify_images_deleted(record['id'] for record in image_records)
 
             # 保存FAISS索引
             if image_records and engine:
@@ -1096,14 +2061,15 @@ class Database:
                     for record in image_records:
                         remove_file(record['path'])
 
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                existing_list = list(existing_ids)
-                for chunk in chunked(existing_list, 500):
+            def job(cursor):
+                for chunk in chunked(list(existing_ids), 500):
                     placeholders = ','.join(['?'] * len(chunk))
                     cursor.execute(f"DELETE FROM product_images WHERE product_id IN ({placeholders})", chunk)
                     cursor.execute(f"DELETE FROM products WHERE id IN ({placeholders})", chunk)
-                conn.commit()
+
+            self.run_write(job)
+            self.invalidate_product_cache(existing_ids)
+            self._notify_images_deleted(record['id'] for record in image_records)
 
             remaining_images = 0
             try:
@@ -1138,14 +2104,16 @@ class Database:
 
     def delete_image_record(self, image_id: int) -> bool:
         """根据图片ID删除图片记录（用于回滚操作）"""
+        def job(cursor):
+            cursor.execute("DELETE FROM product_images WHERE id = ?", (image_id,))
+            return cursor.rowcount > 0
+
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM product_images WHERE id = ?", (image_id,))
-                deleted = cursor.rowcount > 0
-                if deleted:
-                    logger.info(f"已删除图片记录: id={image_id}")
-                return deleted
+            deleted = self.run_write(job)
+            if deleted:
+                logger.info(f"已删除图片记录: id={image_id}")
+                self._notify_images_deleted([image_id])
+            return deleted
         except Exception as e:
             logger.error(f"删除图片记录失败: {e}")
             return False
@@ -1189,13 +2157,10 @@ class Database:
                     logger.warning(f"删除图片文件失败: {e}")
 
             # 从 SQLite 删除记录
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM product_images WHERE product_id = ? AND image_index = ?",
-                             (product_id, image_index))
-
-               
-                conn.commit()
+            self.run_write(lambda cursor: cursor.execute(
+                "DELETE FROM product_images WHERE product_id = ? AND image_index = ?", (product_id, image_index)
+            ))
+            self._notify_images_deleted([image_id])
 
             logger.info(f"图片删除成功: product_id={product_id}, image_index={image_index}")
             return True
@@ -1324,16 +2289,16 @@ class Database:
     def add_search_history(self, query_image_path: str, matched_product_id: int,
                           matched_image_index: int, similarity: float, threshold: float) -> bool:
         """添加搜索历史记录"""
+        def job(cursor):
+            cursor.execute('''
+                INSERT INTO search_history
+                (query_image_path, matched_product_id, matched_image_index, similarity, threshold)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (query_image_path, matched_product_id, matched_image_index, similarity, threshold))
+
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO search_history
-                    (query_image_path, matched_product_id, matched_image_index, similarity, threshold)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (query_image_path, matched_product_id, matched_image_index, similarity, threshold))
-                conn.commit()
-                return True
+            self.run_write(job)
+            return True
         except Exception as e:
             logger.error(f"添加搜索历史失败: {e}")
             return False
@@ -1639,16 +2604,18 @@ class Database:
 
     def update_product_title(self, product_id: int, title: str) -> bool:
         """更新商品标题"""
+        def job(cursor):
+            cursor.execute('''
+                UPDATE products
+                SET title = ?, updated_at = datetime('now')
+                WHERE id = ?
+            ''', (title, product_id))
+            return cursor.rowcount > 0
+
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE products
-                    SET title = ?, updated_at = datetime('now')
-                    WHERE id = ?
-                ''', (title, product_id))
-                conn.commit()
-                return cursor.rowcount > 0
+            updated = self.run_write(job)
+            self.invalidate_product_cache([product_id])
+            return updated
         except Exception as e:
             logger.error(f"更新商品标题失败: {e}")
             return False
@@ -1656,42 +2623,43 @@ class Database:
     def update_product(self, product_id: int, updates: Dict) -> bool:
         """更新商品信息（通用方法）"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-
-                # 构建动态更新语句
-                set_parts = []
-                params = []
-                allowed_fields = [
-                    'title', 'english_title', 'ruleEnabled',
-                    'custom_reply_text', 'custom_reply_images', 'custom_image_urls',
-                    'image_source', 'uploaded_reply_images', 'reply_scope'
-                ]
-
-                for field in allowed_fields:
-                    if field in updates:
-                        set_parts.append(f'{field} = ?')
-                        if (field == 'custom_reply_images' or field == 'custom_image_urls') and isinstance(updates[field], list):
-                            # 将图片索引或URL数组转换为JSON字符串
-                            params.append(json.dumps(updates[field]))
-                        else:
-                            params.append(updates[field])
+            # 构建动态更新语句
+            set_parts = []
+            params = []
+            allowed_fields = [
+                'title', 'english_title', 'ruleEnabled',
+                'custom_reply_text', 'custom_reply_images', 'custom_image_urls',
+                'image_source', 'uploaded_reply_images', 'reply_scope'
+            ]
+
+            for field in allowed_fields:
+                if field in updates:
+                    set_parts.append(f'{field} = ?')
+                    if (field == 'custom_reply_images' or field == 'custom_image_urls') and isinstance(updates[field], list):
+                        # 将图片索引或URL数组转换为JSON字符串
+                        params.append(json.dumps(updates[field]))
+                    else:
+                        params.append(updates[field])
 
-                if not set_parts:
-                    return False
+            if not set_parts:
+                return False
 
-                set_parts.append('updated_at = datetime(\'now\')')
+            set_parts.append('updated_at = datetime(\'now\')')
 
-                query = f'''
-                    UPDATE products
-                    SET {', '.join(set_parts)}
-                    WHERE id = ?
-                '''
-                params.append(product_id)
+            query = f'''
+                UPDATE products
+                SET {', '.join(set_parts)}
+                WHERE id = ?
+            '''
+            params.append(product_id)
 
+            def job(cursor):
                 cursor.execute(query, params)
-                conn.commit()
                 return cursor.rowcount > 0
+
+            updated = self.run_write(job)
+            self.invalidate_product_cache([product_id])
+            return updated
         except Exception as e:
             logger.error(f"更新商品失败: {e}")
             return False
@@ -1699,11 +2667,7 @@ class Database:
     def get_product_by_id(self, product_id: int) -> Optional[Dict]:
         """根据ID获取商品"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM products WHERE id = ?', (product_id,))
-                result = cursor.fetchone()
-                return dict(result) if result else None
+            return self._get_product_info_by_id(product_id)
         except Exception as e:
             logger.error(f"获取商品失败: {e}")
             return None
@@ -1795,38 +2759,38 @@ class Database:
 
     def increment_website_stats(self, website_id: int, has_text: bool, has_image: bool) -> bool:
         """增加网站回复统计"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                updates = ['stat_replies_total = stat_replies_total + 1']
-                if has_text:
-                    updates.append('stat_replies_text = stat_replies_text + 1')
-                if has_image:
-                    updates.append('stat_replies_image = stat_replies_image + 1')
+        updates = ['stat_replies_total = stat_replies_total + 1']
+        if has_text:
+            updates.append('stat_replies_text = stat_replies_text + 1')
+        if has_image:
+            updates.append('stat_replies_image = stat_replies_image + 1')
+        daily_text = 1 if has_text else 0
+        daily_image = 1 if has_image else 0
+
+        def job(cursor):
+            cursor.execute(f'''
+                UPDATE website_configs
+                SET {', '.join(updates)}
+                WHERE id = ?
+            ''', (website_id,))
+            cursor.execute('''
+                INSERT INTO website_reply_stats_daily (
+                    website_id,
+                    stat_date,
+                    stat_replies_total,
+                    stat_replies_text,
+                    stat_replies_image
+                )
+                VALUES (?, date('now','localtime'), 1, ?, ?)
+                ON CONFLICT(website_id, stat_date) DO UPDATE SET
+                    stat_replies_total = stat_replies_total + 1,
+                    stat_replies_text = stat_replies_text + excluded.stat_replies_text,
+                    stat_replies_image = stat_replies_image + excluded.stat_replies_image
+            ''', (website_id, daily_text, daily_image))
+            return cursor.rowcount > 0
 
-                cursor.execute(f'''
-                    UPDATE website_configs
-                    SET {', '.join(updates)}
-                    WHERE id = ?
-                ''', (website_id,))
-                daily_text = 1 if has_text else 0
-                daily_image = 1 if has_image else 0
-                cursor.execute('''
-                    INSERT INTO website_reply_stats_daily (
-                        website_id,
-                        stat_date,
-                        stat_replies_total,
-                        stat_replies_text,
-                        stat_replies_image
-                    )
-                    VALUES (?, date('now','localtime'), 1, ?, ?)
-                    ON CONFLICT(website_id, stat_date) DO UPDATE SET
-                        stat_replies_total = stat_replies_total + 1,
-                        stat_replies_text = stat_replies_text + excluded.stat_replies_text,
-                        stat_replies_image = stat_replies_image + excluded.stat_replies_image
-                ''', (website_id, daily_text, daily_image))
-                conn.commit()
-                return cursor.rowcount > 0
+        try:
+            return self.run_write(job)
         except Exception as e:
             logger.error(f"更新网站回复统计失败: {e}")
             return False
@@ -1841,6 +2805,7 @@ class Database:
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (name, display_name, url_template, id_pattern, badge_color, reply_template, image_similarity_threshold, blocked_role_ids, rotation_interval, rotation_enabled, message_filters))
                 conn.commit()
+                self._invalidate_website_snapshot()
                 return True
         except Exception as e:
             logger.error(f"添加网站配置失败: {e}")
@@ -1857,6 +2822,7 @@ class Database:
                     WHERE id = ?
                 ''', (name, display_name, url_template, id_pattern, badge_color, reply_template, image_similarity_threshold, blocked_role_ids, rotation_interval, rotation_enabled, message_filters, config_id))
                 conn.commit()
+                self._invalidate_website_snapshot()
                 return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"更新网站配置失败: {e}")
@@ -1869,6 +2835,7 @@ class Database:
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM website_configs WHERE id = ?', (config_id,))
                 conn.commit()
+                self._invalidate_website_snapshot()
                 return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"删除网站配置失败: {e}")
@@ -1906,6 +2873,7 @@ class Database:
                     VALUES (?, ?, ?)
                 ''', (website_id, channel_id, user_id))
                 conn.commit()
+                self._invalidate_website_snapshot()
                 return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"添加网站频道绑定失败: {e}")
@@ -1931,6 +2899,7 @@ class Database:
                     AND (user_id = ? OR user_id IS NULL)
                 ''', (website_id, channel_id, channel_id, channel_id, user_id))
                 conn.commit()
+                self._invalidate_website_snapshot()
                 return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"移除网站频道绑定失败: {e}")
@@ -1953,6 +2922,7 @@ class Database:
                     )
                 ''', (website_id, channel_id, channel_id, channel_id))
                 conn.commit()
+                self._invalidate_website_snapshot()
                 return cursor.rowcount > 0
         except Exception as e:
             logger.error(f"管理员移除网站频道绑定失败: {e}")
@@ -2039,31 +3009,80 @@ class Database:
             logger.error(f"获取已绑定频道ID列表失败: {e}")
             return set()
 
+    def _load_website_snapshot(self, cursor, version: int):
+        cursor.execute('''
+            SELECT id, name, display_name, url_template, badge_color
+            FROM website_configs ORDER BY created_at
+        ''')
+        config_rows = cursor.fetchall()
+        cursor.execute('SELECT website_id, channel_id FROM website_channel_bindings ORDER BY created_at')
+        channels: Dict[int, List[str]] = {}
+        for row in cursor.fetchall():
+            channels.setdefault(row['website_id'], []).append(row['channel_id'])
+        templates = tuple(
+            WebsiteUrlTemplate(row['id'], row['name'], row['display_name'], row['url_template'],
+                               row['badge_color'], tuple(channels.get(row['id'], ())))
+            for row in config_rows
+        )
+        self.website_snapshot_rebuilds += 1
+        return version, templates
+
+    def _website_url_configs(self) -> Tuple[WebsiteUrlTemplate, ...]:
+        """生成商品链接所需的网站配置与频道绑定（不可变快照，版本号变化时才重新读取）"""
+        snapshot = self._website_snapshot
+        if snapshot is not None and time.monotonic() - self._website_snapshot_checked < WEBSITE_SNAPSHOT_CHECK_INTERVAL:
+            return snapshot[1]
+        with self._website_snapshot_lock:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT version FROM data_versions WHERE name = 'website_urls'")
+                row = cursor.fetchone()
+                version = row[0] if row else 0
+                snapshot = self._website_snapshot
+                if snapshot is None or snapshot[0] != version:
+                    snapshot = self._load_website_snapshot(cursor, version)
+                    self._website_snapshot = snapshot
+            self._website_snapshot_checked = time.monotonic()
+        return snapshot[1]
+
+    def _invalidate_website_snapshot(self):
+        """本进程修改了网站配置/频道绑定：下次使用快照时立即检查版本号"""
+        self._website_snapshot_checked = 0.0
+
+    @staticmethod
+    def _fill_website_urls(website_configs, weidian_id: str) -> List[Dict]:
+        urls = []
+        for config in website_configs:
+            try:
+                # 替换URL模板中的{id}占位符
+                url = config.url_template.replace('{id}', weidian_id)
+                urls.append({
+                    'name': config.name,
+                    'display_name': config.display_name,
+                    'url': url,
+                    'badge_color': config.badge_color,
+                    'channels': list(config.channels)
+                })
+            except Exception as e:
+                logger.warning(f"生成网站URL失败 {config.name}: {e}")
+        return urls
+
     def generate_website_urls(self, weidian_id: str) -> List[Dict]:
-        """根据微店ID生成所有网站的URL"""
+        """根据微店ID生成所有网站的URL（内存中的模板替换，不查询数据库）"""
         try:
-            website_configs = self.get_website_configs()
-            urls = []
-
-            for config in website_configs:
-                try:
-                    # 替换URL模板中的{id}占位符
-                    url = config['url_template'].replace('{id}', weidian_id)
-                    urls.append({
-                        'name': config['name'],
-                        'display_name': config['display_name'],
-                        'url': url,
-                        'badge_color': config['badge_color'],
-                        'channels': self.get_website_channel_bindings(config['id'])
-                    })
-                except Exception as e:
-                    logger.warning(f"生成网站URL失败 {config['name']}: {e}")
-
-            return urls
+            return self._fill_website_urls(self._website_url_configs(), weidian_id)
         except Exception as e:
             logger.error(f"生成网站URL失败: {e}")
             return []
 
+    def get_website_snapshot_stats(self) -> Dict:
+        snapshot = self._website_snapshot
+        return {
+            'version': snapshot[0] if snapshot else None,
+            'websites': len(snapshot[1]) if snapshot else 0,
+            'rebuilds': self.website_snapshot_rebuilds
+        }
+
     # ===== 网站账号绑定方法 =====
 
     def add_website_account_binding(self, website_id: int, account_id: int, role: str, user_id: int) -> bool:
@@ -2407,14 +3426,19 @@ class Database:
                 cursor = conn.cursor()
                 # 删除没有对应商品的图片记录
                 cursor.execute("""
-                    DELETE FROM product_images
+                    SELECT id FROM product_images
                     WHERE product_id NOT IN (SELECT id FROM products)
                 """)
-                deleted_count = cursor.rowcount
+                orphan_ids = [row['id'] for row in cursor.fetchall()]
+                for start in range(0, len(orphan_ids), self._IN_CHUNK_SIZE):
+                    chunk = orphan_ids[start:start + self._IN_CHUNK_SIZE]
+                    cursor.execute(f"DELETE FROM product_images WHERE id IN ({','.join('?' * len(chunk))})", chunk)
                 conn.commit()
-                if deleted_count > 0:
-                    logger.info(f"清理了 {deleted_count} 条孤立的图片记录")
-                return deleted_count
+            deleted_count = len(orphan_ids)
+            if deleted_count > 0:
+                logger.info(f"清理了 {deleted_count} 条孤立的图片记录")
+                self._notify_images_deleted(orphan_ids)
+            return deleted_count
         except Exception as e:
             logger.error(f"清理孤立图片记录失败: {e}")
             return 0
@@ -2815,6 +3839,80 @@ class Database:
             logger.error(f"删除自定义回复内容失败: {e}")
             return False
 
+    def _keyword_clause(self, keyword: str, search_type: str) -> Tuple[str, List]:
+        """商品列表的关键词过滤条件：标题走全文索引；商品ID精确匹配，微店 itemID 精确或前缀匹配（不做子串匹配）"""
+        id_sql = "(CAST(p.id AS TEXT) = ? OR p.item_id = ? OR LOWER(p.product_url) LIKE ?)"
+        id_params = [keyword, keyword, f"%itemid={keyword.lower()}%"]
+        if search_type == 'id':
+            return id_sql, id_params
+        if search_type == 'keyword':
+            return self._text_match_clause([keyword], ('english_title',))
+        if search_type == 'chinese':
+            return self._text_match_clause([keyword], ('title',))
+        match_sql, match_params = self._text_match_clause([keyword], ('title', 'english_title'))
+        return f"({id_sql} OR {match_sql})", [*id_params, *match_params]
+
+    def _product_list_filter(
+        self,
+        user_shops: Optional[List[str]],
+        keyword: str = None,
+        search_type: str = 'all',
+        shop_name: str = None
+    ) -> Optional[Tuple[List[str], List]]:
+        """商品列表的过滤条件 (别名 p)；用户没有任何店铺权限时返回 None"""
+        where_clauses = []
+        params: List = []
+
+        if user_shops is not None:
+            if not isinstance(user_shops, list) or not user_shops:
+                return None
+            # 店铺ID -> 店铺名在同一条语句里解析，不再逐个店铺查询
+            placeholders = ','.join('?' * len(user_shops))
+            where_clauses.append(f"p.shop_name IN (SELECT name FROM shops WHERE shop_id IN ({placeholders}))")
+            params.extend(user_shops)
+
+        if shop_name and shop_name != '__ALL__':
+            where_clauses.append("p.shop_name = ?")
+            params.append(shop_name)
+
+        if keyword:
+            keyword = keyword.strip()
+        if keyword:
+            where_sql, where_params = self._keyword_clause(keyword, search_type)
+            where_clauses.append(where_sql)
+            params.extend(where_params)
+
+        return where_clauses, params
+
+    @staticmethod
+    def encode_page_cursor(created_at, product_id: int) -> str:
+        """商品列表游标：最后一条的 (created_at, id)"""
+        raw = json.dumps([created_at, product_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_page_cursor(token: str) -> Optional[Tuple[Any, int]]:
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            created_at, product_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            return created_at, int(product_id)
+        except Exception:
+            return None
+
+    _COUNT_CACHE_TTL = 30.0  # 列表总数缓存秒数，翻页时不再重复 COUNT(*)
+
+    def _count_products(self, cursor, where_sql: str, params: List) -> Tuple[int, bool]:
+        """过滤条件下的商品总数，返回 (总数, 是否为缓存的近似值)"""
+        key = (where_sql, tuple(params))
+        cached = self._product_count_cache.get(key)
+        now = time.monotonic()
+        if cached is not None and now - cached[0] < self._COUNT_CACHE_TTL:
+            return cached[1], True
+        cursor.execute(f"SELECT COUNT(*) FROM products p {where_sql}", params)
+        total = cursor.fetchone()[0]
+        self._product_count_cache.put(key, (now, total))
+        return total, False
+
     def get_products_by_user_shops(
         self,
         user_shops: List[str],
@@ -2822,88 +3920,56 @@ class Database:
         offset: int = 0,
         keyword: str = None,
         search_type: str = 'all',
-        shop_name: str = None
+        shop_name: str = None,
+        page_cursor: str = None
     ) -> Dict:
-        """根据用户店铺权限获取商品（支持分页与搜索过滤）"""
+        """根据用户店铺权限获取商品（支持分页与搜索过滤）
+
+        传入 page_cursor（上一页返回的 next_cursor）时按 (created_at, id) 游标翻页，忽略 offset，
+        深页不再扫描前面的全部行。图片数量与索引来自触发器维护的统计列，总数带短期缓存。
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
 
-                shop_names = None
-                if user_shops is not None:
-                    if not isinstance(user_shops, list):
-                        user_shops = []
-                    if not user_shops:
-                        return {'products': [], 'total': 0}
-
-                    shop_names = []
-                    for shop_id in user_shops:
-                        cursor.execute("SELECT name FROM shops WHERE shop_id = ?", (shop_id,))
-                        shop_row = cursor.fetchone()
-                        if shop_row:
-                            shop_names.append(shop_row[0])
-
-                    if not shop_names:
-                        return {'products': [], 'total': 0}
+                list_filter = self._product_list_filter(user_shops, keyword, search_type, shop_name)
+                if list_filter is None:
+                    return {'products': [], 'total': 0, 'next_cursor': None}
+                where_clauses, params = list_filter
+                filter_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
 
-                where_clauses = []
-                params: List = []
-
-                if shop_names is not None:
-                    placeholders = ','.join('?' * len(shop_names))
-                    where_clauses.append(f"p.shop_name IN ({placeholders})")
-                    params.extend(shop_names)
-
-                if shop_name and shop_name != '__ALL__':
-                    where_clauses.append("p.shop_name = ?")
-                    params.append(shop_name)
-
-                if keyword:
-                    keyword = keyword.strip()
-                if keyword:
-                    keyword_lower = keyword.lower()
-                    like = f"%{keyword_lower}%"
-
-                    if search_type == 'id':
-                        where_clauses.append("(CAST(p.id AS TEXT) = ? OR LOWER(p.product_url) LIKE ?)")
-                        params.extend([keyword, f"%itemid={keyword_lower}%"])
-                    elif search_type == 'keyword':
-                        where_clauses.append("LOWER(p.english_title) LIKE ?")
-                        params.append(like)
-                    elif search_type == 'chinese':
-                        where_clauses.append("LOWER(p.title) LIKE ?")
-                        params.append(like)
-                    else:
-                        where_clauses.append(
-                            "(CAST(p.id AS TEXT) = ? OR LOWER(p.title) LIKE ? OR LOWER(p.english_title) LIKE ? OR LOWER(p.product_url) LIKE ?)"
-                        )
-                        params.extend([keyword, like, like, f"%itemid={keyword_lower}%"])
-
-                where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+                page_clauses = list(where_clauses)
+                query_params = list(params)
+                position = self.decode_page_cursor(page_cursor) if page_cursor else None
+                if position is not None:
+                    page_clauses.append("(p.created_at, p.id) < (?, ?)")
+                    query_params.extend(position)
+                page_sql = f"WHERE {' AND '.join(page_clauses)}" if page_clauses else ""
 
                 query = f'''
-                    SELECT p.*,
-                           GROUP_CONCAT(pi.image_index) as image_indices,
-                           COUNT(pi.id) as image_count,
-                           p.custom_reply_text, p.custom_reply_images, p.custom_image_urls, p.image_source
+                    SELECT p.*
                     FROM products p
-                    LEFT JOIN product_images pi ON p.id = pi.product_id
-                    {where_sql}
-                    GROUP BY p.id
-                    ORDER BY p.created_at DESC
+                    {page_sql}
+                    ORDER BY p.created_at DESC, p.id DESC
                 '''
-
-                query_params = list(params)
                 if limit is not None and limit > 0:
-                    query += " LIMIT ? OFFSET ?"
-                    query_params.extend([limit, offset])
+                    query += " LIMIT ?"
+                    query_params.append(limit)
+                    if position is None and offset:
+                        query += " OFFSET ?"
+                        query_params.append(offset)
 
                 cursor.execute(query, query_params)
                 rows = cursor.fetchall()
 
-                count_query = f"SELECT COUNT(*) FROM products p {where_sql}"
-                cursor.execute(count_query, params)
-                total = cursor.fetchone()[0]
+                total, total_approximate = self._count_products(cursor, filter_sql, params)
+
+                next_cursor = None
+                if limit is not None and limit > 0 and len(rows) == limit:
+                    next_cursor = self.encode_page_cursor(rows[-1]['created_at'], rows[-1]['id'])
+
+                # 网站链接模板整页只取一次
+                website_configs = self._website_url_configs() if rows else []
 
                 products = []
                 for row in rows:
@@ -2913,6 +3979,7 @@ class Database:
                         prod['images'] = [f"/api/image/{prod['id']}/{idx}" for idx in image_indices]
                     else:
                         prod['images'] = []
+                    prod['image_count'] = prod.get('image_count') or 0
 
                     prod['weidianUrl'] = prod.get('product_url')
                     prod['englishTitle'] = prod.get('english_title') or ''
@@ -2942,28 +4009,26 @@ class Database:
                     except Exception:
                         prod['uploadedImages'] = []
 
-                    try:
-                        import re
-                        m = re.search(r'itemID=(\d+)', prod.get('product_url') or '')
-                        prod['weidianId'] = m.group(1) if m else ''
-                    except Exception:
-                        prod['weidianId'] = ''
+                    m = _ITEM_ID_RE.search(prod.get('product_url') or '')
+                    prod['weidianId'] = m.group(1) if m else ''
 
                     try:
-                        prod['websiteUrls'] = self.generate_website_urls(prod['weidianId']) if prod.get('weidianId') else []
+                        prod['websiteUrls'] = self._fill_website_urls(website_configs, prod['weidianId']) if prod.get('weidianId') else []
                     except Exception:
                         prod['websiteUrls'] = []
 
                     products.append(prod)
 
-                return {'products': products, 'total': total}
+                return {
+                    'products': products,
+                    'total': total,
+                    'total_approximate': total_approximate,
+                    'next_cursor': next_cursor
+                }
 
         except Exception as e:
-            print(f"DEBUG: Exception in get_products_by_user_shops: {type(e).__name__}: {e}")
-            import traceback
-            print(f"DEBUG: Full traceback: {traceback.format_exc()}")
             logger.error("获取用户商品失败: %s", str(e))
-            return {'products': [], 'total': 0}
+            return {'products': [], 'total': 0, 'next_cursor': None}
 
     def get_product_ids_by_user_shops(
         self,
@@ -2977,58 +4042,13 @@ class Database:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
 
-                shop_names = None
-                if user_shops is not None:
-                    if not isinstance(user_shops, list):
-                        user_shops = []
-                    if not user_shops:
-                        return []
-
-                    shop_names = []
-                    for shop_id in user_shops:
-                        cursor.execute("SELECT name FROM shops WHERE shop_id = ?", (shop_id,))
-                        shop_row = cursor.fetchone()
-                        if shop_row:
-                            shop_names.append(shop_row[0])
-
-                    if not shop_names:
-                        return []
-
-                where_clauses = []
-                params: List = []
-
-                if shop_names is not None:
-                    placeholders = ','.join('?' * len(shop_names))
-                    where_clauses.append(f"p.shop_name IN ({placeholders})")
-                    params.extend(shop_names)
-
-                if shop_name and shop_name != '__ALL__':
-                    where_clauses.append("p.shop_name = ?")
-                    params.append(shop_name)
-
-                if keyword:
-                    keyword = keyword.strip()
-                if keyword:
-                    keyword_lower = keyword.lower()
-                    like = f"%{keyword_lower}%"
-
-                    if search_type == 'id':
-                        where_clauses.append("(CAST(p.id AS TEXT) = ? OR LOWER(p.product_url) LIKE ?)")
-                        params.extend([keyword, f"%itemid={keyword_lower}%"])
-                    elif search_type == 'keyword':
-                        where_clauses.append("LOWER(p.english_title) LIKE ?")
-                        params.append(like)
-                    elif search_type == 'chinese':
-                        where_clauses.append("LOWER(p.title) LIKE ?")
-                        params.append(like)
-                    else:
-                        where_clauses.append(
-                            "(CAST(p.id AS TEXT) = ? OR LOWER(p.title) LIKE ? OR LOWER(p.english_title) LIKE ? OR LOWER(p.product_url) LIKE ?)"
-                        )
-                        params.extend([keyword, like, like, f"%itemid={keyword_lower}%"])
+                list_filter = self._product_list_filter(user_shops, keyword, search_type, shop_name)
+                if list_filter is None:
+                    return []
+                where_clauses, params = list_filter
 
                 where_sql = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
-                query = f"SELECT p.id FROM products p {where_sql} ORDER BY p.created_at DESC"
+                query = f"SELECT p.id FROM products p {where_sql} ORDER BY p.created_at DESC, p.id DESC"
 
                 cursor.execute(query, params)
                 rows = cursor.fetchall()
@@ -3436,169 +4456,203 @@ class Database:
             return False
 
     # ========== 抓取状态管理方法 ==========
+    # 抓取状态以内存为准（抓取线程每个商品都会读取），写入后按间隔合并落库，供崩溃恢复和重启后读取；
+    # 停止信号由 app.scrape_stop_event 在线程间传递，不再轮询数据库
+
+    _SCRAPE_CONTROL_FIELDS = ('is_scraping', 'stop_signal', 'completed')
+    _SCRAPE_COLUMNS = (
+        'is_scraping', 'stop_signal', 'current_shop_id', 'total', 'processed', 'success', 'failed',
+        'image_failed', 'index_failed', 'failed_items', 'progress', 'message', 'completed', 'thread_id', 'updated_at'
+    )
+
+    @staticmethod
+    def _default_scrape_status(message: str = '等待开始...') -> Dict:
+        return {
+            'is_scraping': False,
+            'stop_signal': False,
+            'current_shop_id': None,
+            'total': 0,
+            'processed': 0,
+            'success': 0,
+            'failed': 0,
+            'image_failed': 0,
+            'index_failed': 0,
+            'failed_items': [],
+            'progress': 0.0,
+            'message': message,
+            'completed': False,
+            'thread_id': None,
+            'updated_at': None
+        }
+
+    @staticmethod
+    def _copy_scrape_status(state: Dict) -> Dict:
+        status = dict(state)
+        status['failed_items'] = list(state.get('failed_items') or [])
+        return status
+
+    def _load_scrape_status_locked(self):
+        """首次访问时从数据库读取上次保存的抓取状态"""
+        if self._scrape_status is not None:
+            return
+        state = self._default_scrape_status()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM scrape_status WHERE id = 1')
+            row = cursor.fetchone()
+        if row:
+            failed_items_raw = row['failed_items'] if 'failed_items' in row.keys() else '[]'
+            try:
+                failed_items = json.loads(failed_items_raw) if failed_items_raw else []
+            except (TypeError, ValueError):
+                failed_items = []
+
+            state.update({
+                'id': row['id'],
+                'is_scraping': bool(row['is_scraping']),
+                'stop_signal': bool(row['stop_signal']),
+                'current_shop_id': row['current_shop_id'],
+                'total': row['total'] or 0,
+                'processed': row['processed'] or 0,
+                'success': row['success'] or 0,
+                'failed': (row['failed'] if 'failed' in row.keys() else 0) or 0,
+                'image_failed': (row['image_failed'] if 'image_failed' in row.keys() else 0) or 0,
+                'index_failed': (row['index_failed'] if 'index_failed' in row.keys() else 0) or 0,
+                'failed_items': failed_items,
+                'progress': row['progress'] or 0.0,
+                'message': row['message'] or '等待开始...',
+                'completed': bool(row['completed']),
+                'thread_id': row['thread_id'],
+                'updated_at': row['updated_at']
+            })
+        self._scrape_status = state
 
     def get_scrape_status(self) -> Dict:
-        """获取抓取状态"""
+        """获取抓取状态（内存快照，不查询数据库）"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM scrape_status WHERE id = 1')
-                row = cursor.fetchone()
-
-                if row:
-                    failed_items_raw = row['failed_items'] if 'failed_items' in row.keys() else '[]'
-                    try:
-                        failed_items = json.loads(failed_items_raw) if failed_items_raw else []
-                    except (TypeError, ValueError):
-                        failed_items = []
-
-                    return {
-                        'id': row['id'],
-                        'is_scraping': bool(row['is_scraping']),
-                        'stop_signal': bool(row['stop_signal']),
-                        'current_shop_id': row['current_shop_id'],
-                        'total': row['total'] or 0,
-                        'processed': row['processed'] or 0,
-                        'success': row['success'] or 0,
-                        'failed': (row['failed'] if 'failed' in row.keys() else 0) or 0,
-                        'image_failed': (row['image_failed'] if 'image_failed' in row.keys() else 0) or 0,
-                        'index_failed': (row['index_failed'] if 'index_failed' in row.keys() else 0) or 0,
-                        'failed_items': failed_items,
-                        'progress': row['progress'] or 0.0,
-                        'message': row['message'] or '等待开始...',
-                        'completed': bool(row['completed']),
-                        'thread_id': row['thread_id'],
-                        'updated_at': row['updated_at']
-                    }
-                else:
-                    # 如果没有记录，创建默认记录
-                    return self.reset_scrape_status()
+            with self._scrape_status_lock:
+                self._load_scrape_status_locked()
+                return self._copy_scrape_status(self._scrape_status)
 
         except Exception as e:
             logger.error(f"获取抓取状态失败: {e}")
-            return {
-                'is_scraping': False,
-                'stop_signal': False,
-                'current_shop_id': None,
-                'total': 0,
-                'processed': 0,
-                'success': 0,
-                'failed': 0,
-                'image_failed': 0,
-                'index_failed': 0,
-                'failed_items': [],
-                'progress': 0.0,
-                'message': '获取状态失败',
-                'completed': False,
-                'thread_id': None,
-                'updated_at': None
-            }
+            return self._default_scrape_status('获取状态失败')
 
     def update_scrape_status(self, **kwargs) -> bool:
-        """更新抓取状态"""
-        try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+        """更新抓取状态：立即更新内存，数据库按 SCRAPE_STATUS_FLUSH_INTERVAL 合并写入
 
-                # 构建更新语句
-                fields = []
-                values = []
-                for key, value in kwargs.items():
-                    if key in ['is_scraping', 'stop_signal', 'completed']:
-                        fields.append(f'{key} = ?')
-                        values.append(1 if value else 0)
-                    elif key in ['total', 'processed', 'success', 'failed', 'image_failed', 'index_failed']:
-                        fields.append(f'{key} = ?')
-                        values.append(int(value) if value is not None else 0)
-                    elif key == 'progress':
-                        fields.append(f'{key} = ?')
-                        values.append(float(value) if value is not None else 0.0)
-                    elif key == 'failed_items':
-                        fields.append('failed_items = ?')
-                        if value is None:
-                            values.append('[]')
-                        elif isinstance(value, str):
-                            values.append(value)
-                        else:
-                            values.append(json.dumps(value, ensure_ascii=False))
-                    elif key in ['current_shop_id', 'message', 'thread_id']:
-                        fields.append(f'{key} = ?')
-                        values.append(str(value) if value is not None else None)
-
-                if fields:
-                    fields.append('updated_at = CURRENT_TIMESTAMP')
-                    query = f'UPDATE scrape_status SET {", ".join(fields)} WHERE id = 1'
-                    cursor.execute(query, values)
-                    conn.commit()
-                    return cursor.rowcount > 0
+        开始/停止/完成等控制字段变化时立即落库。
+        """
+        try:
+            # 规范化字段值
+            changes = {}
+            for key, value in kwargs.items():
+                if key in ['is_scraping', 'stop_signal', 'completed']:
+                    changes[key] = bool(value)
+                elif key in ['total', 'processed', 'success', 'failed', 'image_failed', 'index_failed']:
+                    changes[key] = int(value) if value is not None else 0
+                elif key == 'progress':
+                    changes[key] = float(value) if value is not None else 0.0
+                elif key == 'failed_items':
+                    if value is None:
+                        changes[key] = []
+                    elif isinstance(value, str):
+                        try:
+                            changes[key] = json.loads(value) or []
+                        except (TypeError, ValueError):
+                            changes[key] = []
+                    else:
+                        changes[key] = list(value)
+                elif key in ['current_shop_id', 'message', 'thread_id']:
+                    changes[key] = str(value) if value is not None else None
 
+            if not changes:
                 return False
 
+            with self._scrape_status_lock:
+                self._load_scrape_status_locked()
+                state = self._scrape_status
+                flush_now = any(
+                    key in changes and changes[key] != state.get(key) for key in self._SCRAPE_CONTROL_FIELDS
+                )
+                state.update(changes)
+                state['updated_at'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+                self._scrape_status_dirty = True
+                if not flush_now:
+                    self._schedule_scrape_status_flush_locked()
+
+            if flush_now:
+                return self.flush_scrape_status()
+            return True
+
         except Exception as e:
             logger.error(f"更新抓取状态失败: {e}")
             return False
 
+    def _schedule_scrape_status_flush_locked(self):
+        if self._scrape_status_timer is not None:
+            return
+        interval = max(0.0, float(getattr(config, 'SCRAPE_STATUS_FLUSH_INTERVAL', 1.0)))
+        timer = threading.Timer(interval, self.flush_scrape_status)
+        timer.daemon = True
+        self._scrape_status_timer = timer
+        timer.start()
+
+    def flush_scrape_status(self) -> bool:
+        """把内存中的抓取状态写入数据库（没有未保存的修改时直接返回）"""
+        # 落库串行执行，保证后取的快照后写入
+        with self._scrape_status_flush_lock:
+            with self._scrape_status_lock:
+                if self._scrape_status_timer is not None:
+                    self._scrape_status_timer.cancel()
+                    self._scrape_status_timer = None
+                if not self._scrape_status_dirty or self._scrape_status is None:
+                    return True
+                state = self._scrape_status
+                values = [
+                    json.dumps(state['failed_items'], ensure_ascii=False) if key == 'failed_items'
+                    else (1 if state[key] else 0) if key in self._SCRAPE_CONTROL_FIELDS
+                    else state[key]
+                    for key in self._SCRAPE_COLUMNS
+                ]
+                self._scrape_status_dirty = False
+                self._scrape_status_flushes += 1
+
+            query = f'UPDATE scrape_status SET {", ".join(f"{key} = ?" for key in self._SCRAPE_COLUMNS)} WHERE id = 1'
+
+            def job(cursor):
+                cursor.execute(query, values)
+                return cursor.rowcount > 0
+
+            try:
+                return self.run_write(job)
+            except Exception as e:
+                logger.error(f"保存抓取状态失败: {e}")
+                with self._scrape_status_lock:
+                    self._scrape_status_dirty = True
+                    self._schedule_scrape_status_flush_locked()
+                return False
+
     def reset_scrape_status(self) -> Dict:
         """重置抓取状态"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE scrape_status SET
-                        is_scraping = 0,
-                        stop_signal = 0,
-                        current_shop_id = NULL,
-                        total = 0,
-                        processed = 0,
-                        success = 0,
-                        failed = 0,
-                        image_failed = 0,
-                        index_failed = 0,
-                        failed_items = '[]',
-                        progress = 0,
-                        message = '等待开始...',
-                        completed = 0,
-                        thread_id = NULL,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE id = 1
-                ''')
-                conn.commit()
-
-                return {
-                    'is_scraping': False,
-                    'stop_signal': False,
-                    'current_shop_id': None,
-                    'total': 0,
-                    'processed': 0,
-                    'success': 0,
-                    'failed': 0,
-                    'image_failed': 0,
-                    'index_failed': 0,
-                    'failed_items': [],
-                    'progress': 0.0,
-                    'message': '等待开始...',
-                    'completed': False,
-                    'thread_id': None,
-                    'updated_at': None
-                }
+            with self._scrape_status_lock:
+                self._scrape_status = self._default_scrape_status()
+                self._scrape_status_dirty = True
+                status = self._copy_scrape_status(self._scrape_status)
+            self.flush_scrape_status()
+            return status
 
         except Exception as e:
             logger.error(f"重置抓取状态失败: {e}")
+            return self._default_scrape_status('重置失败')
+
+    def get_scrape_status_stats(self) -> Dict:
+        with self._scrape_status_lock:
             return {
-                'is_scraping': False,
-                'stop_signal': False,
-                'current_shop_id': None,
-                'total': 0,
-                'processed': 0,
-                'success': 0,
-                'failed': 0,
-                'image_failed': 0,
-                'index_failed': 0,
-                'progress': 0.0,
-                'message': '重置失败',
-                'completed': False,
-                'thread_id': None,
-                'updated_at': None
+                'loaded': self._scrape_status is not None,
+                'dirty': self._scrape_status_dirty,
+                'flushes': self._scrape_status_flushes
             }
 
 # 全局数据库实例
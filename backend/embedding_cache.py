@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+import numpy as np
+try:
+    from .config import config
+except ImportError:
+    from config import config
+
+logger = logging.getLogger(__name__)
+
+# 颜色签名 (HSV 直方图 18x4) 的形状，读取时还原
+SIGNATURE_SHAPE = (18, 4)
+
+
+class EmbeddingCache:
+    """
+    持久化 Embedding 缓存
+    以图片字节的内容哈希 + 模型版本为键，保存归一化向量、裁剪框和颜色签名。
+    Discord 上同一张商品图会被反复转发，命中缓存时只需一次哈希和一次索引查询，无需 YOLO + DINOv2 推理。
+    使用独立的 SQLite 文件，按 last_used 做 LRU 淘汰，不影响主业务库。
+    """
+
+    # last_used 最多每隔多少秒回写一次，避免每次命中都产生写操作
+    TOUCH_INTERVAL = 60
+    # 每写入多少条检查一次容量
+    EVICT_CHECK_EVERY = 200
+
+    def __init__(self, db_path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.db_path = db_path or config.EMBEDDING_CACHE_FILE
+        self.max_entries = max_entries if max_entries is not None else config.EMBEDDING_CACHE_MAX_ENTRIES
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._puts_since_check = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程复用一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0)
+            conn.execute('PRAGMA journal_mode=WAL;')
+            conn.execute('PRAGMA synchronous=NORMAL;')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                content_hash TEXT NOT NULL,
+                model_key TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                crop_box TEXT,
+                signature BLOB,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, model_key)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache(last_used)')
+        conn.commit()
+
+    def get(self, content_hash: str, model_key: str) -> Optional[Dict]:
+        """查询缓存，返回 {'vector', 'crop', 'signature'}，未命中返回 None"""
+        if not content_hash:
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT vector, crop_box, signature, last_used FROM embedding_cache WHERE content_hash = ? AND model_key = ?',
+                (content_hash, model_key)
+            ).fetchone()
+
+            if row is None:
+                with self._stats_lock:
+                    self.misses += 1
+                return None
+
+            vector_blob, crop_json, signature_blob, last_used = row
+            now = time.time()
+            if now - last_used > self.TOUCH_INTERVAL:
+                conn.execute(
+                    'UPDATE embedding_cache SET last_used = ? WHERE content_hash = ? AND model_key = ?',
+                    (now, content_hash, model_key)
+                )
+                conn.commit()
+
+            with self._stats_lock:
+                self.hits += 1
+
+            signature = None
+            if signature_blob:
+                signature = {'hist': np.frombuffer(signature_blob, dtype=np.float32).reshape(SIGNATURE_SHAPE).copy()}
+
+            return {
+                'vector': np.frombuffer(vector_blob, dtype=np.float32).copy(),
+                'crop': json.loads(crop_json) if crop_json else None,
+                'signature': signature
+            }
+        except Exception as e:
+            logger.warning(f"读取 embedding 缓存失败: {e}")
+            return None
+
+    def put(self, content_hash: str, model_key: str, vector: np.ndarray,
+            crop: Optional[Dict] = None, signature: Optional[Dict] = None) -> bool:
+        """写入缓存；signature 为空时保留已有的签名"""
+        if not content_hash or vector is None:
+            return False
+        try:
+            now = time.time()
+            vector_blob = np.asarray(vector, dtype=np.float32).tobytes()
+            signature_blob = None
+            if signature and signature.get('hist') is not None:
+                signature_blob = np.asarray(signature['hist'], dtype=np.float32).tobytes()
+
+            conn = self._connect()
+            conn.execute('''
+                INSERT INTO embedding_cache (content_hash, model_key, vector, crop_box, signature, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(content_hash, model_key) DO UPDATE SET
+                    vector = excluded.vector,
+                    crop_box = COALESCE(excluded.crop_box, embedding_cache.crop_box),
+                    signature = COALESCE(excluded.signature, embedding_cache.signature),
+                    last_used = excluded.last_used
+            ''', (content_hash, model_key, vector_blob, json.dumps(crop) if crop else None, signature_blob, now, now))
+            conn.commit()
+
+            with self._stats_lock:
+                self._puts_since_check += 1
+                should_check = self._puts_since_check >= self.EVICT_CHECK_EVERY
+                if should_check:
+                    self._puts_since_check = 0
+            if should_check:
+                self.evict()
+            return True
+        except Exception as e:
+            logger.warning(f"写入 embedding 缓存失败: {e}")
+            return False
+
+    def evict(self) -> int:
+        """超出容量时按 last_used 淘汰最久未使用的条目"""
+        if not self.max_entries:
+            return 0
+        try:
+            conn = self._connect()
+            total = conn.execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0]
+            overflow = total - self.max_entries
+            if overflow <= 0:
+                return 0
+            conn.execute('''
+                DELETE FROM embedding_cache WHERE (content_hash, model_key) IN (
+                    SELECT content_hash, model_key FROM embedding_cache ORDER BY last_used ASC LIMIT ?
+                )
+            ''', (overflow,))
+            conn.commit()
+            with self._stats_lock:
+                self.evictions += overflow
+            logger.info(f"🧹 embedding 缓存淘汰 {overflow} 条")
+            return overflow
+        except Exception as e:
+            logger.warning(f"embedding 缓存淘汰失败: {e}")
+            return 0
+
+    def purge_other_models(self, model_key: str) -> int:
+        """删除其他模型版本的缓存（模型升级后释放空间）"""
+        try:
+            conn = self._connect()
+            cursor = conn.execute('DELETE FROM embedding_cache WHERE model_key != ?', (model_key,))
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            logger.warning(f"清理旧模型缓存失败: {e}")
+            return 0
+
+    def get_stats(self) -> Dict:
+        try:
+            total = self._connect().execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0]
+        except Exception:
+            total = None
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': total,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# 全局单例
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """获取 embedding 缓存单例；未启用或初始化失败时返回 None"""
+    global _cache
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = EmbeddingCache()
+                except Exception as e:
+                    logger.error(f"embedding 缓存初始化失败: {e}")
+                    return None
+    return _cache
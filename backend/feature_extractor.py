@@ -1,32 +1,14 @@
 import os
 
 # === 性能优化配置 ===
-# 允许底层计算库每个任务使用少量核心。
-# 配合上层有限并发（例如 3 个并发任务），在 10 核 CPU 上更容易吃满但不打架。
-# 可通过环境变量 AI_INTRA_THREADS 调整。
+# 线程预算统一由 inference_scheduler 管理 (AI_INTRA_THREADS x AI_MAX_WORKERS)，
+# 必须在导入 torch 之前设置底层计算库线程数
 try:
-    from .config import config as _cfg
-except Exception:
-    try:
-        from config import config as _cfg
-    except Exception:
-        _cfg = None
-
-_intra_threads = None
-try:
-    if _cfg is not None and hasattr(_cfg, 'AI_INTRA_THREADS'):
-        _intra_threads = int(_cfg.AI_INTRA_THREADS)
-except Exception:
-    _intra_threads = None
-
-if not _intra_threads or _intra_threads <= 0:
-    _intra_threads = int(os.getenv('AI_INTRA_THREADS', '3'))
+    from .inference_scheduler import apply_thread_env, apply_torch_threads, get_inference_scheduler
+except ImportError:
+    from inference_scheduler import apply_thread_env, apply_torch_threads, get_inference_scheduler
 
-os.environ["OMP_NUM_THREADS"] = str(_intra_threads)
-os.environ["MKL_NUM_THREADS"] = str(_intra_threads)
-os.environ["OPENBLAS_NUM_THREADS"] = str(_intra_threads)
-os.environ["VECLIB_MAXIMUM_THREADS"] = str(_intra_threads)
-os.environ["NUMEXPR_NUM_THREADS"] = str(_intra_threads)
+apply_thread_env()
 os.environ.setdefault("TORCH_CPP_LOG_LEVEL", "ERROR")
 os.environ.setdefault("GLOG_minloglevel", "2")
 
@@ -34,6 +16,8 @@ import warnings
 warnings.filterwarnings("ignore", message="Could not initialize NNPACK")
 import torch
 
+apply_torch_threads(torch)
+
 # === 添加这段代码 ===
 try:
     # 显式禁用 NNPACK
@@ -45,6 +29,7 @@ import numpy as np
 import cv2  # OpenCV for color histogram and structure comparison
 import threading
 import inspect
+from contextlib import nullcontext
 from typing import List, Optional, Union, Dict
 import logging
 from pathlib import Path
@@ -55,8 +40,17 @@ try:
     from .config import config
 except ImportError:
     from config import config
-from functools import lru_cache
 import hashlib
+try:
+    from .image_io import LoadedImage, ImageSource, load_image, decode_image_bytes
+    from .cache_utils import BoundedLRUCache
+    from .color_index import compute_color_signature, SIGNATURE_BINS
+    from .hybrid_rerank import get_hybrid_reranker
+except ImportError:
+    from image_io import LoadedImage, ImageSource, load_image, decode_image_bytes
+    from cache_utils import BoundedLRUCache
+    from color_index import compute_color_signature, SIGNATURE_BINS
+    from hybrid_rerank import get_hybrid_reranker
 
 logger = logging.getLogger(__name__)
 
@@ -64,6 +58,84 @@ logger = logging.getLogger(__name__)
 _global_extractor = None
 _extractor_lock = threading.Lock()
 
+QUANTIZATION_MODES = ('none', 'int8_dynamic')
+COMPILE_MODES = ('none', 'trace', 'compile')
+PRECISION_MODES = ('fp32', 'bf16', 'fp16')
+_PRECISION_DTYPES = {'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+
+class ClsEmbeddingHead(torch.nn.Module):
+    """只返回 CLS token 的包装模块，输出为张量，便于 TorchScript trace / torch.compile"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model(pixel_values=pixel_values).last_hidden_state[:, 0, :]
+
+
+def quantize_model_int8(model):
+    """对模型中的 nn.Linear 做 INT8 动态量化（权重约缩小 4 倍，仅 CPU 可用）
+
+    ViT 的计算量几乎全部在 Linear 层（QKV/投影/MLP），动态量化无需校准集，
+    激活值在推理时按批次动态计算量化参数。
+    """
+    engines = getattr(torch.backends.quantized, 'supported_engines', [])
+    if 'fbgemm' in engines:
+        torch.backends.quantized.engine = 'fbgemm'
+    elif 'qnnpack' in engines:
+        torch.backends.quantized.engine = 'qnnpack'
+
+    try:
+        from torch.ao.quantization import quantize_dynamic
+    except ImportError:
+        from torch.quantization import quantize_dynamic
+
+    quantized = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    quantized.eval()
+    return quantized
+
+
+def _cpu_flags() -> set:
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return set(line.split(':', 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def precision_supported(precision: str, device: torch.device) -> bool:
+    """当前设备是否有 bf16/fp16 硬件加速 (CPU 需要 AVX512-BF16/AMX 等指令集)"""
+    if precision == 'fp32':
+        return True
+    if device.type == 'cuda':
+        return bool(torch.cuda.is_bf16_supported()) if precision == 'bf16' else True
+    if device.type != 'cpu':
+        return False
+
+    probe_name = '_is_mkldnn_bf16_supported' if precision == 'bf16' else '_is_mkldnn_fp16_supported'
+    try:
+        probe = getattr(torch.ops.mkldnn, probe_name)
+        return bool(probe())
+    except Exception:
+        pass
+    flags = _cpu_flags()
+    wanted = {'avx512_bf16', 'amx_bf16'} if precision == 'bf16' else {'avx512_fp16', 'amx_fp16'}
+    return bool(flags & wanted)
+
+
+def estimate_model_size_mb(model) -> float:
+    """序列化 state_dict 估算模型权重体积 (MB)"""
+    import io
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
 class DINOv2FeatureExtractor:
     """
     "猎鹰"架构特征提取器
@@ -71,10 +143,28 @@ class DINOv2FeatureExtractor:
     专为鞋类识别优化，自动裁剪鞋子主体后提取高精度特征
     """
 
-    def __init__(self):
+    def __init__(self, quantization: Optional[str] = None, fast_preprocess: Optional[bool] = None,
+                 compile_mode: Optional[str] = None, precision: Optional[str] = None):
         self.device = torch.device(config.DEVICE)
-        # 保护 YOLO/DINO 推理，避免多线程同时访问导致模型状态损坏
-        self.inference_lock = threading.Lock()
+        self.quantization = (quantization or getattr(config, 'AI_QUANTIZATION', 'none') or 'none').lower()
+        self.fast_preprocess = getattr(config, 'AI_FAST_PREPROCESS', False) if fast_preprocess is None else bool(fast_preprocess)
+        self._pp_params = None
+        # 快速解码模式 (JPEG draft 解码 + reducing_gap 缩放)，0 表示完整解码 + LANCZOS
+        self.decode_max_size = int(getattr(config, 'AI_DECODE_MAX_SIZE', 0) or 0)
+        self.adaptive_crop = getattr(config, 'ADAPTIVE_CROP', False)
+        self._crop_stats = {'detector_run': 0, 'detector_skipped': 0, 'cache_hit': 0}
+        self._crop_stats_lock = threading.Lock()
+        self.compile_mode = (compile_mode or getattr(config, 'AI_COMPILE_MODE', 'none') or 'none').lower()
+        self._compiled_model = None
+        self._compiled_for = None
+        self.warmed_up = False
+        self.precision = (precision or getattr(config, 'AI_PRECISION', 'fp32') or 'fp32').lower()
+        self.precision_drift = None
+        self._autocast_dtype = None
+        self._detector_half = False
+        # YOLO 的 predictor 有内部状态，不能多线程同时调用；DINOv2 前向可以并发，由推理调度器限流
+        self.detector_lock = threading.Lock()
+        self.scheduler = get_inference_scheduler()
         logger.info(f"正在初始化猎鹰AI引擎，使用设备: {self.device}")
 
         # 加载YOLOv8-Nano (眼睛 - 主体检测)
@@ -83,19 +173,11 @@ class DINOv2FeatureExtractor:
         # 加载DINOv2 (大脑 - 特征提取)
         self._load_dino_model()
 
-        # 初始化缓存用于检测结果
-        self._detection_cache = {}
-
-    def _get_image_hash(self, image_path: str) -> str:
-        """计算图片文件的哈希值用于缓存"""
-        try:
-            with open(image_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
-        except Exception:
-            # 如果读取失败，使用文件路径+修改时间作为备用
-            import os
-            stat = os.stat(image_path)
-            return hashlib.md5(f"{image_path}:{stat.st_mtime}".encode()).hexdigest()
+        # 检测结果缓存：只保存归一化裁剪框，按字节预算 LRU 淘汰
+        self._detection_cache = BoundedLRUCache(
+            max_bytes=int(getattr(config, 'DETECTION_CACHE_MAX_MB', 8) * 1024 * 1024),
+            name='detection_cache'
+        )
 
     def _load_yolo_detector(self):
         """强制加载YOLO-World模型用于商品识别"""
@@ -131,17 +213,8 @@ class DINOv2FeatureExtractor:
             logger.info(f"🎯 支持自动识别 {len(self.target_classes)} 种商品类别")
             logger.info(f"📋 YOLO-World目标类别: {', '.join(self.target_classes[:10])}...")
             logger.info("⚡ YOLO-World优化说明: 使用多维度评分(面积×置信度×位置×类别权重)，显著提升裁剪准确率")
-
-            # 验证CLIP库是否正确安装
-            try:
-                import clip
-                logger.info(f"✅ CLIP库版本验证: {getattr(clip, '__version__', '未知')}")
-                if hasattr(clip, 'load'):
-                    logger.info("✅ CLIP.load方法可用")
-                else:
-                    logger.warning("⚠️ CLIP.load方法不可用，可能影响YOLO-World性能")
-            except ImportError as e:
-                logger.warning(f"⚠️ 无法导入CLIP库: {e}")
+            # 不再在启动时探测 CLIP 库：导入 clip 会额外加载一遍依赖，拖慢启动，
+            # CLIP 问题会在加载失败时由下面的备用逻辑处理
 
         except Exception as e:
             logger.error(f"💥 YOLO-World模型加载失败: {e}")
@@ -184,7 +257,7 @@ class DINOv2FeatureExtractor:
             model_name = config.DINO_MODEL_NAME
             logger.info(f"加载DINOv2特征模型: {model_name}...")
 
-            self.processor = AutoImageProcessor.from_pretrained(model_name)
+            self.processor = self._from_pretrained(AutoImageProcessor, model_name)
             self.model = self._load_pretrained_model(model_name, force_no_safetensors=False)
             if self._model_has_meta(self.model):
                 logger.warning("检测到 meta tensor，尝试禁用 safetensors 重新加载")
@@ -204,11 +277,219 @@ class DINOv2FeatureExtractor:
                     self.device = torch.device('cpu')
                     self.model.to(self.device)
             self.model.eval()
+            self._apply_quantization()
+            self._init_fast_preprocess()
+            self._apply_precision()
+            self._apply_compile_mode()
             logger.info("✅ DINOv2模型加载成功")
         except Exception as e:
             logger.error(f"❌ DINOv2模型加载失败: {e}")
             raise RuntimeError("DINOv2模型加载失败") from e
 
+    def _init_fast_preprocess(self):
+        """从处理器配置中固定 resize/crop 尺寸和 mean/std，供张量快速预处理使用"""
+        try:
+            proc = self.processor
+            size = dict(getattr(proc, 'size', None) or {})
+            crop_size = dict(getattr(proc, 'crop_size', None) or {})
+            mean = torch.tensor(getattr(proc, 'image_mean', None) or [0.485, 0.456, 0.406], dtype=torch.float32)
+            std = torch.tensor(getattr(proc, 'image_std', None) or [0.229, 0.224, 0.225], dtype=torch.float32)
+            rescale = float(getattr(proc, 'rescale_factor', 1 / 255)) if getattr(proc, 'do_rescale', True) else 1.0
+
+            # (x * rescale - mean) / std 折叠为一次仿射: x * scale + bias
+            self._pp_params = {
+                'shortest_edge': size.get('shortest_edge'),
+                'resize_hw': (size.get('height'), size.get('width')) if 'height' in size else None,
+                'crop_hw': (crop_size.get('height', 224), crop_size.get('width', 224)) if getattr(proc, 'do_center_crop', True) else None,
+                'scale': (rescale / std).view(1, 3, 1, 1),
+                'bias': (-mean / std).view(1, 3, 1, 1)
+            }
+        except Exception as e:
+            logger.warning(f"快速预处理初始化失败，使用默认处理器: {e}")
+            self._pp_params = None
+
+    def _preprocess_tensor(self, img: Image.Image) -> torch.Tensor:
+        """张量快速预处理：bicubic(抗锯齿) resize 最短边 → 中心裁剪 → 一次仿射归一化"""
+        params = self._pp_params
+        arr = np.asarray(img, dtype=np.uint8)
+        h, w = arr.shape[:2]
+        tensor = torch.from_numpy(arr).permute(2, 0, 1).unsqueeze(0).float()
+
+        if params['shortest_edge']:
+            edge = params['shortest_edge']
+            if w <= h:
+                new_h, new_w = int(edge * h / w), edge
+            else:
+                new_h, new_w = edge, int(edge * w / h)
+        else:
+            new_h, new_w = params['resize_hw']
+
+        if (new_h, new_w) != (h, w):
+            tensor = torch.nn.functional.interpolate(
+                tensor, size=(new_h, new_w), mode='bicubic', align_corners=False, antialias=True
+            )
+            # 与 PIL 一致：结果落回 0~255 的整数像素
+            tensor = tensor.clamp_(0, 255).round_()
+
+        if params['crop_hw']:
+            crop_h, crop_w = params['crop_hw']
+            top = max(0, (new_h - crop_h) // 2)
+            left = max(0, (new_w - crop_w) // 2)
+            tensor = tensor[:, :, top:top + crop_h, left:left + crop_w]
+
+        return torch.addcmul(params['bias'], tensor, params['scale'])
+
+    def _input_shape(self):
+        """固定的模型输入尺寸 (1, 3, H, W)"""
+        crop_hw = (self._pp_params or {}).get('crop_hw') or (224, 224)
+        return (1, 3, crop_hw[0], crop_hw[1])
+
+    def _autocast(self):
+        """低精度推理的 autocast 上下文，float32 时为空操作"""
+        if self._autocast_dtype is None:
+            return nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=self._autocast_dtype)
+
+    def _apply_precision(self):
+        """按配置启用 bf16/fp16 autocast 推理，硬件不支持或与 float32 偏差过大时自动回退
+
+        权重保持 float32，矩阵乘在低精度下执行，LayerNorm/Softmax 等由 autocast 保持 float32；
+        输出向量统一转回 float32 再归一化，FAISS 索引不受影响。
+        """
+        self._autocast_dtype = None
+        self._detector_half = False
+        self.precision_drift = None
+        mode = self.precision
+        if mode not in PRECISION_MODES:
+            logger.warning(f"未知的推理精度: {mode}，使用 fp32")
+            self.precision = 'fp32'
+            return
+        if mode == 'fp32':
+            return
+        if self.quantization != 'none':
+            logger.warning(f"INT8 量化模型不支持 {mode} 推理，使用 fp32")
+            self.precision = 'fp32'
+            return
+        if not precision_supported(mode, self.device):
+            logger.warning(f"当前设备不支持 {mode} 加速，使用 fp32")
+            self.precision = 'fp32'
+            return
+
+        # 启动时用固定输入做一次对照，确认低精度结果与 float32 一致
+        try:
+            dtype = _PRECISION_DTYPES[mode]
+            generator = torch.Generator().manual_seed(0)
+            example = torch.randn(self._input_shape(), generator=generator).to(self.device)
+            with torch.no_grad():
+                reference = self.model(pixel_values=example).last_hidden_state[0, 0, :].float()
+                with torch.autocast(device_type=self.device.type, dtype=dtype):
+                    candidate = self.model(pixel_values=example).last_hidden_state[0, 0, :].float()
+            cosine = torch.nn.functional.cosine_similarity(reference, candidate, dim=0).item()
+            self.precision_drift = round(1.0 - cosine, 6)
+        except Exception as e:
+            logger.warning(f"{mode} 推理自检失败，回退 fp32: {e}")
+            self.precision = 'fp32'
+            return
+
+        max_drift = float(getattr(config, 'AI_PRECISION_MAX_DRIFT', 0.005))
+        if self.precision_drift > max_drift:
+            logger.warning(f"{mode} 推理余弦漂移 {self.precision_drift} 超过 {max_drift}，回退 fp32")
+            self.precision = 'fp32'
+            return
+
+        self._autocast_dtype = dtype
+        # ultralytics 只在 CUDA 上支持半精度推理
+        self._detector_half = self.device.type == 'cuda'
+        logger.info(f"✅ DINOv2 已启用 {mode} 推理，余弦漂移 {self.precision_drift}")
+
+    def _apply_compile_mode(self):
+        """按配置把 DINOv2 编译为静态图 (trace / torch.compile)，失败时回退 eager"""
+        mode = self.compile_mode
+        if mode not in COMPILE_MODES:
+            logger.warning(f"未知的编译模式: {mode}，使用 eager")
+            self.compile_mode = 'none'
+            return
+        if mode == 'none':
+            return
+
+        try:
+            head = ClsEmbeddingHead(self.model).eval()
+            example = torch.zeros(self._input_shape(), dtype=torch.float32, device=self.device)
+            with torch.no_grad(), self._autocast():
+                if mode == 'trace':
+                    compiled = torch.jit.trace(head, example, strict=False, check_trace=False)
+                    if self.quantization == 'none' and self._autocast_dtype is None:
+                        compiled = torch.jit.freeze(compiled)
+                else:
+                    if not hasattr(torch, 'compile'):
+                        raise RuntimeError("当前 torch 版本不支持 torch.compile")
+                    compiled = torch.compile(head, dynamic=False)
+                # 立即跑一次，触发编译/优化，错误在启动阶段暴露
+                compiled(example)
+            self._compiled_model = compiled
+            self._compiled_for = self.model
+            logger.info(f"✅ DINOv2 已启用编译模式: {mode}，输入尺寸 {tuple(example.shape)}")
+        except Exception as e:
+            logger.warning(f"DINOv2 编译模式 {mode} 失败，回退 eager: {e}")
+            self.compile_mode = 'none'
+            self._compiled_model = None
+            self._compiled_for = None
+
+    def warmup(self, runs: Optional[int] = None) -> Dict:
+        """用假数据跑几次检测器和 DINOv2，消除首个真实请求的惰性初始化开销
+
+        不经过检测缓存和 embedding 缓存，不会污染缓存统计。
+        """
+        import time
+        runs = max(1, int(runs if runs is not None else getattr(config, 'AI_WARMUP_RUNS', 2)))
+        timings = {'detector_ms': [], 'embedder_ms': []}
+
+        rng = np.random.default_rng(0)
+        dummy = rng.integers(0, 256, size=(448, 448, 3), dtype=np.uint8)
+        dummy_pil = Image.fromarray(dummy)
+
+        for _ in range(runs):
+            if self.detector is not None and config.USE_YOLO_CROP:
+                start = time.perf_counter()
+                try:
+                    with self.detector_lock, self.scheduler.slot():
+                        self.detector(dummy, conf=0.05, verbose=False, half=self._detector_half)
+                except Exception as e:
+                    logger.warning(f"检测器预热失败: {e}")
+                timings['detector_ms'].append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            self._embed_image(self._resize_for_ai(dummy_pil))
+            timings['embedder_ms'].append((time.perf_counter() - start) * 1000)
+
+        self.warmed_up = True
+        summary = {k: [round(v, 1) for v in vals] for k, vals in timings.items()}
+        logger.info(f"🔥 AI 预热完成 ({runs} 次): {summary}")
+        return summary
+
+    def _apply_quantization(self):
+        """按配置对 DINOv2 做量化，失败时自动回退 float32"""
+        mode = self.quantization
+        if mode not in QUANTIZATION_MODES:
+            logger.warning(f"未知的量化模式: {mode}，使用 float32")
+            self.quantization = 'none'
+            return
+        if mode == 'none':
+            return
+        if self.device.type != 'cpu':
+            logger.warning(f"INT8 动态量化仅支持 CPU，当前设备 {self.device}，使用 float32")
+            self.quantization = 'none'
+            return
+
+        try:
+            size_before = estimate_model_size_mb(self.model)
+            self.model = quantize_model_int8(self.model)
+            size_after = estimate_model_size_mb(self.model)
+            logger.info(f"✅ DINOv2 已启用 INT8 动态量化: {size_before:.1f}MB -> {size_after:.1f}MB")
+        except Exception as e:
+            logger.warning(f"INT8 动态量化失败，回退 float32: {e}")
+            self.quantization = 'none'
+
     def _load_pretrained_model(self, model_name: str, force_no_safetensors: bool) -> AutoModel:
         load_kwargs = {
             'low_cpu_mem_usage': False,
@@ -225,7 +506,17 @@ class DINOv2FeatureExtractor:
         except Exception:
             pass
 
-        return AutoModel.from_pretrained(model_name, **load_kwargs)
+        return self._from_pretrained(AutoModel, model_name, **load_kwargs)
+
+    @staticmethod
+    def _from_pretrained(loader, model_name: str, **kwargs):
+        """优先从本地缓存加载，避免每次启动都访问 Hugging Face Hub；本地没有缓存时再联网下载"""
+        if getattr(config, 'AI_LOCAL_FILES_ONLY', True):
+            try:
+                return loader.from_pretrained(model_name, local_files_only=True, **kwargs)
+            except (OSError, ValueError) as e:
+                logger.warning(f"本地缓存中没有 {model_name}，改为联网下载: {e}")
+        return loader.from_pretrained(model_name, **kwargs)
 
     @staticmethod
     def _model_has_meta(model: AutoModel) -> bool:
@@ -234,7 +525,7 @@ class DINOv2FeatureExtractor:
         except Exception:
             return False
 
-    def _crop_main_object(self, image_path: str) -> Image.Image:
+    def _crop_main_object(self, source: ImageSource) -> Image.Image:
         """全自动裁剪商品主体 + [新增] 尺寸优化
 
         全自动裁剪逻辑：
@@ -242,40 +533,113 @@ class DINOv2FeatureExtractor:
         2. 自动过滤掉背景、人、手
         3. 在剩下的商品中，选出最显著的一个（最大+最中心）
         4. [新增] 缩小图片尺寸以加快AI推理速度
+
+        检测结果只缓存归一化的裁剪框（不缓存像素数据），命中缓存时直接按框裁剪
+        """
+        img, _ = self._locate_and_crop(source)
+        return img
+
+    def _locate_and_crop(self, source: ImageSource):
+        """返回 (裁剪后的图片, 归一化裁剪信息)，裁剪信息可持久化后复用"""
+        loaded = load_image(source)
+        img = loaded.pil
+
+        if not config.USE_YOLO_CROP or self.detector is None:
+            return self._center_crop(img), {'box': None, 'label': None, 'confidence': None}
+
+        # 检查缓存
+        image_hash = loaded.content_hash
+        crop = self._detection_cache.get(image_hash) if image_hash else None
+        if crop is None:
+            if self.adaptive_crop and self._is_tight_product_shot(img):
+                # 级联策略：纯色背景、主体居中的商品图，中心裁剪与检测结果一致，跳过 YOLO
+                crop = {'box': None, 'label': None, 'confidence': None, 'policy': 'center'}
+                self._count_crop('detector_skipped')
+            else:
+                # YOLO 直接使用内存中的 BGR 数组，不再从磁盘重新读取
+                crop = self._detect_main_object(loaded.bgr, img.size)
+                self._count_crop('detector_run')
+            if image_hash:
+                self._detection_cache.put(image_hash, crop)
+        else:
+            self._count_crop('cache_hit')
+            logger.debug("使用缓存的检测结果")
+
+        return self._apply_crop(img, crop), crop
+
+    def _count_crop(self, key: str):
+        with self._crop_stats_lock:
+            self._crop_stats[key] += 1
+
+    def _is_tight_product_shot(self, img: Image.Image) -> bool:
+        """低分辨率快速判断图片是否已是"纯色背景 + 主体居中"的商品图
+
+        1. 长宽比不能太极端（长图/拼图交给检测器）
+        2. 边框一圈像素接近单一颜色（白底/纯色底）
+        3. 与背景色差异明显的前景区域落在中心 80% 内，且占画面足够大
+        满足时中心裁剪已经框住主体，无需运行 YOLO。
         """
         try:
-            img = Image.open(image_path).convert("RGB")
-            img_w, img_h = img.size
-
-            if not config.USE_YOLO_CROP or self.detector is None:
-                return self._center_crop(img)
-
-            # 检查缓存
-            image_hash = self._get_image_hash(image_path)
-            if image_hash in self._detection_cache:
-                logger.debug("使用缓存的检测结果")
-                cached_result = self._detection_cache[image_hash]
-                if cached_result is None:
-                    return self._center_crop(img)
-                # 返回缓存的裁剪结果
-                return cached_result
+            w, h = img.size
+            if not w or not h:
+                return False
+            aspect = w / h
+            if aspect < config.ADAPTIVE_CROP_MIN_ASPECT or aspect > 1.0 / config.ADAPTIVE_CROP_MIN_ASPECT:
+                return False
+
+            gray = np.asarray(img.convert('L').resize((64, 64), Image.Resampling.BILINEAR), dtype=np.float32)
+            border = np.concatenate([gray[:4, :].ravel(), gray[-4:, :].ravel(), gray[4:-4, :4].ravel(), gray[4:-4, -4:].ravel()])
+            if float(border.std()) > config.ADAPTIVE_CROP_BORDER_STD:
+                return False
+
+            foreground = np.abs(gray - float(np.median(border))) > 30
+            if not foreground.any():
+                return False
+            rows = np.where(foreground.any(axis=1))[0]
+            cols = np.where(foreground.any(axis=0))[0]
+            y1, y2 = rows[0] / 64, (rows[-1] + 1) / 64
+            x1, x2 = cols[0] / 64, (cols[-1] + 1) / 64
+
+            # 前景必须在中心 80% 区域内（留 1 像素容差）
+            margin = 0.1 - 1 / 64
+            if x1 < margin or y1 < margin or x2 > 1 - margin or y2 > 1 - margin:
+                return False
+            # 主体太小时检测器能放大主体，不能跳过
+            return (x2 - x1) * (y2 - y1) >= config.ADAPTIVE_CROP_MIN_FILL
+        except Exception as e:
+            logger.debug(f"自适应裁剪判断失败，回退检测: {e}")
+            return False
+
+    def _detect_main_object(self, source, image_size) -> Dict:
+        """运行 YOLO 检测并选出主体，返回归一化裁剪框
+
+        Returns:
+            {'box': (x1, y1, x2, y2) 归一化坐标或 None(中心裁剪兜底), 'label': 类别, 'confidence': 置信度}
+        """
+        fallback = {'box': None, 'label': None, 'confidence': None}
+        img_w, img_h = image_size
+        if not img_w or not img_h:
+            return fallback
 
+        try:
             # conf=0.05: 降低门槛，宁可多检不要漏检，反正我们有逻辑过滤
-            with self.inference_lock:
-                results = self.detector(image_path, conf=0.05, verbose=False)
+            with self.detector_lock, self.scheduler.slot():
+                results = self.detector(source, conf=0.05, verbose=False, half=self._detector_half)
 
             if not results or len(results[0].boxes) == 0:
                 logger.debug("未检测到通用商品，使用中心裁剪兜底")
-                self._detection_cache[image_hash] = None
-                return self._center_crop(img)
+                return fallback
 
             boxes = results[0].boxes
+            names = getattr(results[0], 'names', None) or {}
             center_x, center_y = img_w / 2, img_h / 2
 
             # --- 智能评分逻辑 ---
             # 在所有检测到的"商品"中，选出主角
 
             best_box = None
+            best_label = None
+            best_conf = None
             max_score = -1
 
             for box in boxes:
@@ -307,13 +671,16 @@ class DINOv2FeatureExtractor:
                 if score > max_score:
                     max_score = score
                     best_box = coords
+                    best_conf = float(box.conf)
+                    try:
+                        best_label = names.get(int(box.cls)) if hasattr(names, 'get') else None
+                    except Exception:
+                        best_label = None
 
             if best_box is None:
                 logger.info("未找到合适的商品框，使用中心裁剪兜底")
-                self._detection_cache[image_hash] = None
-                return self._center_crop(img)
+                return fallback
 
-            # 执行裁剪
             x1, y1, x2, y2 = best_box
 
             # 扩充 5% - 10% 的边缘，保留一点点上下文
@@ -321,32 +688,37 @@ class DINOv2FeatureExtractor:
             pad_y = (y2 - y1) * 0.05
 
             crop_box = (
-                max(0, x1 - pad_x),
-                max(0, y1 - pad_y),
-                min(img_w, x2 + pad_x),
-                min(img_h, y2 + pad_y)
+                float(max(0, x1 - pad_x) / img_w),
+                float(max(0, y1 - pad_y) / img_h),
+                float(min(img_w, x2 + pad_x) / img_w),
+                float(min(img_h, y2 + pad_y) / img_h)
             )
-
-            cropped_img = img.crop(crop_box)
-            logger.debug(f"成功裁剪商品区域: {crop_box}")
-
-            # 优化：Resize 裁剪后的图片
-            final_img = self._resize_for_ai(cropped_img)
-
-            # 缓存成功结果
-            self._detection_cache[image_hash] = final_img.copy()
-
-            return final_img
+            logger.debug(f"成功定位商品区域: {crop_box}")
+            return {'box': crop_box, 'label': best_label, 'confidence': best_conf}
 
         except Exception as e:
             logger.warning(f"自动裁剪出错: {e}, 使用中心裁剪")
-            # 缓存失败结果
-            try:
-                image_hash = self._get_image_hash(image_path)
-                self._detection_cache[image_hash] = None
-            except:
-                pass
-            return self._center_crop(Image.open(image_path).convert("RGB"))
+            return fallback
+
+    def _apply_crop(self, img: Image.Image, crop: Optional[Dict]) -> Image.Image:
+        """按归一化裁剪框裁剪并缩放；没有框时使用中心裁剪"""
+        box = (crop or {}).get('box')
+        if not box:
+            return self._center_crop(img)
+
+        img_w, img_h = img.size
+        x1, y1, x2, y2 = box
+        pixel_box = (
+            int(round(x1 * img_w)),
+            int(round(y1 * img_h)),
+            int(round(x2 * img_w)),
+            int(round(y2 * img_h))
+        )
+        if pixel_box[2] - pixel_box[0] < 2 or pixel_box[3] - pixel_box[1] < 2:
+            return self._center_crop(img)
+
+        # 优化：Resize 裁剪后的图片
+        return self._resize_for_ai(img.crop(pixel_box))
 
     def _center_crop(self, img: Image.Image) -> Image.Image:
         """中心裁剪：保留中间 80% 区域，降低背景干扰"""
@@ -372,47 +744,103 @@ class DINOv2FeatureExtractor:
             scale = max_size / max(w, h)
             new_w = int(w * scale)
             new_h = int(h * scale)
-            return img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+            # 快速解码模式下用 reducing_gap：先按整数倍快速缩小再做 LANCZOS，更快但像素与基准略有差异
+            reducing_gap = 3.0 if self.decode_max_size > 0 else None
+            return img.resize((new_w, new_h), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
         return img
 
-    def extract_feature(self, image_path: Union[str, Path]) -> Optional[np.ndarray]:
-        """提取单张图片的特征向量 (384维或768维)"""
-        try:
-            image_path = str(image_path)
+    def extract_feature(self, source: ImageSource) -> Optional[np.ndarray]:
+        """提取单张图片的特征向量 (384维或768维)
 
-            if not os.path.exists(image_path):
-                logger.error(f"文件不存在: {image_path}")
-                return None
+        source 可以是文件路径、图片字节、BGR ndarray、PIL 图片或 load_image() 的结果，
+        传入 LoadedImage 时可与 prepare_hybrid_query 共享同一次解码。
+        """
+        result = self.extract_feature_with_meta(source)
+        return result['vector'] if result else None
 
-            # 1. YOLO裁剪主体
-            img = self._crop_main_object(image_path)
+    def extract_feature_with_meta(self, source: ImageSource, crop: Optional[Dict] = None) -> Optional[Dict]:
+        """提取特征向量并返回裁剪信息
 
-            # 2. 预处理（DINOv2会自动处理）
-            with self.inference_lock:
-                inputs = self.processor(images=img, return_tensors="pt").to(self.device)
-                # 3. 特征提取
-                with torch.no_grad():
-                    outputs = self.model(**inputs)
+        Args:
+            crop: 已保存的裁剪信息 ({'box': 归一化坐标或 None 表示中心裁剪, ...})，
+                  提供时直接按该框裁剪，不再运行 YOLO（重建索引/更换模型时使用）
 
-            # 4. 获取CLS token特征 (DINOv2的最佳实践)
-            # outputs.last_hidden_state.shape: [1, num_patches+1, dim]
-            # 第0个是CLS token，代表整张图的语义
-            embedding = outputs.last_hidden_state[0, 0, :].cpu().numpy()
+        Returns:
+            {'vector': np.ndarray, 'crop': {'box', 'label', 'confidence'}}，失败返回 None
+        """
+        source_name = getattr(source, 'source_name', None) or (
+            str(source) if isinstance(source, (str, Path)) else '<memory>')
+        try:
+            if isinstance(source, (str, Path)) and not os.path.exists(source_name):
+                logger.error(f"文件不存在: {source_name}")
+                return None
 
-            # 5. L2归一化 (对余弦相似度至关重要)
-            norm = float(np.linalg.norm(embedding))
-            if norm > 0:
-                embedding = embedding / norm
+            # 1. YOLO裁剪主体（有已保存的裁剪框时直接复用）
+            if crop is not None:
+                img = self._apply_crop(load_image(source).pil, crop)
+            else:
+                img, crop = self._locate_and_crop(source)
 
-            # 6. 确保数据类型为float32 (FAISS要求)
-            return embedding.astype('float32')
+            # 2. DINOv2 特征提取
+            return {'vector': self._embed_image(img), 'crop': crop}
 
         except Exception as e:
-            logger.error(f"DINOv2特征提取失败 {image_path}: {e}")
+            logger.error(f"DINOv2特征提取失败 {source_name}: {e}")
             import traceback
             traceback.print_exc()
             return None
 
+    @property
+    def model_version_key(self) -> str:
+        """标识当前向量空间的版本：模型、量化方式、推理精度、解码或裁剪方式变化后，旧的缓存向量不再可用"""
+        crop_mode = os.path.basename(config.YOLO_MODEL_PATH) if (config.USE_YOLO_CROP and self.detector is not None) else 'center'
+        if crop_mode != 'center' and self.adaptive_crop:
+            crop_mode += '+adaptive'
+        preprocess = 'fastpp' if (self.fast_preprocess and self._pp_params is not None) else 'hfpp'
+        key = f"{config.DINO_MODEL_NAME}|{self.quantization}|{crop_mode}|{preprocess}"
+        # JPEG draft 解码与 reducing_gap 缩放得到的像素与完整解码 + LANCZOS 不同
+        if self.decode_max_size > 0:
+            key += f"|draft{self.decode_max_size}+rgap3"
+        if self._autocast_dtype is not None:
+            key += f"|{self.precision}"
+        return key
+
+    def _embed_image(self, img: Image.Image) -> np.ndarray:
+        """对已裁剪的图片运行 DINOv2，返回 L2 归一化的 float32 向量"""
+        # 预处理在调度槽位外完成，只有前向推理占用 CPU 预算
+        if self.fast_preprocess and self._pp_params is not None:
+            inputs = {'pixel_values': self._preprocess_tensor(img).to(self.device)}
+        else:
+            # 预处理（DINOv2会自动处理）
+            inputs = self.processor(images=img, return_tensors="pt").to(self.device)
+
+        # 编译后的模型只对编译时的那个模型对象和固定输入尺寸有效
+        compiled = self._compiled_model if self._compiled_for is self.model else None
+        if compiled is not None and tuple(inputs['pixel_values'].shape) != self._input_shape():
+            compiled = None
+
+        with self.scheduler.slot():
+            with torch.no_grad(), self._autocast():
+                if compiled is not None:
+                    cls_token = compiled(inputs['pixel_values'])[0]
+                else:
+                    outputs = self.model(**inputs)
+                    # 获取CLS token特征 (DINOv2的最佳实践)
+                    # outputs.last_hidden_state.shape: [1, num_patches+1, dim]
+                    # 第0个是CLS token，代表整张图的语义
+                    cls_token = outputs.last_hidden_state[0, 0, :]
+
+        # 低精度推理的输出也统一转回 float32
+        embedding = cls_token.float().cpu().numpy()
+
+        # L2归一化 (对余弦相似度至关重要)
+        norm = float(np.linalg.norm(embedding))
+        if norm > 0:
+            embedding = embedding / norm
+
+        # 确保数据类型为float32 (FAISS要求)
+        return embedding.astype('float32')
+
     def extract_features_batch(self, image_paths: List[Union[str, Path]]) -> List[Optional[np.ndarray]]:
         """批量提取特征向量"""
         results = []
@@ -421,30 +849,31 @@ class DINOv2FeatureExtractor:
             results.append(feature)
         return results
 
-    def prepare_hybrid_query(self, img_path: str) -> Optional[Dict]:
+    def prepare_hybrid_query(self, source: ImageSource) -> Optional[Dict]:
         """预先计算查询图的颜色/比例特征，便于重排序阶段复用"""
         try:
-            img = cv2.imread(img_path)
-            if img is None:
-                logger.warning(f"无法读取查询图片: {img_path}")
-                return None
-            return self._build_hybrid_signature(img)
+            return self._build_hybrid_signature(load_image(source).bgr)
         except Exception as e:
             logger.warning(f"查询图特征预计算失败: {e}")
             return None
 
     def _build_hybrid_signature(self, img: np.ndarray) -> Dict:
         """构建用于混合相似度的签名: 颜色"""
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        hist = cv2.calcHist([hsv], [0, 1], None, [18, 4], [0, 180, 0, 256])
-        cv2.normalize(hist, hist, 0, 1, cv2.NORM_MINMAX)
-
         return {
-            'hist': hist
+            'hist': compute_color_signature(img).reshape(SIGNATURE_BINS)
         }
 
-    def calculate_hybrid_similarity(self, img_path1: str, img_path2: str, dino_score: float,
-                                    query_signature: Optional[Dict] = None) -> dict:
+    def compute_color_signature(self, source: ImageSource) -> Optional[np.ndarray]:
+        """计算入库用的 72 维颜色签名（与 extract_feature 共享 LoadedImage 时不会重复解码）"""
+        try:
+            return compute_color_signature(load_image(source).bgr)
+        except Exception as e:
+            logger.warning(f"颜色签名计算失败: {e}")
+            return None
+
+    def calculate_hybrid_similarity(self, img_path1: str, img_path2: Optional[str], dino_score: float,
+                                    query_signature: Optional[Dict] = None,
+                                    candidate_signature: Optional[np.ndarray] = None) -> dict:
         """
         【新增】计算综合相似度 (Re-ranking)
 
@@ -452,41 +881,33 @@ class DINOv2FeatureExtractor:
 
         Args:
             img_path1: 查询图片路径
-            img_path2: 候选图片路径
+            img_path2: 候选图片路径（提供 candidate_signature 时不会读取）
             dino_score: DINOv2原始相似度分数
+            candidate_signature: 入库时预先计算的 72 维颜色签名
 
         Returns:
             dict: {'score': 综合分数, 'details': {'dino': ..., 'color': ..., 'ratio': ...}}
         """
         try:
             if query_signature is None:
-                img1 = cv2.imread(img_path1)
-                if img1 is None:
+                query_signature = self.prepare_hybrid_query(img_path1)
+                if query_signature is None:
                     logger.warning(f"无法读取图片，使用原始DINO分数: {img_path1}")
                     return {'score': dino_score, 'details': {}}
-                query_signature = self._build_hybrid_signature(img1)
 
-            img2 = cv2.imread(img_path2)
-            if img2 is None:
-                logger.warning(f"无法读取图片，使用原始DINO分数: {img_path2}")
-                return {'score': dino_score, 'details': {}}
-
-            candidate_signature = self._build_hybrid_signature(img2)
-
-            # 颜色相似度 (H+S, 降低光照影响)
-            color_score = cv2.compareHist(
-                query_signature['hist'],
-                candidate_signature['hist'],
-                cv2.HISTCMP_CORREL
-            )
-            color_score = max(0.0, color_score)
-
-            # 如果DINO很高，优先尊重语义/结构鲁棒性
-            if dino_score > 0.85:
-                final_score = dino_score
+            if candidate_signature is not None:
+                candidate_hist = np.asarray(candidate_signature, dtype=np.float32).reshape(SIGNATURE_BINS)
             else:
-                # 仅使用 DINO + 颜色
-                final_score = (dino_score * 0.70) + (color_score * 0.30)
+                img2 = cv2.imread(img_path2) if img_path2 else None
+                if img2 is None:
+                    logger.warning(f"无法读取图片，使用原始DINO分数: {img_path2}")
+                    return {'score': dino_score, 'details': {}}
+                candidate_hist = self._build_hybrid_signature(img2)['hist']
+
+            # 颜色相似度 (H+S, 降低光照影响)，权重与阈值由 HybridReranker 统一管理
+            pair = get_hybrid_reranker().score_pair(query_signature['hist'], candidate_hist, dino_score)
+            color_score = pair['color']
+            final_score = pair['score']
 
             logger.debug(
                 "综合评分: DINO=%.3f, Color=%.3f, Final=%.3f",
@@ -513,6 +934,13 @@ class DINOv2FeatureExtractor:
         """获取AI模型状态和性能信息"""
         status = {
             'device': str(self.device),
+            'quantization': self.quantization,
+            'fast_preprocess': bool(self.fast_preprocess and self._pp_params is not None),
+            'compile_mode': self.compile_mode,
+            'precision': self.precision,
+            'precision_drift': self.precision_drift,
+            'warmed_up': self.warmed_up,
+            'decode_max_size': self.decode_max_size,
             'yolo_available': self.detector is not None,
             'yolo_type': 'None'
         }
@@ -527,6 +955,13 @@ class DINOv2FeatureExtractor:
                 status['target_classes_count'] = len(self.target_classes) if self.target_classes else 0
 
         status['detection_cache_size'] = len(self._detection_cache)
+        status['detection_cache'] = self._detection_cache.stats()
+        with self._crop_stats_lock:
+            crop_stats = dict(self._crop_stats)
+        decided = crop_stats['detector_run'] + crop_stats['detector_skipped']
+        crop_stats['adaptive_enabled'] = self.adaptive_crop
+        crop_stats['skip_rate'] = round(crop_stats['detector_skipped'] / decided, 4) if decided else 0.0
+        status['crop_policy'] = crop_stats
         status['confidence_threshold'] = 0.05
         status['iou_threshold'] = 0.5
 
@@ -537,9 +972,6 @@ class DINOv2FeatureExtractor:
         elif status['yolo_type'] == 'YOLOv8-Nano':
             tips.append("当前使用YOLOv8-Nano，建议升级依赖以启用YOLO-World获得更好效果")
 
-        if status['detection_cache_size'] > 1000:
-            tips.append("检测缓存较大，考虑定期清理缓存")
-
         status['performance_tips'] = tips if tips else ["AI模型运行正常"]
 
         return status
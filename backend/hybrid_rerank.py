@@ -0,0 +1,96 @@
+import logging
+from typing import Dict, Optional
+import numpy as np
+try:
+    from .config import config
+except ImportError:
+    from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class HybridReranker:
+    """
+    混合重排序器 (DINO 语义分 + 颜色分)
+    一次性对整个候选集计算颜色相关系数和综合分，代替逐个候选调用 cv2.compareHist。
+
+    相关系数与 cv2.HISTCMP_CORREL 等价：
+        corr = Σ(q - q̄)(c - c̄) / sqrt(Σ(q - q̄)² · Σ(c - c̄)²)
+    分母为 0（直方图为常数）时与 OpenCV 一致返回 1.0。
+    """
+
+    def __init__(self, dino_weight: float = 0.70, color_weight: float = 0.30, bypass_threshold: float = 0.85):
+        self.dino_weight = float(dino_weight)
+        self.color_weight = float(color_weight)
+        # DINO 分高于该阈值时直接采用 DINO 分，优先尊重语义/结构鲁棒性
+        self.bypass_threshold = float(bypass_threshold)
+
+    @staticmethod
+    def color_correlations(query_signature: np.ndarray, candidate_matrix: np.ndarray) -> np.ndarray:
+        """查询签名 (72,) 与候选矩阵 (n, 72) 的相关系数，返回 (n,)"""
+        q = np.asarray(query_signature, dtype=np.float64).reshape(-1)
+        c = np.asarray(candidate_matrix, dtype=np.float64).reshape(len(candidate_matrix), -1)
+        if c.shape[0] == 0:
+            return np.zeros(0, dtype=np.float64)
+
+        qc = q - q.mean()
+        cc = c - c.mean(axis=1, keepdims=True)
+        numerator = cc @ qc
+        denominator = np.sum(cc * cc, axis=1) * np.dot(qc, qc)
+
+        corr = np.ones(c.shape[0], dtype=np.float64)
+        valid = np.abs(denominator) > np.finfo(np.float64).eps
+        corr[valid] = numerator[valid] / np.sqrt(denominator[valid])
+        return corr
+
+    def rerank(self, query_signature: Optional[np.ndarray], candidate_matrix: np.ndarray,
+               dino_scores: np.ndarray, mask: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """对整个候选集打分并排序
+
+        Args:
+            query_signature: 查询图 72 维颜色签名（为空时全部使用 DINO 分）
+            candidate_matrix: (n, 72) 候选颜色签名
+            dino_scores: (n,) DINOv2 原始相似度
+            mask: (n,) 候选签名是否可用，不可用的候选保留 DINO 分
+
+        Returns:
+            {'scores': 综合分, 'color': 颜色分 (不可用为 NaN), 'order': 按综合分降序的下标}
+        """
+        dino = np.asarray(dino_scores, dtype=np.float64).reshape(-1)
+        n = dino.shape[0]
+        available = np.ones(n, dtype=bool) if mask is None else np.asarray(mask, dtype=bool).reshape(-1)
+
+        color = np.full(n, np.nan, dtype=np.float64)
+        scores = dino.copy()
+
+        if query_signature is not None and n and available.any():
+            corr = self.color_correlations(query_signature, np.asarray(candidate_matrix)[available])
+            color[available] = np.maximum(0.0, corr)
+
+            blended = dino * self.dino_weight + np.nan_to_num(color) * self.color_weight
+            use_blend = available & (dino <= self.bypass_threshold)
+            scores = np.where(use_blend, blended, dino)
+
+        # 稳定排序：分数相同时保持 FAISS 召回顺序
+        order = np.argsort(-scores, kind='stable')
+        return {'scores': scores, 'color': color, 'order': order}
+
+    def score_pair(self, query_signature: np.ndarray, candidate_signature: np.ndarray, dino_score: float) -> Dict:
+        """单个候选的综合分 (兼容逐对调用)"""
+        result = self.rerank(query_signature, np.asarray(candidate_signature).reshape(1, -1), [dino_score])
+        return {'score': float(result['scores'][0]), 'color': float(result['color'][0])}
+
+
+# 全局单例
+_reranker = None
+
+
+def get_hybrid_reranker() -> HybridReranker:
+    global _reranker
+    if _reranker is None:
+        _reranker = HybridReranker(
+            dino_weight=config.HYBRID_DINO_WEIGHT,
+            color_weight=config.HYBRID_COLOR_WEIGHT,
+            bypass_threshold=config.HYBRID_BYPASS_THRESHOLD
+        )
+    return _reranker
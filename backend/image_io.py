@@ -0,0 +1,108 @@
+import hashlib
+from pathlib import Path
+from typing import Optional, Union
+import numpy as np
+from PIL import Image
+try:
+    from .config import config
+except ImportError:
+    from config import config
+
+# 本模块只依赖 PIL/numpy，可以在不加载 torch 的情况下使用（例如 Web 进程启动阶段）
+
+
+def decode_image_bytes(data: bytes, max_size: int = 0) -> Image.Image:
+    """解码图片为 RGB
+
+    JPEG 且 max_size > 0 时使用 draft 模式：解码器按 1/2、1/4、1/8 做 DCT 缩放，
+    直接得到不小于目标尺寸的图片，省掉对 1500~3000px 大图的完整解码和后续大比例缩放。
+    """
+    import io
+    img = Image.open(io.BytesIO(data))
+    if max_size and img.format == 'JPEG':
+        w, h = img.size
+        if max(w, h) > max_size:
+            scale = max_size / max(w, h)
+            img.draft('RGB', (max(1, int(w * scale)), max(1, int(h * scale))))
+    return img.convert("RGB")
+
+
+class LoadedImage:
+    """一次读取、一次解码、多阶段共享的图片
+
+    pil: RGB 的 PIL 图片（DINOv2 裁剪/推理使用），首次访问时才解码
+    bgr: 按需生成的 BGR ndarray（YOLO 检测、颜色直方图使用，只转换一次）
+    content_hash: 原始字节的 MD5（检测缓存 / embedding 缓存的键），不需要解码即可得到
+    """
+
+    __slots__ = ('_pil', '_data', 'content_hash', 'source_name', '_bgr')
+
+    def __init__(self, pil: Optional[Image.Image] = None, content_hash: Optional[str] = None,
+                 source_name: str = '<memory>', data: Optional[bytes] = None):
+        self._pil = pil
+        self._data = data
+        self.content_hash = content_hash
+        self.source_name = source_name
+        self._bgr = None
+
+    @property
+    def pil(self) -> Image.Image:
+        if self._pil is None:
+            self._pil = decode_image_bytes(self._data, getattr(config, 'AI_DECODE_MAX_SIZE', 0))
+            self._data = None
+        return self._pil
+
+    @property
+    def size(self):
+        return self.pil.size
+
+    @property
+    def bgr(self) -> np.ndarray:
+        if self._bgr is None:
+            self._bgr = np.ascontiguousarray(np.asarray(self.pil)[:, :, ::-1])
+        return self._bgr
+
+
+ImageSource = Union[str, Path, bytes, bytearray, memoryview, np.ndarray, Image.Image, LoadedImage]
+
+
+def load_image(source: ImageSource) -> LoadedImage:
+    """把路径 / 字节 / 解码后的数组统一转换为 LoadedImage（只读取和解码一次）
+
+    ndarray 按 OpenCV 约定视为 BGR（灰度图也可）。
+    """
+    if isinstance(source, LoadedImage):
+        return source
+
+    if isinstance(source, Image.Image):
+        pil = source if source.mode == 'RGB' else source.convert('RGB')
+        return LoadedImage(pil, hashlib.md5(pil.tobytes()).hexdigest())
+
+    if isinstance(source, np.ndarray):
+        import cv2
+        if source.ndim == 2:
+            rgb = cv2.cvtColor(source, cv2.COLOR_GRAY2RGB)
+        elif source.shape[2] == 4:
+            rgb = cv2.cvtColor(source, cv2.COLOR_BGRA2RGB)
+        else:
+            rgb = cv2.cvtColor(source, cv2.COLOR_BGR2RGB)
+        loaded = LoadedImage(Image.fromarray(rgb), hashlib.md5(source.tobytes()).hexdigest())
+        if source.ndim == 3 and source.shape[2] == 3:
+            loaded._bgr = np.ascontiguousarray(source)
+        return loaded
+
+    source_name = '<memory>'
+    if isinstance(source, (str, Path)):
+        source_name = str(source)
+        with open(source_name, 'rb') as f:
+            data = f.read()
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+    else:
+        raise TypeError(f"不支持的图片类型: {type(source).__name__}")
+
+    if not data:
+        raise ValueError(f"图片内容为空: {source_name}")
+
+    # 只计算哈希，解码推迟到真正需要像素时（命中 embedding 缓存时可完全跳过解码）
+    return LoadedImage(None, hashlib.md5(data).hexdigest(), source_name, data=data)
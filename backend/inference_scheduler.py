@@ -0,0 +1,179 @@
+import os
+import time
+import heapq
+import itertools
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    from config import config
+except ImportError:
+    from .config import config
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越优先
+INTERACTIVE = 0  # 机器人/网页搜索、过滤图上传等需要立即返回的请求
+BULK = 1         # 店铺抓取入库、重建索引等批量任务
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def get_thread_settings() -> Dict[str, int]:
+    """AI 线程预算：slots 个推理任务并发，每个任务使用 intra_threads 个核心"""
+    intra_threads = max(1, int(getattr(config, 'AI_INTRA_THREADS', 4)))
+    slots = max(1, int(getattr(config, 'AI_MAX_WORKERS', 2)))
+    return {'intra_threads': intra_threads, 'slots': slots, 'cpu_budget': intra_threads * slots}
+
+
+def apply_thread_env():
+    """在导入 torch/faiss 之前设置底层计算库线程数（唯一入口，值来自 config）"""
+    intra_threads = str(get_thread_settings()['intra_threads'])
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = intra_threads
+
+
+def apply_torch_threads(torch_module):
+    """torch 导入后显式设置线程数，interop 线程固定为 1，并发由调度器控制"""
+    intra_threads = get_thread_settings()['intra_threads']
+    try:
+        torch_module.set_num_threads(intra_threads)
+    except Exception as e:
+        logger.debug(f"设置 torch 线程数失败: {e}")
+    try:
+        torch_module.set_num_interop_threads(1)
+    except Exception:
+        pass  # 已有并行任务运行过时不允许再设置
+
+
+class InferenceScheduler:
+    """
+    CPU 推理调度器
+    统一管理 AI 推理的核心预算：同一时间最多 slots 个模型调用（YOLO 或 DINOv2 单次前向），
+    等待中的请求按优先级出队，同优先级先到先得。批量任务每次模型调用都重新排队，
+    交互请求最多等待一次正在进行的前向推理，抓取上万张图时机器人回复依然及时。
+    """
+
+    def __init__(self, slots: int, bulk_slots: Optional[int] = None):
+        self.slots = max(1, int(slots))
+        # 批量任务最多同时占用的槽位数，预留的槽位只给交互请求
+        self.bulk_slots = self.slots if bulk_slots is None else max(1, min(self.slots, int(bulk_slots)))
+        self._cond = threading.Condition()
+        self._waiters = []  # 堆: (priority, seq)
+        self._seq = itertools.count()
+        self._running = {INTERACTIVE: 0, BULK: 0}
+        self._granted = {INTERACTIVE: 0, BULK: 0}
+        self._waits = {INTERACTIVE: deque(maxlen=500), BULK: deque(maxlen=500)}
+        self._local = threading.local()
+
+    # --- 线程优先级 ---
+
+    def current_priority(self) -> int:
+        return getattr(self._local, 'priority', INTERACTIVE)
+
+    @contextmanager
+    def priority(self, level: int):
+        """设置当前线程后续模型调用的优先级（可嵌套）"""
+        previous = self.current_priority()
+        self._local.priority = level
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    # --- 槽位 ---
+
+    def _can_run(self, priority: int, seq: int) -> bool:
+        if sum(self._running.values()) >= self.slots:
+            return False
+        if priority == BULK and self._running[BULK] >= self.bulk_slots:
+            return False
+        # 轮到自己：自己是队首，或者排在前面的都是暂时受限的批量任务
+        for waiter_priority, waiter_seq in sorted(self._waiters):
+            if waiter_seq == seq:
+                return True
+            if waiter_priority == BULK and self._running[BULK] >= self.bulk_slots:
+                continue
+            return False
+        return False
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None):
+        """占用一个推理槽位，priority 为空时使用当前线程的优先级"""
+        if priority is None:
+            priority = self.current_priority()
+        seq = next(self._seq)
+        began = time.perf_counter()
+
+        with self._cond:
+            entry = (priority, seq)
+            heapq.heappush(self._waiters, entry)
+            try:
+                while not self._can_run(priority, seq):
+                    self._cond.wait()
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            self._running[priority] += 1
+            self._granted[priority] += 1
+            self._waits[priority].append((time.perf_counter() - began) * 1000)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[priority] -= 1
+                self._cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            queued = {INTERACTIVE: 0, BULK: 0}
+            for waiter_priority, _ in self._waiters:
+                queued[waiter_priority] += 1
+            classes = {}
+            for level, name in PRIORITY_NAMES.items():
+                waits = sorted(self._waits[level])
+                classes[name] = {
+                    'running': self._running[level],
+                    'queued': queued[level],
+                    'granted': self._granted[level],
+                    'wait_ms_avg': round(sum(waits) / len(waits), 1) if waits else 0.0,
+                    'wait_ms_p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 1) if waits else 0.0,
+                    'wait_ms_max': round(waits[-1], 1) if waits else 0.0
+                }
+        return {
+            **get_thread_settings(),
+            'bulk_slots': self.bulk_slots,
+            'queue_depth': sum(queued.values()),
+            'classes': classes
+        }
+
+
+# 全局单例
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_inference_scheduler() -> InferenceScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                settings = get_thread_settings()
+                reserved = max(0, int(getattr(config, 'AI_INTERACTIVE_RESERVED_SLOTS', 0)))
+                _scheduler = InferenceScheduler(settings['slots'], settings['slots'] - reserved)
+                logger.info(
+                    f"🧮 推理调度器: {settings['slots']} 个槽位 x {settings['intra_threads']} 线程, "
+                    f"批量任务最多 {_scheduler.bulk_slots} 个"
+                )
+    return _scheduler
+
+
+def inference_priority(level: int):
+    """当前线程后续的模型调用使用指定优先级"""
+    return get_inference_scheduler().priority(level)
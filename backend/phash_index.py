@@ -0,0 +1,183 @@
+import logging
+import threading
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+BAND_COUNT = 4
+BAND_BITS = HASH_BITS // BAND_COUNT
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def compute_dhash(img: Image.Image) -> int:
+    """64 位差值哈希 (dHash)：缩到 9x8 灰度，比较相邻像素亮度
+
+    对重新压缩、缩放、轻微调色不敏感，计算成本远低于一次神经网络推理。
+    """
+    gray = np.asarray(img.convert('L').resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def to_signed64(value: int) -> int:
+    """SQLite INTEGER 是有符号 64 位，存库前转换"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def from_signed64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def _band_variants(band: int, radius: int):
+    """枚举与 band 汉明距离 <= radius 的所有 16 位取值"""
+    yield band
+    for r in range(1, radius + 1):
+        for positions in combinations(range(BAND_BITS), r):
+            flipped = band
+            for pos in positions:
+                flipped ^= (1 << pos)
+            yield flipped
+
+
+class PHashIndex:
+    """
+    感知哈希近重复索引 (Multi-Index Hashing)
+    64 位哈希切成 4 段 16 位，每段建一个倒排表。由鸽巢原理，汉明距离 <= d 的两个哈希
+    至少有一段的距离 <= d // 4，因此只需探测少量段取值即可找出全部候选，再精确计算距离。
+    入库和搜索时先查该索引：完全/近似重复的图片直接复用已有向量，只有新图片才跑模型。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bands: List[Dict[int, set]] = [dict() for _ in range(BAND_COUNT)]
+        self._entries: Dict[int, Tuple[int, int]] = {}  # image_id -> (hash, product_id)
+        self._loaded = False
+        self.lookups = 0
+        self.matches = 0
+
+    @staticmethod
+    def _split(value: int) -> List[int]:
+        return [(value >> (i * BAND_BITS)) & BAND_MASK for i in range(BAND_COUNT)]
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                try:
+                    from database import db
+                except ImportError:
+                    from .database import db
+                count = 0
+                for image_id, product_id, phash in db.iter_image_phashes():
+                    self._add_locked(image_id, from_signed64(phash), product_id)
+                    count += 1
+                logger.info(f"🔑 感知哈希索引已加载: {count} 条")
+            except Exception as e:
+                logger.error(f"加载感知哈希失败: {e}")
+            self._loaded = True
+
+    def _add_locked(self, image_id: int, value: int, product_id: int):
+        if image_id in self._entries:
+            self._remove_locked(image_id)
+        self._entries[image_id] = (value, product_id)
+        for band_index, band in enumerate(self._split(value)):
+            self._bands[band_index].setdefault(band, set()).add(image_id)
+
+    def _remove_locked(self, image_id: int):
+        entry = self._entries.pop(image_id, None)
+        if entry is None:
+            return
+        for band_index, band in enumerate(self._split(entry[0])):
+            bucket = self._bands[band_index].get(band)
+            if bucket is not None:
+                bucket.discard(image_id)
+                if not bucket:
+                    del self._bands[band_index][band]
+
+    def add(self, image_id: int, value: Optional[int], product_id: int):
+        """入库后登记（索引尚未加载时等首次加载从数据库读取）"""
+        if value is None or not self._loaded:
+            return
+        with self._lock:
+            self._add_locked(int(image_id), value, product_id)
+
+    def remove(self, image_ids):
+        with self._lock:
+            for image_id in image_ids:
+                self._remove_locked(int(image_id))
+
+    def query(self, value: int, max_distance: int = 4, product_id: Optional[int] = None) -> List[Dict]:
+        """查找汉明距离 <= max_distance 的图片，按距离升序
+
+        Args:
+            product_id: 指定时只返回该商品下的图片
+        """
+        self._ensure_loaded()
+        sub_radius = max_distance // BAND_COUNT
+        candidates = set()
+        with self._lock:
+            self.lookups += 1
+            for band_index, band in enumerate(self._split(value)):
+                table = self._bands[band_index]
+                for variant in _band_variants(band, sub_radius):
+                    bucket = table.get(variant)
+                    if bucket:
+                        candidates.update(bucket)
+
+            results = []
+            for image_id in candidates:
+                stored, owner = self._entries[image_id]
+                if product_id is not None and owner != product_id:
+                    continue
+                distance = hamming_distance(value, stored)
+                if distance <= max_distance:
+                    results.append({'image_id': image_id, 'product_id': owner, 'distance': distance})
+
+            if results:
+                self.matches += 1
+
+        results.sort(key=lambda item: (item['distance'], item['image_id']))
+        return results
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'loaded': self._loaded,
+                'hashes': len(self._entries),
+                'lookups': self.lookups,
+                'matches': self.matches,
+                'match_rate': round(self.matches / self.lookups, 4) if self.lookups else 0.0
+            }
+
+
+# 全局单例
+_phash_index = None
+_phash_index_lock = threading.Lock()
+
+
+def get_phash_index() -> PHashIndex:
+    global _phash_index
+    if _phash_index is None:
+        with _phash_index_lock:
+            if _phash_index is None:
+                _phash_index = PHashIndex()
+                try:
+                    from database import db
+                except ImportError:
+                    from .database import db
+                db.add_image_delete_listener(_phash_index.remove)
+    return _phash_index
@@ -0,0 +1,268 @@
+import re
+import logging
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 短语最短长度（与机器人关键词匹配规则一致，单个字符不作为短语）
+MIN_PHRASE_LENGTH = 2
+# 新增短语累计到该数量后重建自动机，之前的新增短语逐个做子串检查
+REBUILD_PENDING_THRESHOLD = 256
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_KEYWORD_SPLIT_RE = re.compile(r'[,，]')
+
+
+def normalize_phrase(value: str) -> str:
+    """合并空白并转小写（与机器人 handle_keyword_search 的规范化一致）"""
+    return _WHITESPACE_RE.sub(' ', value or '').strip().lower()
+
+
+def extract_product_phrases(title: Optional[str], english_title: Optional[str]) -> Dict[str, str]:
+    """商品的匹配短语 -> 来源字段：英文标题按中英文逗号拆分的关键词 + 完整标题"""
+    phrases = {}
+    for part in _KEYWORD_SPLIT_RE.split(english_title or ''):
+        phrase = normalize_phrase(part)
+        if len(phrase) >= MIN_PHRASE_LENGTH:
+            phrases.setdefault(phrase, 'english_title')
+    phrase = normalize_phrase(title or '')
+    if len(phrase) >= MIN_PHRASE_LENGTH:
+        phrases.setdefault(phrase, 'title')
+    return phrases
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机（构建后只读）
+    一次线性扫描找出文本中出现的全部短语。转移表用 节点 * 0x110000 + 字符码 作为键存在一个字典里，
+    比每个节点一个字典省内存。
+    """
+
+    _RADIX = 0x110000
+
+    def __init__(self, phrases: Iterable[str]):
+        self._goto: Dict[int, int] = {}
+        self._fail: List[int] = [0]
+        self._output: Dict[int, str] = {}   # 节点 -> 以该节点结尾的短语
+        self._next_output: List[int] = [0]  # 沿失败链最近的一个输出节点 (0 表示没有)
+        self.phrase_count = 0
+
+        children: List[List[Tuple[int, int]]] = [[]]
+        for phrase in phrases:
+            if not phrase:
+                continue
+            node = 0
+            for ch in phrase:
+                key = node * self._RADIX + ord(ch)
+                child = self._goto.get(key)
+                if child is None:
+                    child = len(self._fail)
+                    self._goto[key] = child
+                    self._fail.append(0)
+                    self._next_output.append(0)
+                    children.append([])
+                    children[node].append((ord(ch), child))
+                node = child
+            if node not in self._output:
+                self._output[node] = phrase
+                self.phrase_count += 1
+
+        # BFS 计算失败链接
+        queue = deque(child for _, child in children[0])
+        while queue:
+            node = queue.popleft()
+            for code, child in children[node]:
+                fail = self._fail[node]
+                while fail and (fail * self._RADIX + code) not in self._goto:
+                    fail = self._fail[fail]
+                target = self._goto.get(fail * self._RADIX + code, 0)
+                self._fail[child] = target if target != child else 0
+                self._next_output[child] = target if target in self._output else self._next_output[target]
+                queue.append(child)
+
+    @property
+    def node_count(self) -> int:
+        return len(self._fail)
+
+    def find_all(self, text: str) -> Set[str]:
+        """返回文本中出现的全部短语"""
+        found = set()
+        node = 0
+        goto = self._goto
+        fail = self._fail
+        radix = self._RADIX
+        for ch in text:
+            code = ord(ch)
+            while node and (node * radix + code) not in goto:
+                node = fail[node]
+            node = goto.get(node * radix + code, 0)
+            out = node if node in self._output else self._next_output[node]
+            while out:
+                found.add(self._output[out])
+                out = self._next_output[out]
+        return found
+
+
+class PhraseIndex:
+    """
+    商品短语反向索引："消息中包含了哪些商品的短语"
+    短语字典随商品增删改增量维护：变更只登记商品ID，下次查询时批量读取这些商品更新字典；
+    新增短语先逐个做子串检查，累计到阈值（或删除的短语过多）才重建自动机，抓取入库期间不会频繁重建。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._phrase_products: Dict[str, Dict[int, str]] = {}  # 短语 -> {商品ID: 来源字段}
+        self._product_phrases: Dict[int, Tuple[str, ...]] = {}
+        self._automaton: Optional[AhoCorasick] = None
+        self._built_phrases: Set[str] = set()
+        self._pending: Set[str] = set()     # 尚未进入自动机的短语
+        self._dirty_ids: Set[int] = set()
+        self._reload_all = False
+        self._loaded = False
+        self.rebuilds = 0
+        self.queries = 0
+        self.matches = 0
+
+    def _db(self):
+        try:
+            from database import db
+        except ImportError:
+            from .database import db
+        return db
+
+    # --- 维护 ---
+
+    def mark_products_changed(self, product_ids=None):
+        """商品表写入后调用（由数据库层通知）；product_ids 为空表示全部重新加载"""
+        with self._lock:
+            if not self._loaded:
+                return
+            if product_ids is None:
+                self._reload_all = True
+                return
+            for pid in product_ids:
+                try:
+                    self._dirty_ids.add(int(pid))
+                except (TypeError, ValueError):
+                    continue
+
+    def _set_product_locked(self, product_id: int, phrases: Dict[str, str]):
+        for phrase in self._product_phrases.pop(product_id, ()):
+            owners = self._phrase_products.get(phrase)
+            if owners is not None:
+                owners.pop(product_id, None)
+                if not owners:
+                    del self._phrase_products[phrase]
+                    self._pending.discard(phrase)
+        if not phrases:
+            return
+        self._product_phrases[product_id] = tuple(phrases)
+        for phrase, source in phrases.items():
+            self._phrase_products.setdefault(phrase, {})[product_id] = source
+            if phrase not in self._built_phrases:
+                self._pending.add(phrase)
+
+    def _rebuild_locked(self):
+        self._automaton = AhoCorasick(self._phrase_products.keys())
+        self._built_phrases = set(self._phrase_products)
+        self._pending.clear()
+        self.rebuilds += 1
+
+    def _load_all_locked(self):
+        self._phrase_products.clear()
+        self._product_phrases.clear()
+        self._built_phrases = set()
+        self._dirty_ids.clear()
+        self._reload_all = False
+        count = 0
+        for product_id, title, english_title in self._db().iter_product_titles():
+            self._set_product_locked(product_id, extract_product_phrases(title, english_title))
+            count += 1
+        self._rebuild_locked()
+        logger.info(f"🔤 商品短语索引已加载: {count} 个商品, {len(self._phrase_products)} 个短语, "
+                    f"{self._automaton.node_count} 个节点")
+
+    def _refresh_locked(self):
+        if not self._loaded or self._reload_all:
+            try:
+                self._load_all_locked()
+            except Exception as e:
+                logger.error(f"加载商品短语索引失败: {e}")
+            self._loaded = True
+            return
+        if self._dirty_ids:
+            dirty = list(self._dirty_ids)
+            self._dirty_ids.clear()
+            rows = self._db().get_products_by_ids(dirty)
+            for product_id in dirty:
+                row = rows.get(product_id)
+                phrases = extract_product_phrases(row.get('title'), row.get('english_title')) if row else {}
+                self._set_product_locked(product_id, phrases)
+        # 自动机中失效的短语超过一半时也重建，回收节点
+        stale = len(self._built_phrases) - (len(self._phrase_products) - len(self._pending))
+        if len(self._pending) > REBUILD_PENDING_THRESHOLD or stale > len(self._built_phrases) // 2 + REBUILD_PENDING_THRESHOLD:
+            self._rebuild_locked()
+
+    # --- 查询 ---
+
+    def match(self, text: str, limit: Optional[int] = None) -> List[Dict]:
+        """找出短语出现在文本中的商品，按命中短语长度降序、商品ID降序（新商品在前）
+
+        Returns:
+            [{'product_id', 'phrase', 'source'}, ...]，每个商品只返回最长的命中短语
+        """
+        query = normalize_phrase(text)
+        if len(query) < MIN_PHRASE_LENGTH:
+            return []
+        with self._lock:
+            self._refresh_locked()
+            self.queries += 1
+            found = self._automaton.find_all(query) if self._automaton else set()
+            found.update(phrase for phrase in self._pending if phrase in query)
+
+            best: Dict[int, Tuple[str, str]] = {}
+            for phrase in found:
+                for product_id, source in self._phrase_products.get(phrase, {}).items():
+                    current = best.get(product_id)
+                    if current is None or len(phrase) > len(current[0]):
+                        best[product_id] = (phrase, source)
+            if best:
+                self.matches += 1
+
+        ordered = sorted(best.items(), key=lambda item: (-len(item[1][0]), -item[0]))
+        if limit is not None:
+            ordered = ordered[:limit]
+        return [{'product_id': pid, 'phrase': phrase, 'source': source} for pid, (phrase, source) in ordered]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'loaded': self._loaded,
+                'products': len(self._product_phrases),
+                'phrases': len(self._phrase_products),
+                'pending_phrases': len(self._pending),
+                'dirty_products': len(self._dirty_ids),
+                'automaton_nodes': self._automaton.node_count if self._automaton else 0,
+                'rebuilds': self.rebuilds,
+                'queries': self.queries,
+                'matches': self.matches,
+                'match_rate': round(self.matches / self.queries, 4) if self.queries else 0.0
+            }
+
+
+# 全局单例
+_phrase_index = None
+_phrase_index_lock = threading.Lock()
+
+
+def get_phrase_index() -> PhraseIndex:
+    global _phrase_index
+    if _phrase_index is None:
+        with _phrase_index_lock:
+            if _phrase_index is None:
+                _phrase_index = PhraseIndex()
+                _phrase_index._db().add_product_change_listener(_phrase_index.mark_products_changed)
+    return _phrase_index
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+推理延迟基准测试脚本
+
+对比不同 DINOv2 编译模式 (none / trace / compile) 的：
+- 模型加载 + 编译耗时
+- 首个请求延迟（预热前 / 预热后）
+- 稳态延迟 p50 / p95
+- 与 eager 模式向量的最大余弦漂移（确认编译没有改变结果）
+
+使用方法:
+cd backend
+python3 scripts/benchmark_inference.py --modes none trace compile --runs 50
+python3 scripts/benchmark_inference.py --modes none trace --images data/scraped_images/xxx.jpg
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# 确保在正确的目录下运行
+if not os.path.exists('database.py'):
+    print("❌ 请在 backend 目录下运行此脚本")
+    print("正确用法:")
+    print("  cd backend")
+    print("  python3 scripts/benchmark_inference.py --modes none trace")
+    sys.exit(1)
+
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+from PIL import Image
+
+from feature_extractor import DINOv2FeatureExtractor, COMPILE_MODES
+
+
+def load_inputs(paths, count):
+    """加载测试图片（不指定时生成随机图片），返回已缩放的 PIL 图片列表"""
+    images = []
+    for path in paths or []:
+        try:
+            images.append(Image.open(path).convert("RGB"))
+        except Exception as e:
+            print(f"⚠️ 跳过 {path}: {e}")
+    if not images:
+        rng = np.random.default_rng(0)
+        images = [Image.fromarray(rng.integers(0, 256, size=(448, 448, 3), dtype=np.uint8)) for _ in range(count)]
+    return images
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def benchmark_mode(mode, images, args, reference_vectors=None):
+    start = time.perf_counter()
+    extractor = DINOv2FeatureExtractor(compile_mode=mode)
+    load_s = time.perf_counter() - start
+    inputs = [extractor._resize_for_ai(img) for img in images]
+
+    # 首个请求（预热前）
+    start = time.perf_counter()
+    extractor._embed_image(inputs[0])
+    first_ms = (time.perf_counter() - start) * 1000
+
+    warmup = extractor.warmup(args.warmup)
+
+    # 首个请求（预热后，换一张图）
+    start = time.perf_counter()
+    extractor._embed_image(inputs[-1])
+    first_after_warmup_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    vectors = []
+    for i in range(args.runs):
+        img = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        vec = extractor._embed_image(img)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if i < len(inputs):
+            vectors.append(vec)
+
+    drift = None
+    if reference_vectors is not None:
+        drift = max(1.0 - float(np.dot(a, b)) for a, b in zip(reference_vectors, vectors))
+
+    return {
+        'mode': extractor.compile_mode,
+        'requested_mode': mode,
+        'load_s': round(load_s, 3),
+        'first_request_ms': round(first_ms, 1),
+        'first_request_after_warmup_ms': round(first_after_warmup_ms, 1),
+        'warmup': warmup,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'max_cosine_drift_vs_eager': drift
+    }, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DINOv2 推理模式延迟基准测试')
+    parser.add_argument('--modes', nargs='+', choices=list(COMPILE_MODES), default=['none', 'trace'])
+    parser.add_argument('--images', nargs='*', help='测试图片路径（默认使用随机图片）')
+    parser.add_argument('--runs', type=int, default=50, help='稳态测量次数')
+    parser.add_argument('--warmup', type=int, default=2, help='预热次数')
+    parser.add_argument('--output', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    images = load_inputs(args.images, count=8)
+    modes = list(dict.fromkeys(['none'] + args.modes))  # eager 作为基准总是先跑
+
+    results = []
+    reference_vectors = None
+    for mode in modes:
+        print(f"⏱️ 测试模式: {mode}")
+        result, vectors = benchmark_mode(mode, images, args, reference_vectors)
+        if mode == 'none':
+            reference_vectors = vectors
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📝 结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
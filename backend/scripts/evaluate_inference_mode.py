@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+推理模式精度评估脚本
+
+在留出样本上对比 float32 基准模型与候选推理模式 (如 INT8 动态量化、bf16/fp16 推理、张量快速预处理、自适应裁剪、JPEG 快速解码)：
+基准始终使用完整解码 + LANCZOS 缩放、YOLO 裁剪，与现有索引的生成方式一致
+- top-1 一致率：两种向量在 float32 FAISS 索引中检索到的最佳匹配（排除自身）是否为同一商品
+- 分数漂移：最佳匹配相似度差值、两种向量之间的余弦距离
+- 单张推理耗时
+
+使用方法:
+cd backend
+python3 scripts/evaluate_inference_mode.py --quantization int8_dynamic --samples 200
+python3 scripts/evaluate_inference_mode.py --quantization none --fast-preprocess
+python3 scripts/evaluate_inference_mode.py --quantization none --precision bf16
+python3 scripts/evaluate_inference_mode.py --quantization none --adaptive-crop
+python3 scripts/evaluate_inference_mode.py --quantization none --decode-max-size 896
+
+达标时退出码为 0，否则为 1，可直接用于上线前的门禁检查。
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+import threading
+
+# 确保在正确的目录下运行
+if not os.path.exists('database.py'):
+    print("❌ 请在 backend 目录下运行此脚本")
+    print("正确用法:")
+    print("  cd backend")
+    print("  python3 scripts/evaluate_inference_mode.py --quantization int8_dynamic")
+    sys.exit(1)
+
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+
+from cache_utils import BoundedLRUCache
+from database import db
+from vector_engine import get_vector_engine
+from image_io import LoadedImage, decode_image_bytes
+from feature_extractor import DINOv2FeatureExtractor, quantize_model_int8, estimate_model_size_mb, PRECISION_MODES
+
+
+def sample_held_out_images(sample_size, seed):
+    """从 product_images 随机抽取图片文件仍然存在的记录"""
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, product_id, image_path FROM product_images WHERE image_path IS NOT NULL")
+        rows = [dict(row) for row in cursor.fetchall()]
+
+    rows = [row for row in rows if row['image_path'] and os.path.exists(row['image_path'])]
+    random.Random(seed).shuffle(rows)
+    return rows[:sample_size]
+
+
+def build_candidate(reference, args):
+    """基于基准提取器构建候选推理模式（共享检测器，只替换 DINOv2 模型/预处理）"""
+    candidate = copy.copy(reference)
+    candidate.decode_max_size = args.decode_max_size
+    if args.adaptive_crop:
+        # 候选单独维护检测缓存和裁剪统计，避免与基准的 YOLO 裁剪结果互相复用
+        candidate.adaptive_crop = True
+        candidate._detection_cache = BoundedLRUCache(max_entries=max(1, args.samples) * 2, name='eval_detection_cache')
+        candidate._crop_stats = {'detector_run': 0, 'detector_skipped': 0, 'cache_hit': 0}
+        candidate._crop_stats_lock = threading.Lock()
+    if args.fast_preprocess:
+        candidate.fast_preprocess = True
+    if args.quantization == 'int8_dynamic':
+        candidate.model = quantize_model_int8(copy.deepcopy(reference.model))
+        candidate.quantization = 'int8_dynamic'
+    if args.precision != 'fp32':
+        candidate.precision = args.precision
+        candidate._apply_precision()
+        if candidate.precision != args.precision:
+            print(f"⚠️ 当前环境无法启用 {args.precision}，候选回退为 fp32")
+    return candidate
+
+
+def load_for(extractor, path):
+    """按提取器的解码模式解码图片（不带内容哈希，不走检测缓存，基准与候选各自检测）"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return LoadedImage(decode_image_bytes(data, extractor.decode_max_size), source_name=path)
+
+
+def top1_excluding_self(engine, vector, self_id, top_k):
+    for hit in engine.search(vector, top_k=top_k):
+        if hit['db_id'] != self_id:
+            return hit
+    return None
+
+
+def product_id_of(image_id, cache):
+    if image_id not in cache:
+        info = db.get_image_info_by_id(image_id)
+        cache[image_id] = info['product_id'] if info else None
+    return cache[image_id]
+
+
+def timed_embed(extractor, img):
+    start = time.perf_counter()
+    vec = extractor._embed_image(img)
+    return vec, (time.perf_counter() - start) * 1000
+
+
+def evaluate(args):
+    samples = sample_held_out_images(args.samples, args.seed)
+    if not samples:
+        print("❌ 没有可用于评估的图片记录")
+        return 1
+
+    print(f"📦 抽取 {len(samples)} 张留出样本")
+    # 评估快速预处理时，基准使用通用 AutoImageProcessor
+    reference = DINOv2FeatureExtractor(
+        quantization='none',
+        fast_preprocess=False if args.fast_preprocess else None,
+        precision='fp32'
+    )
+    # 基准始终使用完整解码 + LANCZOS 缩放、YOLO 裁剪（与现有索引的生成方式一致）
+    reference.adaptive_crop = False
+    reference.decode_max_size = 0
+    candidate = build_candidate(reference, args)
+    engine = get_vector_engine()
+
+    image_product_cache = {}
+    image_agree = 0
+    product_agree = 0
+    compared = 0
+    cosine_drifts = []
+    score_drifts = []
+    ref_times = []
+    cand_times = []
+
+    for i, row in enumerate(samples, start=1):
+        try:
+            # 同一张裁剪图分别送入两个模型，排除检测差异的干扰；评估自适应裁剪/快速解码时候选使用自己的解码和裁剪结果
+            img = reference._crop_main_object(load_for(reference, row['image_path']))
+            if args.adaptive_crop or args.decode_max_size:
+                cand_img = candidate._crop_main_object(load_for(candidate, row['image_path']))
+            else:
+                cand_img = img
+            ref_vec, ref_ms = timed_embed(reference, img)
+            cand_vec, cand_ms = timed_embed(candidate, cand_img)
+        except Exception as e:
+            print(f"⚠️ 跳过 {row['image_path']}: {e}")
+            continue
+
+        ref_times.append(ref_ms)
+        cand_times.append(cand_ms)
+        cosine_drifts.append(1.0 - float(np.dot(ref_vec, cand_vec)))
+
+        ref_hit = top1_excluding_self(engine, ref_vec, row['id'], args.top_k)
+        cand_hit = top1_excluding_self(engine, cand_vec, row['id'], args.top_k)
+        if ref_hit is None or cand_hit is None:
+            continue
+
+        compared += 1
+        score_drifts.append(abs(ref_hit['score'] - cand_hit['score']))
+        if ref_hit['db_id'] == cand_hit['db_id']:
+            image_agree += 1
+        if product_id_of(ref_hit['db_id'], image_product_cache) == product_id_of(cand_hit['db_id'], image_product_cache):
+            product_agree += 1
+
+        if i % 50 == 0:
+            print(f"进度: {i}/{len(samples)}")
+
+    if compared == 0:
+        print("❌ 索引中没有可比较的结果，请先建立索引")
+        return 1
+
+    report = {
+        'mode': {
+            'quantization': args.quantization,
+            'fast_preprocess': args.fast_preprocess,
+            'precision': candidate.precision,
+            'adaptive_crop': args.adaptive_crop,
+            'decode_max_size': args.decode_max_size
+        },
+        'samples': len(ref_times),
+        'compared': compared,
+        'top1_image_agreement': image_agree / compared,
+        'top1_product_agreement': product_agree / compared,
+        'cosine_drift_mean': float(np.mean(cosine_drifts)),
+        'cosine_drift_max': float(np.max(cosine_drifts)),
+        'score_drift_mean': float(np.mean(score_drifts)),
+        'score_drift_max': float(np.max(score_drifts)),
+        'latency_ms_fp32': float(np.median(ref_times)),
+        'latency_ms_candidate': float(np.median(cand_times)),
+        'model_size_mb_fp32': estimate_model_size_mb(reference.model),
+        'model_size_mb_candidate': estimate_model_size_mb(candidate.model),
+    }
+    if args.adaptive_crop:
+        report['detector_skipped_rate'] = candidate._crop_stats['detector_skipped'] / max(1, len(ref_times))
+
+    passed = (
+        report['top1_product_agreement'] >= args.min_agreement
+        and report['score_drift_mean'] <= args.max_score_drift
+    )
+    report['passed'] = passed
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 报告已写入 {args.output}")
+
+    if passed:
+        print("✅ 精度达标，可以启用该推理模式")
+        return 0
+    print(f"❌ 精度未达标 (要求 top-1 一致率 >= {args.min_agreement}, 平均分数漂移 <= {args.max_score_drift})")
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比 float32 与候选推理模式的检索质量')
+    parser.add_argument('--quantization', choices=['none', 'int8_dynamic'], default='int8_dynamic')
+    parser.add_argument('--precision', choices=list(PRECISION_MODES), default='fp32', help='候选推理精度')
+    parser.add_argument('--fast-preprocess', action='store_true', help='候选使用张量快速预处理，基准使用 AutoImageProcessor')
+    parser.add_argument('--adaptive-crop', action='store_true', help='候选对纯色背景商品图跳过 YOLO 直接中心裁剪，基准始终使用 YOLO 裁剪')
+    parser.add_argument('--decode-max-size', type=int, default=0,
+                        help='候选使用 JPEG draft 解码到该尺寸 + reducing_gap 缩放，基准完整解码 + LANCZOS (0 表示不评估)')
+    parser.add_argument('--samples', type=int, default=200, help='留出样本数量')
+    parser.add_argument('--top-k', type=int, default=5, help='检索深度（需大于1以排除自身）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--min-agreement', type=float, default=0.98, help='商品级 top-1 一致率下限')
+    parser.add_argument('--max-score-drift', type=float, default=0.02, help='最佳匹配平均分数漂移上限')
+    parser.add_argument('--output', help='将报告写入 JSON 文件')
+    args = parser.parse_args()
+    sys.exit(evaluate(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+FAISS 降维投影训练脚本
+
+在商品库已保存的 384 维特征上训练 PCA 投影 (可选白化)，并输出召回率报告：
+- recall@k：降维后的检索结果与原始维度精确检索 top-k 的重合率 (Flat 与 HNSW 两种索引)
+- top-1 一致率、最佳匹配相似度漂移（白化会改变分数分布，阈值需要重新校准）
+- 索引内存估算
+
+使用方法:
+cd backend
+python3 scripts/train_projection.py --dim 128                 # 只评估，不保存
+python3 scripts/train_projection.py --dim 128 --save          # 保存到 FAISS_PROJECTION_FILE
+然后在 .env 中设置 FAISS_PROJECTION_DIM=128 并重启，索引会自动从数据库特征重建。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+# 确保在正确的目录下运行
+if not os.path.exists('database.py'):
+    print("❌ 请在 backend 目录下运行此脚本")
+    print("正确用法:")
+    print("  cd backend")
+    print("  python3 scripts/train_projection.py --dim 128")
+    sys.exit(1)
+
+sys.path.insert(0, os.getcwd())
+
+import numpy as np
+import faiss
+
+from config import config
+from database import db
+from vector_projection import PCAProjection
+
+
+def load_features():
+    """读取数据库中全部原始维度特征"""
+    ids, vectors = [], []
+    with db.get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, features FROM product_images WHERE features IS NOT NULL")
+        for row in cursor.fetchall():
+            try:
+                vec = np.asarray(json.loads(row['features']), dtype=np.float32)
+            except (ValueError, TypeError):
+                continue
+            if vec.shape[0] != config.VECTOR_DIMENSION:
+                continue
+            ids.append(row['id'])
+            vectors.append(vec)
+    if not vectors:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, config.VECTOR_DIMENSION), dtype=np.float32)
+    return np.asarray(ids, dtype=np.int64), np.vstack(vectors)
+
+
+def build_hnsw(vectors):
+    index = faiss.IndexHNSWFlat(vectors.shape[1], config.FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = config.FAISS_EF_CONSTRUCTION
+    index.add(vectors)
+    index.hnsw.efSearch = config.FAISS_EF_SEARCH
+    return index
+
+
+def recall_at_k(truth, found, k):
+    hits = sum(len(set(t[:k]) & set(f[:k])) for t, f in zip(truth, found))
+    return hits / (len(truth) * k)
+
+
+def estimate_memory_mb(count, dim):
+    return count * (dim * 4 + config.FAISS_HNSW_M * 4) / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='训练 FAISS 降维投影并评估召回率')
+    parser.add_argument('--dim', type=int, default=128, help='投影后的维度')
+    parser.add_argument('--whiten', action='store_true', help='PCA 白化（会改变相似度分布）')
+    parser.add_argument('--queries', type=int, default=500, help='留出查询数量')
+    parser.add_argument('--train-samples', type=int, default=100000, help='训练样本上限')
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', action='store_true', help='保存投影到 FAISS_PROJECTION_FILE')
+    parser.add_argument('--output', help='将报告写入 JSON 文件')
+    args = parser.parse_args()
+
+    ids, vectors = load_features()
+    if len(vectors) < max(args.dim, args.queries) + args.top_k:
+        print(f"❌ 特征数量不足 ({len(vectors)})，无法训练 {args.dim} 维投影")
+        return 1
+    print(f"📦 读取 {len(vectors)} 条特征")
+
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(vectors))
+    query_rows = order[:args.queries]
+    train_rows = order[args.queries:][:args.train_samples]
+
+    start = time.perf_counter()
+    projection = PCAProjection.fit(vectors[train_rows], args.dim, whiten=args.whiten)
+    train_s = time.perf_counter() - start
+    print(f"✅ 投影训练完成: {projection.describe()}，耗时 {train_s:.1f}s")
+
+    # 基准：原始维度精确检索（库中包含查询自身，检索 k+1 后去掉自身）
+    queries = vectors[query_rows]
+    full_index = faiss.IndexFlatIP(vectors.shape[1])
+    full_index.add(vectors)
+    full_scores, truth = full_index.search(queries, args.top_k + 1)
+
+    projected = projection.apply(vectors)
+    projected_queries = projected[query_rows]
+    flat_index = faiss.IndexFlatIP(projected.shape[1])
+    flat_index.add(projected)
+    _, flat_found = flat_index.search(projected_queries, args.top_k + 1)
+
+    hnsw_index = build_hnsw(projected)
+    start = time.perf_counter()
+    hnsw_scores, hnsw_found = hnsw_index.search(projected_queries, args.top_k + 1)
+    hnsw_ms = (time.perf_counter() - start) * 1000 / len(projected_queries)
+
+    full_hnsw = build_hnsw(vectors)
+    start = time.perf_counter()
+    full_hnsw.search(queries, args.top_k + 1)
+    full_hnsw_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    def strip_self(found):
+        return [[int(x) for x in row if x != q and x != -1][:args.top_k] for row, q in zip(found, query_rows)]
+
+    truth_ids = strip_self(truth)
+    flat_ids = strip_self(flat_found)
+    hnsw_ids = strip_self(hnsw_found)
+
+    # 最佳匹配 (排除自身) 的相似度漂移
+    score_drifts = []
+    for i, q in enumerate(query_rows):
+        full_best = next((s for x, s in zip(truth[i], full_scores[i]) if x != q), None)
+        proj_best = next((s for x, s in zip(hnsw_found[i], hnsw_scores[i]) if x != q and x != -1), None)
+        if full_best is not None and proj_best is not None:
+            score_drifts.append(abs(float(full_best) - float(proj_best)))
+
+    report = {
+        'projection': projection.describe(),
+        'vectors': len(vectors),
+        'queries': len(query_rows),
+        f'recall@{args.top_k}_flat': round(recall_at_k(truth_ids, flat_ids, args.top_k), 4),
+        f'recall@{args.top_k}_hnsw': round(recall_at_k(truth_ids, hnsw_ids, args.top_k), 4),
+        'top1_agreement_hnsw': round(float(np.mean([t[:1] == h[:1] for t, h in zip(truth_ids, hnsw_ids)])), 4),
+        'top1_score_drift_mean': round(float(np.mean(score_drifts)), 4) if score_drifts else None,
+        'top1_score_drift_max': round(float(np.max(score_drifts)), 4) if score_drifts else None,
+        'search_ms_full_hnsw': round(full_hnsw_ms, 3),
+        'search_ms_projected_hnsw': round(hnsw_ms, 3),
+        'memory_mb_full': round(estimate_memory_mb(len(vectors), vectors.shape[1]), 1),
+        'memory_mb_projected': round(estimate_memory_mb(len(vectors), args.dim), 1),
+        'train_s': round(train_s, 2)
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 报告已写入 {args.output}")
+
+    if args.save:
+        projection.save(config.FAISS_PROJECTION_FILE)
+        print(f"💾 投影已保存到 {config.FAISS_PROJECTION_FILE}")
+        print(f"   在 .env 中设置 FAISS_PROJECTION_DIM={args.dim} 并重启服务即可生效")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
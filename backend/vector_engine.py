@@ -7,8 +7,10 @@ import json
 from typing import List, Dict, Tuple
 try:
     from .config import config
+    from .vector_projection import PCAProjection
 except ImportError:
     from config import config
+    from vector_projection import PCAProjection
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +25,12 @@ class VectorEngine:
         self.index_file = index_file or config.FAISS_INDEX_FILE
         self.id_map_file = id_map_file or config.FAISS_ID_MAP_FILE
 
+        self.meta_file = f"{self.index_file}.meta.json"
+
+        # dimension 为模型输出维度；启用降维投影时索引中存的是投影后的向量
         self.dimension = config.VECTOR_DIMENSION
+        self.projection = self._load_projection()
+        self.index_dimension = self.projection.output_dim if self.projection else self.dimension
         self.index = None
 
         # FAISS只能存整数ID，我们需要一个映射：FAISS内部ID -> 数据库(product_images表的ID)
@@ -32,6 +39,45 @@ class VectorEngine:
 
         self._load_or_create_index()
 
+    def _load_projection(self):
+        """按 FAISS_PROJECTION_DIM 加载训练好的降维投影，未配置或不匹配时使用原始维度"""
+        target_dim = int(getattr(config, 'FAISS_PROJECTION_DIM', 0) or 0)
+        if target_dim <= 0:
+            return None
+        projection = PCAProjection.load(config.FAISS_PROJECTION_FILE)
+        if projection is None:
+            logger.warning(f"未找到降维投影文件 {config.FAISS_PROJECTION_FILE}，使用原始 {self.dimension} 维，"
+                           f"请先运行 scripts/train_projection.py")
+            return None
+        if projection.input_dim != self.dimension or projection.output_dim != target_dim:
+            logger.warning(f"降维投影 {projection.input_dim}->{projection.output_dim} 与配置 "
+                           f"{self.dimension}->{target_dim} 不符，使用原始维度")
+            return None
+        logger.info(f"📐 启用降维投影: {projection.describe()}")
+        return projection
+
+    def _index_meta(self) -> Dict:
+        return {
+            'dimension': self.index_dimension,
+            'projection': self.projection.version if self.projection else None
+        }
+
+    def _read_index_meta(self) -> Dict:
+        """读取索引元数据；旧索引没有元数据文件，视为未投影的原始维度"""
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'dimension': getattr(self.index, 'd', None), 'projection': None}
+
+    def _prepare_vectors(self, vectors) -> np.ndarray:
+        """转换为 (n, 索引维度) float32；原始维度的向量在启用投影时先投影"""
+        vectors = np.asarray(vectors, dtype='float32')
+        vectors = vectors.reshape(-1, vectors.shape[-1])
+        if self.projection is not None and vectors.shape[1] == self.dimension:
+            vectors = self.projection.apply(vectors)
+        return np.ascontiguousarray(vectors)
+
     def _load_or_create_index(self):
         """加载或创建FAISS HNSW索引"""
         if os.path.exists(self.index_file) and os.path.exists(self.id_map_file):
@@ -40,11 +86,15 @@ class VectorEngine:
                 self.index = faiss.read_index(self.index_file)
                 with open(self.id_map_file, 'rb') as f:
                     self.id_map = pickle.load(f)
-                if getattr(self.index, 'd', None) != self.dimension:
-                    logger.error(
-                        f"索引维度不匹配: index.d={getattr(self.index, 'd', None)} != config={self.dimension}，重新创建索引"
+                stored_meta = self._read_index_meta()
+                if getattr(self.index, 'd', None) != self.index_dimension or \
+                        stored_meta.get('projection') != self._index_meta()['projection']:
+                    # 维度或投影版本变化：索引里的向量不再可用，用数据库中保存的原始特征重建（无需重新跑模型）
+                    logger.warning(
+                        f"索引版本不匹配: index.d={getattr(self.index, 'd', None)}, projection={stored_meta.get('projection')} "
+                        f"-> 期望 {self._index_meta()}，从数据库特征重建索引"
                     )
-                    self._create_new_index()
+                    self._rebuild_from_database()
                     return
                 if hasattr(self.index, 'efSearch'):
                     self.index.efSearch = config.FAISS_EF_SEARCH
@@ -64,7 +114,7 @@ class VectorEngine:
         # HNSW64: 图结构，查询极快，准确率高
         # InnerProduct (IP) 在归一化向量上等同于余弦相似度
         self.index = faiss.IndexHNSWFlat(
-            self.dimension,
+            self.index_dimension,
             config.FAISS_HNSW_M,
             faiss.METRIC_INNER_PRODUCT
         )
@@ -116,6 +166,8 @@ class VectorEngine:
             faiss.write_index(self.index, self.index_file)
             with open(self.id_map_file, 'wb') as f:
                 pickle.dump(self.id_map, f)
+            with open(self.meta_file, 'w', encoding='utf-8') as f:
+                json.dump(self._index_meta(), f)
             logger.debug("FAISS索引已保存到磁盘")
         except Exception as e:
             logger.error(f"保存索引失败: {e}")
@@ -123,13 +175,8 @@ class VectorEngine:
     def add_vector(self, db_id: int, vector: np.ndarray) -> bool:
         """添加向量到FAISS索引"""
         try:
-            # 确保向量是正确的形状和类型
-            if isinstance(vector, list):
-                vector = np.array(vector, dtype='float32')
-            elif vector.dtype != np.float32:
-                vector = vector.astype('float32')
-
-            vector = vector.reshape(1, -1)  # 确保是[1, dim]形状
+            # 确保向量是正确的形状和类型（[1, dim]，启用投影时先降维）
+            vector = self._prepare_vectors(vector)
 
             # 添加到FAISS
             self.index.add(vector)
@@ -158,13 +205,8 @@ class VectorEngine:
             return []
 
         try:
-            # 确保查询向量格式正确
-            if isinstance(query_vector, list):
-                query_vector = np.array(query_vector, dtype='float32')
-            elif query_vector.dtype != np.float32:
-                query_vector = query_vector.astype('float32')
-
-            query_vector = query_vector.reshape(1, -1)
+            # 确保查询向量格式正确，与入库时使用同一个投影
+            query_vector = self._prepare_vectors(query_vector)
 
             if debug_enabled:
                 logger.debug(f"开始FAISS搜索，索引大小: {self.index.ntotal}, top_k: {top_k}")
@@ -265,35 +307,38 @@ class VectorEngine:
             logger.error(f"批量删除向量失败: {e}")
             return 0
 
+    def _load_vectors_from_database(self, alive_db_ids=None) -> List[Tuple[int, np.ndarray]]:
+        """读取数据库中保存的原始维度特征 (alive_db_ids 为空时读取全部)"""
+        try:
+            from database import db
+        except ImportError:
+            from .database import db
+
+        valid_vectors = []
+        with db.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, features FROM product_images WHERE id IS NOT NULL AND features IS NOT NULL")
+            for row in cursor.fetchall():
+                img_id = row['id']
+                if alive_db_ids is not None and img_id not in alive_db_ids:
+                    continue
+
+                features_str = row['features']
+                try:
+                    vec = np.array(json.loads(features_str), dtype='float32')
+                    if vec.shape[0] != self.dimension:
+                        continue
+                    valid_vectors.append((img_id, vec))
+                except Exception:
+                    continue
+        return valid_vectors
+
     def _rebuild_index_after_removal(self):
         """删除向量后重建索引（优化版：直接使用数据库中已存的 features，不重新跑模型）"""
         try:
-            try:
-                from database import db
-            except ImportError:
-                from .database import db
-
-            valid_vectors = []
-
             # 只保留那些仍然“未被标记删除”的 db_id
             alive_db_ids = {mapped_id for mapped_id in self.id_map if mapped_id is not None}
-
-            with db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, features FROM product_images WHERE id IS NOT NULL AND features IS NOT NULL")
-                for row in cursor.fetchall():
-                    img_id = row['id']
-                    if img_id not in alive_db_ids:
-                        continue
-
-                    features_str = row['features']
-                    try:
-                        vec = np.array(json.loads(features_str), dtype='float32')
-                        if vec.shape[0] != self.dimension:
-                            continue
-                        valid_vectors.append((img_id, vec))
-                    except Exception:
-                        continue
+            valid_vectors = self._load_vectors_from_database(alive_db_ids)
 
             # 重建索引
             self._create_new_index()
@@ -306,6 +351,20 @@ class VectorEngine:
         except Exception as e:
             logger.error(f"重建索引失败: {e}")
 
+    def _rebuild_from_database(self):
+        """索引维度/投影变化后，用数据库中的全部原始特征重建"""
+        try:
+            valid_vectors = self._load_vectors_from_database()
+        except Exception as e:
+            logger.error(f"读取数据库特征失败，创建空索引: {e}")
+            valid_vectors = []
+
+        self._create_new_index()
+        for img_id, vec in valid_vectors:
+            self.add_vector(img_id, vec)
+        self.save()
+        logger.info(f"索引已按当前投影重建，包含 {len(valid_vectors)} 个向量")
+
     def rebuild_index(self, vectors_data: List[Tuple[int, np.ndarray]]) -> bool:
         """
         重建整个索引 (用于清理已删除的向量或批量更新)
@@ -357,7 +416,9 @@ class VectorEngine:
 
         return {
             'total_vectors': self.index.ntotal,
-            'dimension': self.dimension,
+            'dimension': self.index_dimension,
+            'input_dimension': self.dimension,
+            'projection': self.projection.describe() if self.projection else None,
             'index_type': 'HNSW',
             'metric_type': 'InnerProduct (Cosine)',
             'ef_construction': ef_construction,
@@ -403,7 +464,7 @@ class VectorEngine:
     def _estimate_memory_usage(self) -> float:
         """估算内存使用量 (MB)"""
         # HNSW索引内存估算：向量数据 + 图结构
-        vector_memory = self.index.ntotal * self.dimension * 4  # float32 = 4 bytes
+        vector_memory = self.index.ntotal * self.index_dimension * 4  # float32 = 4 bytes
         graph_memory = self.index.ntotal * config.FAISS_HNSW_M * 4  # 邻居指针
         total_bytes = vector_memory + graph_memory
         return total_bytes / (1024 * 1024)
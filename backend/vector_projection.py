@@ -0,0 +1,103 @@
+import os
+import hashlib
+import logging
+from typing import Dict, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PCAProjection:
+    """
+    在商品库自身的特征上训练的 PCA 降维 (可选白化)
+    入库和查询都先投影再 L2 归一化，索引内积依然等价于余弦相似度。
+    投影矩阵与索引一起版本化：投影变化后索引需要用数据库中的原始特征重建。
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, whiten: bool = False,
+                 explained_variance: Optional[np.ndarray] = None):
+        self.mean = np.asarray(mean, dtype=np.float32).reshape(-1)
+        # components: (输入维度, 输出维度)，白化时已按 1/sqrt(特征值) 缩放
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.whiten = bool(whiten)
+        self.explained_variance = None if explained_variance is None else np.asarray(explained_variance, dtype=np.float32)
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def version(self) -> str:
+        """投影参数的指纹，写入索引元数据用于一致性校验"""
+        digest = hashlib.md5()
+        digest.update(self.mean.tobytes())
+        digest.update(self.components.tobytes())
+        return f"pca{self.output_dim}{'w' if self.whiten else ''}-{digest.hexdigest()[:12]}"
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, output_dim: int, whiten: bool = False) -> 'PCAProjection':
+        """用 SVD 在样本特征上训练投影"""
+        data = np.asarray(vectors, dtype=np.float64)
+        if data.ndim != 2 or data.shape[0] < 2:
+            raise ValueError("训练样本不足")
+        if not 0 < output_dim <= data.shape[1]:
+            raise ValueError(f"输出维度必须在 1~{data.shape[1]} 之间")
+
+        mean = data.mean(axis=0)
+        centered = data - mean
+        _, singular_values, vt = np.linalg.svd(centered, full_matrices=False)
+        variance = (singular_values ** 2) / (data.shape[0] - 1)
+
+        components = vt[:output_dim].T
+        if whiten:
+            components = components / np.sqrt(np.maximum(variance[:output_dim], 1e-12))
+        explained = variance[:output_dim] / variance.sum() if variance.sum() > 0 else variance[:output_dim]
+        return cls(mean, components, whiten, explained)
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        """投影并 L2 归一化，输入 (dim,) 或 (n, dim)，返回 (n, output_dim) float32"""
+        data = np.asarray(vectors, dtype=np.float32).reshape(-1, self.input_dim)
+        projected = (data - self.mean) @ self.components
+        norms = np.linalg.norm(projected, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (projected / norms).astype(np.float32)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            mean=self.mean,
+            components=self.components,
+            whiten=np.array([self.whiten]),
+            explained_variance=self.explained_variance if self.explained_variance is not None else np.zeros(0, dtype=np.float32)
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['PCAProjection']:
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                explained = data['explained_variance'] if 'explained_variance' in data.files else None
+                return cls(data['mean'], data['components'], bool(data['whiten'][0]),
+                           explained if explained is not None and explained.size else None)
+        except Exception as e:
+            logger.error(f"加载降维投影失败 {path}: {e}")
+            return None
+
+    def describe(self) -> Dict:
+        info = {
+            'version': self.version,
+            'input_dim': self.input_dim,
+            'output_dim': self.output_dim,
+            'whiten': self.whiten
+        }
+        if self.explained_variance is not None:
+            info['explained_variance_ratio'] = round(float(self.explained_variance.sum()), 4)
+        return info